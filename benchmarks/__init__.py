@@ -0,0 +1,5 @@
+"""
+  Benchmarks of the formats of war3structs, on synthetic fixtures.
+
+  Run with python -m benchmarks.run from the root of the repository.
+"""
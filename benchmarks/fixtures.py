@@ -0,0 +1,675 @@
+import random
+
+from war3structs import (
+  CamerasFile,
+  CustomTriggersFile,
+  DoodadsFile,
+  ImportsFile,
+  MetadataFile,
+  MinimapIconsFile,
+  ObjectsFile,
+  ObjectsWithVariationsFile,
+  ObserverFile,
+  PathMapFile,
+  RegionsFile,
+  ShadowMapFile,
+  SoundsFile,
+  TileMapFile,
+  TriggersFile,
+  UnitDoodadsFile
+)
+from war3structs.observer import (
+  ObserverGame,
+  ObserverPlayer,
+  ObserverPlayerBuilding,
+  ObserverPlayerHero,
+  ObserverPlayerHeroAbility,
+  ObserverPlayerHeroItem,
+  ObserverPlayerResearch,
+  ObserverPlayerUnit,
+  ObserverPlayerUpgrade
+)
+from war3structs.patch.triggerdata import functions_parameter_counts
+
+"""
+  Synthetic fixtures
+
+  Generators of deterministic files for every format: the same scale and
+  seed always give the same bytes. Each generator returns the value to
+  build with its struct and the number of objects (tiles, doodads,
+  triggers...) in it, scale multiplies that number.
+
+  The values are plausible rather than realistic: ids, names and numbers
+  are random, but counts agree with their arrays so that every fixture
+  parses back.
+
+  Some formats are mostly padding, e.g. the observer file is a fixed
+  181 MB of which a game only fills a few. Their content size, the bytes
+  that hold data, is given separately so throughputs measure parsing
+  rather than skipping padding.
+"""
+
+_letters = 'abcdefghijklmnopqrstuvwxyz'
+
+_tilesets = ['ASHENVALE', 'BARRENS', 'FELWOOD', 'DUNGEON', 'LORDAERONSUMMER', 'NORTHREND', 'VILLAGE']
+
+def _id(rng, prefix=''):
+  return (prefix + ''.join(rng.choice(_letters) for _ in range(4 - len(prefix)))).encode('ascii')
+
+def _name(rng, length=12):
+  return ''.join(rng.choice(_letters) for _ in range(rng.randint(1, length)))
+
+def _float(rng, low=-4096.0, high=4096.0):
+  # Floats that survive the round trip through 32 bits
+  return float(rng.randint(int(low), int(high)))
+
+def _color(rng):
+  return dict(r=rng.randrange(256), g=rng.randrange(256), b=rng.randrange(256), a=255)
+
+def tilemap(rng, scale):
+  width = 64
+  height = 64 * scale
+  return dict(
+    version=11,
+    tileset_id=rng.choice(_tilesets),
+    custom_tilesets=0,
+    ground_tileset_ids_count=4,
+    ground_tileset_ids=[_id(rng) for _ in range(4)],
+    cliff_tileset_ids_count=2,
+    cliff_tileset_ids=[_id(rng) for _ in range(2)],
+    tile_map_width=width,
+    tile_map_height=height,
+    tile_map_center_offset_x=-2048.0,
+    tile_map_center_offset_y=-2048.0,
+    tile_map=[dict(
+      ground_height=rng.randint(-512, 512),
+      water_level=rng.randint(-512, 512),
+      # None of the flags fit in the nibble, they can't be set
+      flags=0,
+      ground_texture_type=rng.randrange(16),
+      texture_details=rng.randrange(256),
+      cliff_texture_type=rng.randrange(16),
+      layer_height=rng.randrange(16)
+    ) for _ in range(width * height)]
+  ), width * height
+
+def pathmap(rng, scale):
+  width = 256
+  height = 256 * scale
+  return dict(
+    version=0,
+    path_map_width=width,
+    path_map_height=height,
+    path_map=[rng.choice((0x02, 0x0A, 0x40, 0x4A, 0x04)) for _ in range(width * height)]
+  ), width * height
+
+def shadowmap(rng, scale):
+  count = 16 * 64 * 64 * scale
+  return dict(shadow_map=[rng.random() < 0.1 for _ in range(count)]), count
+
+def _item_sets(rng):
+  count = rng.choice((0, 0, 0, 1, 2))
+  return dict(
+    dropped_item_table_index=-1,
+    dropped_item_sets_count=count,
+    dropped_item_sets=[dict(
+      items_count=2,
+      items=[dict(item_id=_id(rng), chance_percent=50) for _ in range(2)]
+    ) for _ in range(count)]
+  )
+
+def doodads(rng, scale):
+  count = 2000 * scale
+  terrain = 20 * scale
+  return dict(
+    version=8,
+    subversion=11,
+    doodads_count=count,
+    doodads=[dict(
+      doodad_id=_id(rng),
+      variation=rng.randrange(10),
+      pos_x=_float(rng),
+      pos_y=_float(rng),
+      pos_z=_float(rng, 0, 512),
+      rotation=0.0,
+      scale_x=1.0,
+      scale_y=1.0,
+      scale_z=1.0,
+      visibility='VISIBLE_SOLID',
+      life_percent=100,
+      index=index,
+      **_item_sets(rng)
+    ) for index in range(count)],
+    terrain_doodads_version=0,
+    terrain_doodads_count=terrain,
+    terrain_doodads=[dict(
+      doodad_id=_id(rng),
+      pos_z=0,
+      pos_x=rng.randrange(256),
+      pos_y=rng.randrange(256)
+    ) for _ in range(terrain)]
+  ), count + terrain
+
+def _random_unit(rng, unit_id):
+  if not unit_id in [b'uDNR', b'bDNR', b'iDNR']:
+    return [0, 1]
+
+  return dict(type='ANY', properties=dict(level=-1, item_class='ANY_CLASS'))
+
+def unitdoodads(rng, scale):
+  count = 1000 * scale
+  units = []
+  for index in range(count):
+    unit_id = b'iDNR' if rng.random() < 0.05 else _id(rng)
+    items = rng.randrange(3)
+    abilities = rng.randrange(3)
+    units.append(dict(
+      unit_id=unit_id,
+      variation=0,
+      pos_x=_float(rng),
+      pos_y=_float(rng),
+      pos_z=0.0,
+      rotation=_float(rng, 0, 6),
+      scale_x=1.0,
+      scale_y=1.0,
+      scale_z=1.0,
+      visibility='VISIBLE_SOLID',
+      owner_player_id=rng.randrange(24),
+      unknown_field_1=0,
+      unknown_field_2=0,
+      hitpoints=-1,
+      manapoints=-1,
+      gold=12500,
+      target_acquisition_range=-1.0,
+      hero_level=1,
+      hero_strength=0,
+      hero_agility=0,
+      hero_intelligence=0,
+      inventory_items_count=items,
+      inventory_items=[dict(slot_index=slot, item_id=_id(rng)) for slot in range(items)],
+      ability_modifications_count=abilities,
+      ability_modifications=[dict(ability_id=_id(rng, 'A'), is_active=False, level=1) for _ in range(abilities)],
+      random_unit=_random_unit(rng, unit_id),
+      waygate_custom_team_color=-1,
+      waygate_destination_region_index=-1,
+      index=index,
+      **_item_sets(rng)
+    ))
+
+  return dict(version=8, subversion=11, units_count=count, units=units), count
+
+def metadata(rng, scale):
+  players = 24
+  forces = 4
+  unit_tables = 10 * scale
+  item_tables = 10 * scale
+  return dict(
+    version=25,
+    number_of_saves=rng.randrange(1000),
+    editor_version=6072,
+    name='TRIGSTR_001',
+    author=_name(rng, 24),
+    description=_name(rng, 200),
+    recommended_players='Any',
+    camera_bounds=[_float(rng) for _ in range(8)],
+    camera_bounds_padding=[6, 6, 4, 8],
+    playable_area_width=128,
+    playable_area_height=128,
+    flags=0x8000,
+    ground_type_tileset_id=rng.choice(_tilesets),
+    loading_screen_preset_index=-1,
+    loading_screen_custom_path='',
+    loading_screen_text=_name(rng, 80),
+    loading_screen_title=_name(rng),
+    loading_screen_subtitle=_name(rng),
+    game_data_set_index=0,
+    prologue_screen_path='',
+    prologue_screen_text='',
+    prologue_screen_title='',
+    prologue_screen_subtitle='',
+    terrain_fog_style=0,
+    terrain_fog_start_z=3000.0,
+    terrain_fog_end_z=5000.0,
+    terrain_fog_density=0.5,
+    terrain_fog_color=_color(rng),
+    global_weather_id=b'\0\0\0\0',
+    custom_sound_environment='',
+    custom_light_environment_tileset_id=rng.choice(_tilesets),
+    water_color=_color(rng),
+    players_count=players,
+    players=[dict(
+      id=index,
+      type='USER',
+      race=rng.choice(('HUMAN', 'ORC', 'UNDEAD', 'NIGHTELF')),
+      fixed_start_position=0,
+      name='Player %d' % (index + 1),
+      start_position_x=_float(rng),
+      start_position_y=_float(rng),
+      ally_low_priority_flags=0,
+      ally_high_priority_flags=0
+    ) for index in range(players)],
+    forces_count=forces,
+    forces=[dict(
+      flags=0x03,
+      player_mask_flags=0x3F << (6 * index),
+      name='Force %d' % (index + 1)
+    ) for index in range(forces)],
+    upgrade_availability_changes_count=0,
+    upgrade_availability_changes=[],
+    tech_availability_changes_count=0,
+    tech_availability_changes=[],
+    random_unit_tables_count=unit_tables,
+    random_unit_tables=[dict(
+      index=index,
+      name=_name(rng),
+      positions_count=2,
+      positions=['UNITS', 'BUILDINGS'],
+      units_count=5,
+      units=[dict(chance_percent=20, unit_ids=list(_id(rng) + _id(rng))) for _ in range(5)]
+    ) for index in range(unit_tables)],
+    random_item_tables_count=item_tables,
+    random_item_tables=[dict(
+      index=index,
+      name=_name(rng),
+      sets_count=3,
+      sets=[dict(
+        items_count=4,
+        items=[dict(chance_percent=25, item_id=_id(rng)) for _ in range(4)]
+      ) for _ in range(3)]
+    ) for index in range(item_tables)]
+  ), players + forces + unit_tables + item_tables
+
+def _objects(rng, scale, variations):
+  def modification():
+    value_type = rng.choice(('INT', 'REAL', 'UNREAL', 'STRING'))
+    value = _name(rng, 32) if value_type == 'STRING' else (_float(rng) if value_type != 'INT' else rng.randint(-1000, 1000))
+    fields = dict(modification_id=_id(rng), value_type=value_type, value=value, parent_object_id=b'\0\0\0\0')
+    if variations:
+      fields.update(variation=rng.randrange(4), ability_data_column='A')
+    return fields
+
+  def table(count, custom):
+    objects = []
+    for _ in range(count):
+      modifications = rng.randrange(1, 20)
+      objects.append(dict(
+        original_object_id=_id(rng),
+        new_object_id=_id(rng, 'X') if custom else b'\0\0\0\0',
+        modifications_count=modifications,
+        modifications=[modification() for _ in range(modifications)]
+      ))
+    return dict(objects_count=count, objects=objects)
+
+  count = 200 * scale
+  return dict(
+    version=2,
+    original_objects_table=table(count // 2, False),
+    custom_objects_table=table(count - count // 2, True)
+  ), count
+
+def objects(rng, scale):
+  return _objects(rng, scale, False)
+
+def objects_with_variations(rng, scale):
+  return _objects(rng, scale, True)
+
+# Trigger functions by parameter count, sorted so they're picked deterministically
+_trigger_functions = {}
+for _function, _count in sorted(functions_parameter_counts.items()):
+  if _count <= 3:
+    _trigger_functions.setdefault(_count, []).append(_function)
+
+def _trigger_parameter(rng):
+  return dict(
+    type='CONSTANT',
+    value=_name(rng),
+    functions_count=0,
+    functions=[],
+    array_indices_count=0,
+    array_indices=[]
+  )
+
+def _trigger_block(rng, type_):
+  function = rng.choice(_trigger_functions[rng.randrange(4)])
+  return dict(
+    type=type_,
+    function_name=function,
+    is_function_enabled=True,
+    parameters=[_trigger_parameter(rng) for _ in range(functions_parameter_counts[function])],
+    child_blocks_count=0,
+    child_blocks=[]
+  )
+
+def triggers(rng, scale):
+  count = 100 * scale
+  categories = 10
+  variables = 50 * scale
+  return dict(
+    version=7,
+    trigger_categories_count=categories,
+    trigger_categories=[dict(index=index, name=_name(rng), is_comment=False) for index in range(categories)],
+    unknown_field_1=0,
+    trigger_variables_count=variables,
+    trigger_variables=[dict(
+      name=_name(rng),
+      type=rng.choice(('integer', 'real', 'unit', 'string')),
+      unknown_field_1=1,
+      is_array=False,
+      array_size=1,
+      is_initialized=False,
+      initial_value=''
+    ) for _ in range(variables)],
+    triggers_count=count,
+    triggers=[dict(
+      name=_name(rng),
+      description='',
+      is_comment=False,
+      is_enabled=True,
+      is_custom_text_trigger=False,
+      is_turned_off=False,
+      is_init=False,
+      category_index=rng.randrange(categories),
+      blocks_count=6,
+      blocks=[_trigger_block(rng, type_) for type_ in ('EVENT', 'CONDITION', 'ACTION', 'ACTION', 'ACTION', 'ACTION')]
+    ) for _ in range(count)]
+  ), count
+
+def sounds(rng, scale):
+  count = 200 * scale
+  return dict(
+    version=1,
+    sounds_count=count,
+    sounds=[dict(
+      variable='gg_snd_' + _name(rng),
+      file_path='Sound\\' + _name(rng) + '.wav',
+      eax_effect=rng.choice(('DEFAULT', 'COMBAT', 'SPELL')),
+      flags=rng.randrange(16),
+      fade_in_rate=10,
+      fade_out_rate=10,
+      volume=-1,
+      pitch=1.0,
+      unknown_field_1=0.0,
+      unknown_field_2=-1,
+      channel='GENERAL',
+      distance_min=0.0,
+      distance_max=10000.0,
+      distance_cutoff=3000.0,
+      unknown_field_3=0.0,
+      unknown_field_4=0.0,
+      unknown_field_5=-1,
+      unknown_field_6=0.0,
+      unknown_field_7=0.0,
+      unknown_field_8=0.0
+    ) for _ in range(count)]
+  ), count
+
+def regions(rng, scale):
+  count = 500 * scale
+  return dict(
+    version=5,
+    regions_count=count,
+    regions=[dict(
+      left=_float(rng),
+      right=_float(rng),
+      bottom=_float(rng),
+      top=_float(rng),
+      name=_name(rng),
+      index=index,
+      weather_effect_id=b'\0\0\0\0',
+      ambient_sound_variable='',
+      color=dict(b=rng.randrange(256), g=rng.randrange(256), r=rng.randrange(256))
+    ) for index in range(count)]
+  ), count
+
+def cameras(rng, scale):
+  count = 200 * scale
+  return dict(
+    version=0,
+    cameras_count=count,
+    cameras=[dict(
+      target_x=_float(rng),
+      target_y=_float(rng),
+      offset_z=0.0,
+      rotation=90.0,
+      angle_of_attack=304.0,
+      distance=1650.0,
+      roll=0.0,
+      field_of_view=70.0,
+      far_clipping=5000.0,
+      unknown_field_1=100.0,
+      name='Camera ' + _name(rng)
+    ) for _ in range(count)]
+  ), count
+
+def minimapicons(rng, scale):
+  count = 200 * scale
+  return dict(
+    version=0,
+    icons_count=count,
+    icons=[dict(
+      type=rng.choice(('GOLDMINE', 'SHOP', 'PLAYER')),
+      coord_x=rng.randint(16, 240),
+      coord_y=rng.randint(16, 240),
+      color=_color(rng)
+    ) for _ in range(count)]
+  ), count
+
+def imports(rng, scale):
+  count = 500 * scale
+  return dict(
+    version=1,
+    imports_count=count,
+    imports=[dict(is_custom_path=rng.random() < 0.5, path='war3mapImported\\' + _name(rng) + '.mdx')
+      for _ in range(count)]
+  ), count
+
+def _custom_trigger(code):
+  return dict(code_size=len(code.encode('utf-8')) + 1, code=code)
+
+def customtriggers(rng, scale):
+  count = 100 * scale
+  return dict(
+    version=1,
+    script_header_comment='',
+    script_header_trigger=_custom_trigger(jass(rng, 1)[0][:2000]),
+    triggers_count=count,
+    triggers=[_custom_trigger(jass(rng, 1)[0][:rng.randrange(2000)]) for _ in range(count)]
+  ), count
+
+def _observer_player(rng, index, scale):
+  heroes = min(3 * scale, 999)
+  units = min(50 * scale, 999)
+  buildings = min(20 * scale, 999)
+  return dict(
+    name='Player %d' % (index + 1),
+    race_preference='RANDOM',
+    race=rng.choice(('HUMAN', 'ORC', 'UNDEAD', 'NIGHTELF')),
+    id=index,
+    team_index=index % 2,
+    team_color=index,
+    type='PLAYER',
+    handicap=100,
+    game_result='IN_PROGRESS',
+    slot_state='PLAYING',
+    ai_difficulty='NORMAL',
+    apm=rng.randrange(300),
+    apm_realtime=rng.randrange(300),
+    gold=rng.randrange(10000),
+    gold_mined=rng.randrange(100000),
+    gold_taxed=0,
+    gold_tax=0,
+    lumber=rng.randrange(10000),
+    lumber_harvested=rng.randrange(100000),
+    lumber_taxed=0,
+    lumber_tax=0,
+    food_max=100,
+    food=rng.randrange(100),
+    heroes_count=heroes,
+    heroes=[dict(
+      id=_id(rng).decode('ascii'),
+      **{'class': _name(rng)},
+      art='', level=1, experience=0, experience_max=200,
+      hitpoints=700, hitpoints_max=700, mana=300, mana_max=300,
+      damage_dealt=0, damage_received=0, damage_self=0, index=hero, damage_healed=0,
+      deaths_count=0, kills_count=0, kills_self=0, kills_heroes=0, kills_buildings=0,
+      time_alive=0,
+      abilities_count=2,
+      abilities=[dict(
+        id=_id(rng).decode('ascii'), cooldown_time=0.0, cooldown=0.0, level=1, art='',
+        is_hero_ability=True, damage_dealt=0, damage_healed=0
+      ) for _ in range(2)],
+      inventory_count=1,
+      inventory=[dict(id=_id(rng).decode('ascii'), slot=0, charges=1, art='')]
+    ) for hero in range(heroes)],
+    buildings_on_map_count=buildings,
+    buildings_on_map=[dict(id=_id(rng).decode('ascii'), progress_percent=100, upgrade_progress_percent=0, art='')
+      for _ in range(buildings)],
+    upgrades_completed_count=0,
+    upgrades_completed=[],
+    units_on_map_count=units,
+    units_on_map=[dict(
+      id=_id(rng).decode('ascii'), owning_player_id=index, alive_count=1, total_count=1, art='',
+      is_worker=False, is_busy_worker=False, damage_dealt=0, damage_received=0, damage_healed=0
+    ) for _ in range(units)],
+    researches_in_progress_count=0,
+    researches_in_progress=[]
+  )
+
+def observer(rng, scale):
+  players = [_observer_player(rng, index, scale) for index in range(28)]
+  return dict(
+    version=0,
+    game=dict(refresh_rate=1000, is_in_game=True, game_time=rng.randrange(3600000), players_count=28,
+      game_name='Benchmark', map_name='Maps\\Benchmark.w3x'),
+    players=players
+  ), sum(player['heroes_count'] + player['units_on_map_count'] + player['buildings_on_map_count'] for player in players)
+
+_jass_types = ['integer', 'real', 'boolean', 'string', 'unit', 'player']
+
+def _jass_value(rng, type_):
+  if type_ == 'integer':
+    return str(rng.randint(-1000, 1000))
+  if type_ == 'real':
+    return '%d.%d' % (rng.randint(-1000, 1000), rng.randrange(100))
+  if type_ == 'boolean':
+    return rng.choice(('true', 'false'))
+  if type_ == 'string':
+    return '"%s"' % _name(rng)
+  return 'null'
+
+def jass(rng, scale):
+  """Generate a war3map.j style script, its objects are functions"""
+
+  globals = 50 * scale
+  functions = 100 * scale
+  lines = ['globals']
+
+  names = []
+  for index in range(globals):
+    type_ = rng.choice(_jass_types)
+    names.append((type_, 'udg_%s%d' % (_name(rng, 8), index)))
+    lines.append('  %s %s = %s' % (type_, names[-1][1], _jass_value(rng, type_)))
+  lines.append('endglobals')
+  lines.append('')
+
+  integers = [name for type_, name in names if type_ == 'integer'] or ['0']
+  previous = None
+  for index in range(functions):
+    name = 'Trig_%s%d' % (_name(rng, 8), index)
+    lines.append('function %s takes integer a, real b returns integer' % name)
+    lines.append('  local integer i = 0')
+    lines.append('  local string s = "%s"' % _name(rng))
+    lines.append('  loop')
+    lines.append('    exitwhen i > %d' % rng.randint(1, 100))
+    lines.append('    set i = i + %s * (a - %d)' % (rng.choice(integers), rng.randint(1, 9)))
+    lines.append('  endloop')
+    lines.append('  if a > %d and b < %s then' % (rng.randint(0, 100), _jass_value(rng, 'real')))
+    lines.append('    set s = s + I2S(i)')
+    if not previous is None:
+      lines.append('    call Trig_%s(a - 1, b)' % previous)
+    lines.append('  elseif a == 0 then')
+    lines.append('    return -1')
+    lines.append('  endif')
+    lines.append('  return i')
+    lines.append('endfunction')
+    lines.append('')
+    previous = name[len('Trig_'):]
+
+  lines.append('function main takes nothing returns nothing')
+  lines.append('  call %s(1, 0.0)' % name)
+  lines.append('endfunction')
+
+  return '\n'.join(lines) + '\n', functions
+
+_observer_arrays = [
+  ('heroes', ObserverPlayerHero),
+  ('buildings_on_map', ObserverPlayerBuilding),
+  ('upgrades_completed', ObserverPlayerUpgrade),
+  ('units_on_map', ObserverPlayerUnit),
+  ('researches_in_progress', ObserverPlayerResearch)
+]
+
+def observer_content_size(value):
+  """Get the bytes of an observer file that hold data
+
+  That is without the free slots of its fixed size arrays and the
+  paddings of the data it dismisses.
+  """
+
+  player_size = ObserverPlayer.sizeof() - sum(999 * struct.sizeof() for _, struct in _observer_arrays) - 135868 - 40
+  size = 4 + ObserverGame.sizeof()
+
+  for player in value['players']:
+    size += player_size
+    for name, struct in _observer_arrays[1:]:
+      size += player[name + '_count'] * struct.sizeof()
+
+    for hero in player['heroes']:
+      size += (ObserverPlayerHero.sizeof()
+        - (24 - hero['abilities_count']) * ObserverPlayerHeroAbility.sizeof()
+        - (6 - hero['inventory_count']) * ObserverPlayerHeroItem.sizeof())
+
+  return size
+
+# Content sizes of the formats that are mostly padding, by name
+content_sizes = {
+  'observer': observer_content_size
+}
+
+# Formats by name: struct and generator. JASS is text and has no struct.
+formats = {
+  'w3e': (TileMapFile, tilemap),
+  'wpm': (PathMapFile, pathmap),
+  'shd': (ShadowMapFile, shadowmap),
+  'doo': (DoodadsFile, doodads),
+  'units.doo': (UnitDoodadsFile, unitdoodads),
+  'w3i': (MetadataFile, metadata),
+  'w3u': (ObjectsFile, objects),
+  'w3a': (ObjectsWithVariationsFile, objects_with_variations),
+  'wtg': (TriggersFile, triggers),
+  'w3s': (SoundsFile, sounds),
+  'w3r': (RegionsFile, regions),
+  'w3c': (CamerasFile, cameras),
+  'mmp': (MinimapIconsFile, minimapicons),
+  'imp': (ImportsFile, imports),
+  'wct': (CustomTriggersFile, customtriggers),
+  'observer': (ObserverFile, observer),
+  'j': (None, jass)
+}
+
+def generate(format, scale=1, seed=0):
+  """Generate a fixture, returns its bytes, number of objects and content size"""
+
+  struct, generator = formats[format]
+
+  # Seeded per format, so a fixture doesn't depend on which others were made
+  rng = random.Random('%s:%d:%d' % (format, scale, seed))
+  value, count = generator(rng, scale)
+
+  if struct is None:
+    data = value.encode('utf-8')
+  else:
+    data = struct.build(value)
+
+  content_size = content_sizes.get(format)
+  return data, count, len(data) if content_size is None else content_size(value)
@@ -0,0 +1,190 @@
+import io
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+from war3structs.plaintext import JassParser
+
+from .fixtures import formats, generate
+
+"""
+  Benchmark runner
+
+  For every format, a fixture is generated and then parsed and built
+  back a number of times. The best time of the repeats is kept, as it's
+  the least disturbed by whatever else runs on the machine, and turned
+  into throughputs of the fixture's content size (see fixtures), not
+  of the padding some formats are mostly made of. Peak memory is measured with tracemalloc over one
+  more parse, separately since tracing slows everything down.
+
+  Results are saved as JSON and compared against a baseline saved the
+  same way, a format is reported as a regression when it's slower or
+  takes more memory than the tolerance allows.
+
+  Usage: python -m benchmarks.run [--scale N] [--save FILE] [--baseline FILE] [formats...]
+"""
+
+default_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def _best(function, repeat):
+  best = None
+  result = None
+  for _ in range(repeat):
+    gc.collect()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+
+  return best, result
+
+def _peak(function):
+  gc.collect()
+  tracemalloc.start()
+  try:
+    function()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+def _operations(format, data):
+  """Get the parse and build functions of a format"""
+
+  struct = formats[format][0]
+
+  if struct is None:
+    text = data.decode('utf-8')
+
+    def build(ast):
+      return JassParser.build(ast, io.StringIO())
+
+    return (lambda: JassParser.parse(text)), build
+
+  return (lambda: struct.parse(data)), struct.build
+
+def run_format(format, scale=1, repeat=3, seed=0, memory=True):
+  """Benchmark a format, returns a dict of results"""
+
+  data, count, content = generate(format, scale, seed)
+  parse, build = _operations(format, data)
+
+  parse_time, value = _best(parse, repeat)
+  build_time, _ = _best(lambda: build(value), repeat)
+
+  megabytes = content / (1024 * 1024)
+  result = {
+    'bytes': len(data),
+    'content_bytes': content,
+    'objects': count,
+    'parse_seconds': parse_time,
+    'parse_mb_per_second': megabytes / parse_time if parse_time else None,
+    'parse_objects_per_second': count / parse_time if parse_time else None,
+    'build_seconds': build_time,
+    'build_mb_per_second': megabytes / build_time if build_time else None,
+    'build_objects_per_second': count / build_time if build_time else None
+  }
+
+  if memory:
+    del value
+    result['parse_peak_bytes'] = _peak(parse)
+
+  return result
+
+def run(selected=None, scale=1, repeat=3, seed=0, memory=True, progress=None):
+  """Benchmark the selected formats (all by default)"""
+
+  results = {}
+  for format in selected or formats:
+    results[format] = run_format(format, scale, repeat, seed, memory)
+    if not progress is None:
+      progress(format, results[format])
+
+  return {
+    'scale': scale,
+    'seed': seed,
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    'results': results
+  }
+
+def compare(current, baseline, tolerance=0.1):
+  """Compare results against a baseline
+
+  Returns a list of (format, metric, baseline, current, ratio, regressed)
+  for every metric both have. Times and memory regress when they grow
+  by more than the tolerance.
+  """
+
+  comparisons = []
+  if current.get('scale') != baseline.get('scale'):
+    return comparisons
+
+  for format, result in current['results'].items():
+    previous = baseline['results'].get(format)
+    if previous is None or previous.get('bytes') != result.get('bytes'):
+      # A different fixture, the numbers aren't comparable
+      continue
+
+    for metric in ('parse_seconds', 'build_seconds', 'parse_peak_bytes'):
+      if not metric in result or not previous.get(metric):
+        continue
+
+      ratio = result[metric] / previous[metric]
+      comparisons.append((format, metric, previous[metric], result[metric], ratio, ratio > 1 + tolerance))
+
+  return comparisons
+
+def _print_result(format, result):
+  line = '%-10s %10d B %8d obj  parse %8.3fs %8.2f MB/s %10.0f obj/s  build %8.3fs %8.2f MB/s' % (
+    format, result['content_bytes'], result['objects'],
+    result['parse_seconds'], result['parse_mb_per_second'] or 0, result['parse_objects_per_second'] or 0,
+    result['build_seconds'], result['build_mb_per_second'] or 0)
+  if 'parse_peak_bytes' in result:
+    line += '  peak %8.1f MB' % (result['parse_peak_bytes'] / (1024 * 1024))
+  print(line)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Benchmark war3structs formats')
+  parser.add_argument('formats', nargs='*', help='formats to benchmark (default: all): %s' % ', '.join(formats))
+  parser.add_argument('-s', '--scale', type=int, default=1, help='fixture size multiplier')
+  parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per measurement, the best is kept')
+  parser.add_argument('--seed', type=int, default=0, help='fixture seed')
+  parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory")
+  parser.add_argument('--save', default=None, help='save the results to a JSON file')
+  parser.add_argument('--baseline', default=default_baseline, help='baseline to compare against')
+  parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown before a regression, 0.1 is 10%%')
+  args = parser.parse_args(argv)
+
+  for format in args.formats:
+    if not format in formats:
+      parser.error('unknown format %s' % format)
+
+  current = run(args.formats, args.scale, args.repeat, args.seed, not args.no_memory, _print_result)
+
+  if not args.save is None:
+    with open(args.save, 'w') as file:
+      json.dump(current, file, indent=2, sort_keys=True)
+
+  if args.baseline is None or not os.path.exists(args.baseline):
+    return 0
+
+  with open(args.baseline, 'r') as file:
+    baseline = json.load(file)
+
+  regressions = 0
+  for format, metric, previous, result, ratio, regressed in compare(current, baseline, args.tolerance):
+    if regressed:
+      regressions += 1
+    print('%-10s %-18s %12.4g -> %12.4g  %+6.1f%%%s' % (format, metric, previous, result, (ratio - 1) * 100,
+      '  REGRESSION' if regressed else ''))
+
+  return 1 if regressions > 0 else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -6,7 +6,7 @@ with open("README", "r") as fh:
 setuptools.setup(
   install_requires=[
     'construct>=2.9',
-    'lark-parser>=0.6'
+    'lark-parser>=0.12'
   ],
   name="war3structs",
   version="0.3.0",
@@ -16,7 +16,10 @@ setuptools.setup(
   long_description=long_description,
   long_description_content_type="text/plain",
   url="https://github.com/warlockbrawl/war3structs",
-  packages=setuptools.find_packages(),
+  packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
+  entry_points={
+    'console_scripts': ['war3structs=war3structs.cli:main']
+  },
   data_files=[('lib/site-packages/war3structs/storage', [
     'war3structs/storage/storm.dll',
     'war3structs/storage/CascLib.dll'])],
@@ -0,0 +1,77 @@
+import unittest
+
+from war3structs.storage.casccache import CascReadCache
+
+"""
+  Tests of the contents cache of CascStore.
+"""
+
+class CascReadCacheTest(unittest.TestCase):
+  def test_get(self):
+    cache = CascReadCache(100)
+    cache.put('war3.w3mod:Units/UnitData.slk', b'data')
+
+    self.assertEqual(cache.get('WAR3.W3MOD:UNITS\\UNITDATA.SLK'), b'data')
+    self.assertIsNone(cache.get('war3.w3mod:Units/UnitBalance.slk'))
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+  def test_eviction(self):
+    cache = CascReadCache(10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+
+    # a is used last, so b goes first
+    cache.get('a')
+    cache.put('c', b'cccc')
+
+    self.assertIsNone(cache.peek('b'))
+    self.assertEqual(cache.peek('a'), b'aaaa')
+    self.assertEqual(cache.size, 8)
+    self.assertEqual((cache.evictions, cache.evicted_bytes), (1, 4))
+
+  def test_replace(self):
+    cache = CascReadCache(10)
+    cache.put('a', b'aaaa')
+    cache.put('A', b'aa')
+    self.assertEqual(cache.size, 2)
+
+    # Larger than the budget, not cached at all
+    cache.put('a', b'a' * 11)
+    self.assertIsNone(cache.peek('a'))
+    self.assertEqual(cache.size, 0)
+
+  def test_pin(self):
+    cache = CascReadCache(10)
+    cache.put('a', b'aaaa')
+    cache.pin('a', b'aaaa')
+    cache.pin('big', b'b' * 20)
+    self.assertEqual(cache.size, 0)
+
+    # Pinned files are never evicted
+    for name in 'cdef':
+      cache.put(name, b'xxxx')
+    self.assertEqual(cache.peek('a'), b'aaaa')
+    self.assertEqual(cache.peek('big'), b'b' * 20)
+
+    cache.clear()
+    self.assertEqual(cache.get('a'), b'aaaa')
+
+    cache.unpin('a')
+    self.assertEqual(cache.size, 4)
+    self.assertEqual(cache.stats()['pinned'], 1)
+
+  def test_peek(self):
+    cache = CascReadCache(8)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+
+    # Peeking neither counts nor makes a the most recently used
+    self.assertEqual(cache.peek('a'), b'aaaa')
+    self.assertIsNone(cache.peek('c'))
+    self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    cache.put('c', b'cccc')
+    self.assertIsNone(cache.peek('a'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,63 @@
+import io
+import unittest
+
+from war3structs.plaintext import JassParser
+
+"""
+  Tests of building JASS scripts back from their AST.
+"""
+
+script = '''native Foo takes integer a, real b returns nothing
+globals
+integer g = 1
+endglobals
+function bar takes integer a, real b, string c returns integer
+local integer i = a
+call Foo(a, b)
+return i
+endfunction
+'''
+
+class JassBuildTest(unittest.TestCase):
+  def test_takes(self):
+    built = JassParser.build(JassParser.parse(script))
+    self.assertIn('native Foo takes integer a,real b returns nothing\n', built)
+    self.assertIn('function bar takes integer a,real b,string c returns integer\n', built)
+
+  def test_round_trip(self):
+    built = JassParser.build(JassParser.parse(script))
+    self.assertEqual(JassParser.build(JassParser.parse(built)), built)
+
+    function = JassParser.parse(built).functions[0]
+    self.assertEqual([(str(type_), str(id_)) for type_, id_ in function.takes],
+      [('integer', 'a'), ('real', 'b'), ('string', 'c')])
+
+  def test_stream(self):
+    ast = JassParser.parse(script)
+    stream = io.BytesIO()
+    JassParser.build(ast, stream)
+    self.assertEqual(stream.getvalue().decode('utf-8'), JassParser.build(ast))
+
+class JassReparseTest(unittest.TestCase):
+  def positions(self, script):
+    result = []
+    for function in script.functions:
+      result.append((function.id.value, function.line, function.id.start_pos))
+      for statement in function.statements:
+        result.append([(token.value, token.line, token.start_pos, token.end_pos) for token in statement])
+
+    return result
+
+  def test_reparse(self):
+    text = script + script[script.index('function'):].replace('bar', 'baz')
+    ast = JassParser.parse(text)
+
+    # Add a line to bar, the following functions move down
+    new_text = text.replace('call Foo(a, b)\n', 'call Foo(a, b)\nset i = i + 1\n', 1)
+    JassParser.reparse(ast, text, (8, 1), (8, 1), 'set i = i + 1\n')
+
+    self.assertEqual(self.positions(ast), self.positions(JassParser.parse(new_text)))
+    self.assertEqual(JassParser.build(ast), JassParser.build(JassParser.parse(new_text)))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+
+from war3structs.plaintext import JassParser
+from war3structs.plaintext.jass_callgraph import JassCallGraph
+
+"""
+  Tests of the JASS call graph, on a script with recursive functions.
+"""
+
+script = '''native KillUnit takes unit whichUnit returns nothing
+native GetUnitX takes unit u returns real
+globals
+  integer udg_depth = 0
+  real udg_x = 0.0
+  trigger udg_trigger = null
+endglobals
+function Even takes integer n returns boolean
+  if n == 0 then
+    return true
+  endif
+  return Odd(n - 1)
+endfunction
+function Odd takes integer n returns boolean
+  if n == 0 then
+    return false
+  endif
+  return Even(n - 1)
+endfunction
+function Countdown takes integer n returns nothing
+  if n > 0 then
+    call Countdown(n - 1)
+  endif
+endfunction
+function Kill takes unit u returns nothing
+  local real udg_x = GetUnitX(u)
+  call KillUnit(u)
+endfunction
+function Start takes nothing returns nothing
+  set udg_depth = udg_depth + 1
+  call Countdown(udg_depth)
+  call BJDebugMsg(I2S(udg_depth))
+endfunction
+function main takes nothing returns nothing
+  if Even(4) then
+    call Start()
+  endif
+endfunction
+'''
+
+class JassCallGraphTest(unittest.TestCase):
+  def setUp(self):
+    self.ast = JassParser.parse(script)
+    self.graph = JassCallGraph(self.ast)
+
+  def test_edges(self):
+    graph = self.graph
+
+    self.assertEqual(sorted(graph.callees('Start')), ['BJDebugMsg', 'Countdown', 'I2S', 'udg_depth'])
+    self.assertEqual(sorted(graph.callers('Even')), ['Odd', 'main'])
+    self.assertEqual(graph.kind('KillUnit'), 'native')
+    self.assertEqual(graph.kind('udg_depth'), 'global')
+    self.assertEqual(graph.kind('Kill'), 'function')
+    self.assertEqual(graph.kind('BJDebugMsg'), 'external')
+
+    # The local shadows the global
+    self.assertNotIn('udg_x', graph.callees('Kill'))
+    self.assertEqual(graph.callers('udg_x'), [])
+
+  def test_components(self):
+    components = self.graph.components()
+    self.assertEqual(sum(len(component) for component in components), len(self.graph.names))
+
+    by_name = {}
+    for position, component in enumerate(components):
+      for name in component:
+        by_name[name] = position
+
+    self.assertEqual(sorted(components[by_name['Even']]), ['Even', 'Odd'])
+    self.assertEqual(components[by_name['Countdown']], ['Countdown'])
+
+    # Reverse topological order: what a component calls comes before it
+    for name in self.graph.names:
+      for callee in self.graph.callees(name):
+        self.assertLessEqual(by_name[callee], by_name[name], (name, callee))
+
+  def test_recursive(self):
+    groups = sorted(sorted(group) for group in self.graph.recursive())
+    self.assertEqual(groups, [['Countdown'], ['Even', 'Odd']])
+
+  def test_reachable(self):
+    reachable = self.graph.reachable('main')
+    self.assertEqual(reachable, set(['main', 'Even', 'Odd', 'Start', 'Countdown', 'udg_depth', 'BJDebugMsg', 'I2S']))
+    self.assertNotIn('Kill', reachable)
+
+    self.assertEqual(self.graph.dependents('Odd'), set(['Even', 'Odd', 'main']))
+    self.assertEqual(self.graph.dependents('udg_depth'), set(['Start', 'main']))
+    self.assertEqual(self.graph.dependents('Countdown'), set(['Countdown', 'Start', 'main']))
+
+  def test_natives(self):
+    self.assertEqual(self.graph.used_natives(), set(['KillUnit', 'GetUnitX']))
+    self.assertEqual(self.graph.used_natives(['main']), set())
+    self.assertEqual(self.graph.used_natives(['main'], external=True), set(['BJDebugMsg', 'I2S']))
+
+  def test_update(self):
+    graph = self.graph
+
+    # Break the cycle: Odd stops calling Even
+    odd = self.ast.index['functions']['Odd']
+    odd.statements = JassParser.parse('function Odd takes integer n returns boolean\nreturn n > 0\nendfunction\n').functions[0].statements
+    graph.update(odd)
+
+    self.assertEqual(graph.callers('Even'), ['main'])
+    self.assertEqual(sorted(sorted(group) for group in graph.recursive()), [['Countdown']])
+
+    graph.remove('Start')
+    self.assertEqual(graph.kind('Start'), 'external')
+    self.assertNotIn('Countdown', graph.reachable('main'))
+
+if __name__ == '__main__':
+  unittest.main()
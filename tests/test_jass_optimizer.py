@@ -0,0 +1,172 @@
+import unittest
+
+from war3structs.plaintext import JassParser, JassOptimizer
+from war3structs.plaintext.jass_optimizer import (
+  declared_names,
+  fold_constants,
+  inline_wrappers,
+  remove_unreachable,
+  script_size,
+  shorten_identifiers
+)
+
+"""
+  Tests of the JASS optimizer passes, on small scripts.
+"""
+
+common = '''type agent extends handle
+type unit extends agent
+native KillUnit takes unit whichUnit returns nothing
+native GetUnitX takes unit u returns real
+native Or takes boolean a, boolean b returns boolean
+'''
+
+script = '''type agent extends handle
+type unit extends agent
+native KillUnit takes unit whichUnit returns nothing
+native GetUnitX takes unit u returns real
+globals
+  constant integer FOO = 1 + 2 * 3
+  integer udg_counter = -5 + 3
+  integer array udg_values
+  unit udg_hero = null
+  integer udg_negdiv = (0 - 7) / 2
+endglobals
+function Unused takes nothing returns nothing
+  call KillUnit(null)
+endfunction
+function KillWrapper takes unit u returns nothing
+  call KillUnit(u)
+endfunction
+function X takes unit u returns real
+  return GetUnitX(u)
+endfunction
+function Dynamic takes nothing returns nothing
+  set udg_counter = udg_counter + 1
+endfunction
+function Helper takes integer udg_counter, real b returns integer
+  local integer i = udg_counter * (2 + 3)
+  set udg_values[1 + 1] = i - 1 + 2
+  if i > 10 * 10 then
+    call KillWrapper(udg_hero)
+  endif
+  set b = X(udg_hero) + 1.0
+  return i
+endfunction
+function Callback takes nothing returns nothing
+  call Helper(FOO, 2.0)
+endfunction
+function main takes nothing returns nothing
+  local integer mainLocal = 4 / 3
+  call Helper(FOO, 2.0)
+  call ExecuteFunc("Dynamic")
+  call TimerStart(null, 1, false, function Callback)
+  set mainLocal = mainLocal + 2147483647 + 1
+endfunction
+'''
+
+def _body(ast, name):
+  """Get the statements of a function, tokens separated by spaces"""
+
+  function = ast.index['functions'][name]
+  return ' '.join(token.value for statement in function.statements for token in statement if token.type != 'NEWLINE')
+
+class FoldTest(unittest.TestCase):
+  def test_fold(self):
+    ast = fold_constants(JassParser.parse(script))
+    globals = dict((g.id.value, ' '.join(token.value for token in g.equals or [])) for g in ast.globals)
+
+    self.assertEqual(globals['FOO'], '7')
+    self.assertEqual(globals['udg_counter'], '- 2')
+    # Truncating division
+    self.assertEqual(globals['udg_negdiv'], '- 3')
+
+    helper = _body(ast, 'Helper')
+    self.assertIn('set udg_values [ 2 ] = i - 1 + 2', helper)
+    # Not delimited on both sides, precedence could change
+    self.assertIn('if i > 10 * 10 then', helper)
+    local = ast.index['functions']['Helper'].locals[0]
+    self.assertEqual(' '.join(token.value for token in local.equals), 'udg_counter * ( 5 )')
+
+    # Overflowing runs are left alone, 32 bit integers would wrap
+    self.assertIn('set mainLocal = mainLocal + 2147483647 + 1', _body(ast, 'main'))
+    self.assertEqual(ast.index['functions']['main'].locals[0].equals[0].value, '1')
+
+class InlineTest(unittest.TestCase):
+  def test_inline(self):
+    ast = inline_wrappers(JassParser.parse(script))
+    helper = _body(ast, 'Helper')
+
+    self.assertIn('call KillUnit ( udg_hero )', helper)
+    # GetUnitX is longer than X, calling it would make the script bigger
+    self.assertIn('set b = X ( udg_hero ) + 1.0', helper)
+
+  def test_size(self):
+    ast = JassParser.parse(script)
+    size = script_size(ast)
+    self.assertLessEqual(script_size(inline_wrappers(ast)), size)
+
+class UnreachableTest(unittest.TestCase):
+  def test_unreachable(self):
+    ast = remove_unreachable(JassParser.parse(script))
+    names = [function.id.value for function in ast.functions]
+
+    # Dynamic is named in a string, Callback referenced with function
+    self.assertEqual(names, ['KillWrapper', 'X', 'Dynamic', 'Helper', 'Callback', 'main'])
+
+  def test_no_main(self):
+    text = 'function a takes nothing returns nothing\nendfunction\n'
+    ast = remove_unreachable(JassParser.parse(text))
+    self.assertEqual(len(ast.functions), 1)
+
+class ShortenTest(unittest.TestCase):
+  def test_reserved(self):
+    with self.assertRaises(ValueError):
+      shorten_identifiers(JassParser.parse(script))
+
+  def test_shorten(self):
+    reserved = declared_names(common)
+    self.assertIn('Or', reserved)
+
+    ast = shorten_identifiers(JassParser.parse(script), reserved)
+    built = JassParser.build(ast)
+    ast = JassParser.parse(built)
+
+    names = set(function.id.value for function in ast.functions)
+    self.assertIn('main', names)
+    self.assertIn('Dynamic', names)
+    self.assertEqual(len(names), 7)
+    self.assertTrue(all(len(name) == 1 for name in names - set(['main', 'Dynamic'])))
+    self.assertTrue(names.isdisjoint(reserved))
+
+    # Dynamic still uses the global, by its new name, that a parameter of Helper shadows
+    counter = [g.id.value for g in ast.globals if g.type.value == 'integer' and not g.is_array and not g.is_constant]
+    self.assertIn('function Dynamic takes nothing returns nothing\nset {0}={0}+1\n'.format(counter[0]), built)
+    self.assertLess(len(built), len(JassParser.build(JassParser.parse(script))))
+
+class OptimizerTest(unittest.TestCase):
+  def test_default(self):
+    optimizer = JassOptimizer(verify=True)
+    self.assertNotIn('shorten', optimizer.passes)
+
+    ast = JassParser.parse(script)
+    report = optimizer.optimize(ast)
+    self.assertEqual([name for name, _, _ in report], ['fold', 'inline', 'unreachable'])
+    for name, before, after in report:
+      self.assertLessEqual(after, before, name)
+    self.assertEqual(report[-1][2], script_size(ast))
+
+  def test_shorten(self):
+    with self.assertRaises(ValueError):
+      JassOptimizer(passes=['shorten'])
+
+    optimizer = JassOptimizer(passes=['fold', 'shorten'], verify=True, declarations=[common])
+    report = optimizer.optimize(JassParser.parse(script))
+    self.assertLess(report[-1][2], report[-1][1])
+
+  def test_unknown(self):
+    with self.assertRaises(ValueError):
+      JassOptimizer(passes=['minify']).optimize(JassParser.parse(script))
+
+if __name__ == '__main__':
+  unittest.main()
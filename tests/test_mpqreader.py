@@ -0,0 +1,168 @@
+import os
+import bz2
+import zlib
+import struct
+import shutil
+import tempfile
+import unittest
+
+from war3structs.storage.mpqreader import (
+  MPQReader,
+  MPQReaderError,
+  crypt_table,
+  explode,
+  hash_string
+)
+
+"""
+  Tests of the pure Python MPQ reader, on small archives written here
+  with every kind of entry the reader supports.
+"""
+
+SECTOR_SIZE = 512
+
+FLAG_COMPRESS    = 0x00000200
+FLAG_ENCRYPTED   = 0x00010000
+FLAG_FIX_KEY     = 0x00020000
+FLAG_SINGLE_UNIT = 0x01000000
+FLAG_EXISTS      = 0x80000000
+
+def encrypt(data, key):
+  count = len(data) // 4
+  values = struct.unpack_from('<%dI' % count, data)
+  result = []
+  seed = 0xEEEEEEEE
+
+  for value in values:
+    seed = (seed + crypt_table[0x400 + (key & 0xFF)]) & 0xFFFFFFFF
+    result.append(value ^ ((key + seed) & 0xFFFFFFFF))
+    key = ((((~key) << 0x15) + 0x11111111) & 0xFFFFFFFF) | (key >> 0x0B)
+    seed = (value + seed + (seed << 5) + 3) & 0xFFFFFFFF
+
+  return struct.pack('<%dI' % count, *result) + data[count * 4:]
+
+def _sectors(data, compress):
+  sectors = []
+  for start in range(0, len(data), SECTOR_SIZE):
+    sector = data[start:start + SECTOR_SIZE]
+    compressed = compress(sector)
+    sectors.append(compressed if len(compressed) < len(sector) else sector)
+
+  return sectors
+
+def _entry(name, data, kind, offset):
+  """Get the stored blob and flags of a file"""
+
+  flags = FLAG_EXISTS
+
+  if kind == 'raw':
+    return data, flags
+
+  if kind == 'bzip2':
+    return b'\x10' + bz2.compress(data), flags | FLAG_COMPRESS | FLAG_SINGLE_UNIT
+
+  sectors = _sectors(data, lambda sector: b'\x02' + zlib.compress(sector))
+  offsets = [4 * (len(sectors) + 1)]
+  for sector in sectors:
+    offsets.append(offsets[-1] + len(sector))
+  table = struct.pack('<%dI' % len(offsets), *offsets)
+  flags |= FLAG_COMPRESS
+
+  if kind == 'encrypted':
+    flags |= FLAG_ENCRYPTED | FLAG_FIX_KEY
+    key = hash_string(name.replace('/', '\\').split('\\')[-1], 3)
+    key = ((key + offset) ^ len(data)) & 0xFFFFFFFF
+    table = encrypt(table, (key - 1) & 0xFFFFFFFF)
+    sectors = [encrypt(sector, (key + index) & 0xFFFFFFFF) for index, sector in enumerate(sectors)]
+
+  return table + b''.join(sectors), flags
+
+def write_archive(path, files, listfile=None, prefix=b''):
+  """Write an archive of (name, data, kind) files
+
+  Kinds are raw, zlib (sectors), bzip2 (single unit) and encrypted
+  (zlib sectors, encrypted with a fixed key).
+  """
+
+  if listfile is not None:
+    files = files + [('(listfile)', '\r\n'.join(listfile).encode('utf-8'), 'zlib')]
+
+  body = b''
+  blocks = []
+  for name, data, kind in files:
+    offset = 32 + len(body)
+    blob, flags = _entry(name, data, kind, offset)
+    blocks.append((offset, len(blob), len(data), flags))
+    body += blob
+
+  hash_size = 16
+  hashes = [(0xFFFFFFFF,) * 4] * hash_size
+  for block, (name, _, _) in enumerate(files):
+    index = hash_string(name, 0) & (hash_size - 1)
+    while hashes[index][3] != 0xFFFFFFFF:
+      index = (index + 1) % hash_size
+    hashes[index] = (hash_string(name, 1), hash_string(name, 2), 0, block)
+
+  hash_table = encrypt(b''.join(struct.pack('<4I', *entry) for entry in hashes), hash_string('(hash table)', 3))
+  block_table = encrypt(b''.join(struct.pack('<4I', *entry) for entry in blocks), hash_string('(block table)', 3))
+  hash_table_pos = 32 + len(body)
+  block_table_pos = hash_table_pos + len(hash_table)
+
+  header = b'MPQ\x1a' + struct.pack('<IIHHIIII', 32, block_table_pos + len(block_table), 0, 0,
+    hash_table_pos, block_table_pos, hash_size, len(blocks))
+
+  with open(path, 'wb') as file:
+    file.write(prefix + header + body + hash_table + block_table)
+
+class MPQReaderTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.text = b'function main takes nothing returns nothing\nendfunction\n' * 40
+    self.noise = bytes((index * 7919) % 251 for index in range(3000))
+
+    self.files = [
+      ('war3map.j', self.text, 'zlib'),
+      ('Units\\UnitData.slk', self.text * 2, 'encrypted'),
+      ('raw.bin', self.noise, 'raw'),
+      ('Units\\Strings.txt', self.text * 3, 'bzip2'),
+      ('Sound\\Café.wav', self.noise, 'raw')
+    ]
+
+    self.path = os.path.join(self.directory, 'test.w3x')
+    write_archive(self.path, self.files,
+      listfile=['war3map.j', 'Units/UnitData.slk', 'raw.bin', 'units/strings.txt', 'Sound\\Café.wav'],
+      prefix=b'HM3W' + b'\0' * 508)
+    self.mpq = MPQReader(self.path)
+
+  def tearDown(self):
+    self.mpq.close()
+    shutil.rmtree(self.directory)
+
+  def test_read(self):
+    for name, data, kind in self.files:
+      self.assertEqual(self.mpq.read(name), data, kind)
+
+  def test_paths(self):
+    self.assertEqual(self.mpq.read('UNITS/unitdata.SLK'), self.text * 2)
+    self.assertTrue(self.mpq.has('sound\\café.wav'))
+    self.assertFalse(self.mpq.has('missing.txt'))
+    with self.assertRaises(MPQReaderError):
+      self.mpq.read('missing.txt')
+
+  def test_find(self):
+    names = sorted(file.filename for file in self.mpq.find('Units\\*'))
+    self.assertEqual(names, ['Units/UnitData.slk', 'units/strings.txt'])
+    self.assertEqual(len(list(self.mpq.find('*.j'))), 1)
+    self.assertEqual(len(list(self.mpq.find())), 5)
+
+  def test_non_ascii_hash(self):
+    # Storm leaves non-ASCII bytes as they are
+    self.assertEqual(hash_string('café', 1), hash_string('CAFé', 1))
+    self.assertNotEqual(hash_string('café', 1), hash_string('CAFÉ', 1))
+
+  def test_explode(self):
+    # The example of blast.c
+    self.assertEqual(explode(bytes([0x00, 0x04, 0x82, 0x24, 0x25, 0x8f, 0x80, 0x7f])), b'AIAIAIAIAIAIA')
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,75 @@
+import io
+import unittest
+
+from war3structs.plaintext import SlkParser
+from war3structs.plaintext.slk import SlkTable
+
+"""
+  Tests of the SYLK table parser and writer.
+"""
+
+text = '''ID;PWXL;N;E
+B;X4;Y4;D0
+C;Y1;X1;K"unitID"
+C;X2;K"name"
+C;X3;K"hp"
+C;X4;K"isbldg"
+C;Y2;X1;K"hfoo"
+C;X2;K"Footman;;Militia"
+C;X3;K420
+C;X4;K0
+F;Y3;X1
+C;K"hkni"
+C;X3;K800.5
+C;X4;KTRUE
+O;L
+C;Y4;X1;K"hpea"
+C;X2;K"Peasant"
+E
+'''
+
+class SlkParseTest(unittest.TestCase):
+  def test_parse(self):
+    table = SlkParser.parse(text)
+
+    self.assertEqual(table.names, ['unitID', 'name', 'hp', 'isbldg'])
+    self.assertEqual(list(table), ['hfoo', 'hkni', 'hpea'])
+    self.assertEqual(table.row('hfoo'), {'unitID': 'hfoo', 'name': 'Footman;Militia', 'hp': 420, 'isbldg': 0})
+    self.assertEqual(table.get('hkni', 'hp'), 800.5)
+    self.assertIs(table.get('hkni', 'isbldg'), True)
+    self.assertIsNone(table.get('hkni', 'name'))
+    self.assertEqual(table.get('hpea', 'hp', 0), 0)
+    self.assertNotIn('hmtm', table)
+
+class SlkBuildTest(unittest.TestCase):
+  def test_round_trip(self):
+    table = SlkParser.parse(text)
+    built = SlkParser.build(table)
+    parsed = SlkParser.parse(built)
+
+    self.assertEqual(parsed.names, table.names)
+    self.assertEqual(parsed.ids, table.ids)
+    self.assertEqual(parsed.columns, table.columns)
+    self.assertEqual(SlkParser.build(parsed), built)
+
+  def test_table(self):
+    table = SlkTable(['id', 'name'])
+    table.add_row('a', {'name': 'one'})
+    table.add_row('b', {'level': 3})
+
+    with self.assertRaises(KeyError):
+      table.add_row('a')
+
+    parsed = SlkParser.parse(SlkParser.build(table))
+    self.assertEqual(parsed.names, ['id', 'name', 'level'])
+    self.assertEqual(parsed.row('a'), {'id': 'a', 'name': 'one'})
+    self.assertEqual(parsed.row('b'), {'id': 'b', 'level': 3})
+
+  def test_stream(self):
+    table = SlkParser.parse(text)
+    stream = io.StringIO()
+    SlkParser.build(table, stream)
+    self.assertEqual(stream.getvalue(), SlkParser.build(table))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+import io
+import mmap
+import os
+import tempfile
+import unittest
+
+from war3structs.plaintext import TxtParser
+from war3structs.plaintext.txt import split_list
+
+"""
+  Tests of the lazy txt parser and the txt writer.
+"""
+
+text = '''﻿[Hpal]
+// Paladin
+Name=Paladin
+_comment=skipped
+Ubertip="Warrior hero, exceptional at defense."
+Buttonpos=0,0
+
+[AHhb]
+Name=Holy Light
+Researchubertip="Heals a target friendly, for 200, 400, 600 health.",Second
+[Hpal]
+Hotkey=P
+'''
+
+class SplitListTest(unittest.TestCase):
+  def test_split(self):
+    self.assertEqual(split_list('0,0'), ['0', '0'])
+    self.assertEqual(split_list('one'), ['one'])
+    self.assertEqual(split_list(''), [''])
+    self.assertEqual(split_list('"a, b",c,"d"'), ['a, b', 'c', 'd'])
+
+class TxtDataTest(unittest.TestCase):
+  def check(self, data):
+    self.assertEqual(sorted(data), ['AHhb', 'Hpal'])
+    self.assertEqual(len(data), 2)
+    self.assertNotIn('Hamg', data)
+
+    # Sections appearing twice are merged, comments are skipped
+    self.assertEqual(dict(data['Hpal']), {
+      'Name': 'Paladin',
+      'Ubertip': '"Warrior hero, exceptional at defense."',
+      'Buttonpos': '0,0',
+      'Hotkey': 'P'
+    })
+    self.assertEqual(data['Hpal'].getlist('Buttonpos'), ['0', '0'])
+    self.assertEqual(data['AHhb'].getlist('Researchubertip'),
+      ['Heals a target friendly, for 200, 400, 600 health.', 'Second'])
+    self.assertIsNone(data['AHhb'].getlist('Missing'))
+
+    with self.assertRaises(KeyError):
+      data['Hamg']
+
+  def test_str(self):
+    self.check(TxtParser.parse_data(text))
+
+  def test_bytes(self):
+    self.check(TxtParser.parse_data(text.encode('utf-8')))
+
+  def test_buffers(self):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'units.txt')
+    with open(path, 'wb') as file:
+      file.write(text.encode('utf-8'))
+
+    try:
+      with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+          self.check(TxtParser.parse_data(mapping))
+          self.check(TxtParser.parse_data(memoryview(mapping)))
+    finally:
+      os.remove(path)
+      os.rmdir(directory)
+
+  def test_empty(self):
+    self.assertEqual(len(TxtParser.parse_data(b'')), 0)
+
+  def test_lazy(self):
+    data = TxtParser.parse_data(text)
+    self.assertEqual(data.sections, {})
+    data['AHhb']
+    self.assertEqual(list(data.sections), ['AHhb'])
+
+  def test_same_as_parse(self):
+    config = TxtParser.parse(text.lstrip('﻿'))
+    data = TxtParser.parse_data(text)
+
+    for name in config.sections():
+      self.assertEqual(dict(config.items(name, raw=True)), dict(data[name]))
+
+class TxtBuildTest(unittest.TestCase):
+  def test_round_trip(self):
+    data = TxtParser.parse_data(text)
+    built = TxtParser.build(data)
+
+    self.assertEqual(TxtParser.parse_data(built).to_dict(), data.to_dict())
+    self.assertEqual(TxtParser.build(TxtParser.parse(built)), built)
+
+  def test_stream(self):
+    data = TxtParser.parse_data(text)
+    stream = io.StringIO()
+    TxtParser.build(data, stream)
+    self.assertEqual(stream.getvalue(), TxtParser.build(data))
+
+if __name__ == '__main__':
+  unittest.main()
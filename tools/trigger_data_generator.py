@@ -15,7 +15,7 @@ def generate_trigger_data_patch(trigger_data_path, out_path):
     # Syntax error as of 1.30.1
     contents = contents.replace('_BlzGetUnitAbilityManaCost_Limits-_,_,_,_,1,_', '_BlzGetUnitAbilityManaCost_Limits=_,_,_,_,1,_')
 
-  config = TxtParser.parse(contents)
+  config = TxtParser.parse_data(contents)
 
   masterlist = {}
 
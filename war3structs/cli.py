@@ -0,0 +1,322 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import concurrent.futures
+
+from .metadata import MetadataFile
+from .imports import ImportsFile
+from .objects import ObjectsFile, ObjectsWithVariationsFile
+from .gamedata import object_files
+from .plaintext.jass import JassParser
+from .storage import MPQReader
+
+try:
+  from .storage import MPQ
+except ImportError:
+  # Without StormLib the pure Python reader is used for every archive
+  MPQ = None
+
+"""
+  Command line interface
+
+  The scan command walks directories of maps and summarizes each one:
+  its metadata, imports, object modifications and the symbols of its
+  script. Maps are fanned out over a process pool in chunks, results are
+  written as chunks complete (not in path order), one JSON object per
+  line or one CSV row per map.
+
+  Scanned paths are appended to a checkpoint file once their result is
+  written, so an interrupted scan picks up where it left off when run
+  again with the same output.
+"""
+
+map_extensions = ('.w3m', '.w3x')
+
+script_paths = ['war3map.j', 'scripts\\war3map.j']
+
+# Columns of the CSV output, the nested keys of a summary joined by dots
+csv_columns = [
+  'path', 'size', 'seconds', 'error',
+  'metadata.name', 'metadata.author', 'metadata.editor_version', 'metadata.tileset',
+  'metadata.players', 'metadata.forces',
+  'imports',
+  'objects.w3u', 'objects.w3t', 'objects.w3b', 'objects.w3h', 'objects.w3d', 'objects.w3a', 'objects.w3q',
+  'script.size', 'script.types', 'script.natives', 'script.globals', 'script.functions',
+  'errors'
+]
+
+def _open_archive(path):
+  """Open a map with StormLib if available, the pure Python reader otherwise"""
+
+  if not MPQ is None:
+    try:
+      return MPQ(path)
+    except Exception:
+      pass
+
+  return MPQReader(path)
+
+def _read(archive, path):
+  try:
+    return archive.read(path)
+  except Exception:
+    return None
+
+def _error(err):
+  return '%s: %s' % (type(err).__name__, err)
+
+def _scan_metadata(data):
+  metadata = MetadataFile.parse(data)
+  return {
+    'name': metadata.name,
+    'author': metadata.author,
+    'editor_version': metadata.editor_version,
+    'tileset': str(metadata.ground_type_tileset_id),
+    'players': metadata.players_count,
+    'forces': metadata.forces_count
+  }
+
+def _scan_objects(data, variations):
+  struct = ObjectsWithVariationsFile if variations else ObjectsFile
+  objects = struct.parse(data)
+  return objects.original_objects_table.objects_count + objects.custom_objects_table.objects_count
+
+def _scan_script(data):
+  text = data.decode('utf-8', 'replace')
+  script = JassParser.scan(text)
+  return {
+    'size': len(data),
+    'types': len(script.types),
+    'natives': len(script.natives),
+    'globals': len(script.globals),
+    'functions': len(script.functions)
+  }
+
+def scan_map(path):
+  """Summarize a map archive
+
+  Failing to read one of the files of the map is recorded in the errors
+  of the summary, failing to open the map in its error.
+  """
+
+  start = time.perf_counter()
+  summary = {'path': path, 'size': None, 'error': None}
+  errors = {}
+
+  try:
+    summary['size'] = os.path.getsize(path)
+    archive = _open_archive(path)
+  except Exception as err:
+    summary['error'] = _error(err)
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+  try:
+    data = _read(archive, 'war3map.w3i')
+    if not data is None:
+      try:
+        summary['metadata'] = _scan_metadata(data)
+      except Exception as err:
+        errors['w3i'] = _error(err)
+
+    data = _read(archive, 'war3map.imp')
+    if not data is None:
+      try:
+        summary['imports'] = ImportsFile.parse(data).imports_count
+      except Exception as err:
+        errors['imp'] = _error(err)
+
+    objects = {}
+    for extension, variations in object_files.items():
+      data = _read(archive, 'war3map.' + extension)
+      if data is None:
+        continue
+
+      try:
+        objects[extension] = _scan_objects(data, variations)
+      except Exception as err:
+        errors[extension] = _error(err)
+    summary['objects'] = objects
+
+    for script_path in script_paths:
+      data = _read(archive, script_path)
+      if data is None:
+        continue
+
+      try:
+        summary['script'] = _scan_script(data)
+      except Exception as err:
+        errors['j'] = _error(err)
+      break
+  finally:
+    archive.close()
+
+  summary['errors'] = errors
+  summary['seconds'] = time.perf_counter() - start
+  return summary
+
+def scan_maps(paths):
+  """Summarize a chunk of map archives"""
+
+  return [scan_map(path) for path in paths]
+
+def find_maps(paths):
+  """Get the map archives in the given files and directories, sorted"""
+
+  maps = []
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        for name in files:
+          if name.lower().endswith(map_extensions):
+            maps.append(os.path.join(root, name))
+    else:
+      maps.append(path)
+
+  return sorted(maps)
+
+def _flatten(summary, prefix=''):
+  row = {}
+  for key, value in summary.items():
+    if isinstance(value, dict) and key != 'errors':
+      row.update(_flatten(value, prefix + key + '.'))
+    else:
+      row[prefix + key] = value
+
+  return row
+
+class JsonlWriter():
+  def __init__(self, file):
+    self.file = file
+
+  def write(self, summary):
+    self.file.write(json.dumps(summary, sort_keys=True) + '\n')
+
+class CsvWriter():
+  def __init__(self, file, header=True):
+    self.writer = csv.DictWriter(file, csv_columns, extrasaction='ignore')
+    if header:
+      self.writer.writeheader()
+
+  def write(self, summary):
+    row = _flatten(summary)
+    errors = row.get('errors')
+    if errors:
+      row['errors'] = ';'.join('%s=%s' % item for item in sorted(errors.items()))
+    else:
+      row['errors'] = None
+    self.writer.writerow(row)
+
+def load_checkpoint(path):
+  """Get the maps a checkpoint file lists as done"""
+
+  if path is None or not os.path.exists(path):
+    return set()
+
+  with open(path, 'r', encoding='utf-8') as file:
+    return set(line.rstrip('\n') for line in file if line.strip())
+
+def scan(paths, output, format='jsonl', processes=None, chunk_size=16, checkpoint=None, progress=None):
+  """Scan maps into an output file, skipping the ones already checkpointed
+
+  Returns the number of maps scanned by this run.
+  """
+
+  maps = find_maps(paths)
+  done = load_checkpoint(checkpoint)
+
+  # The checkpoint only lists maps whose results are in the output
+  resuming = len(done) > 0 and os.path.exists(output)
+  if not resuming:
+    done = set()
+
+  pending = [path for path in maps if not path in done]
+  mode = 'a' if resuming else 'w'
+
+  with open(output, mode, encoding='utf-8', newline='') as out_file:
+    if format == 'csv':
+      writer = CsvWriter(out_file, header=not resuming)
+    else:
+      writer = JsonlWriter(out_file)
+
+    done_file = open(checkpoint, mode, encoding='utf-8') if not checkpoint is None else None
+    count = 0
+
+    def record(summary):
+      writer.write(summary)
+      out_file.flush()
+      if not done_file is None:
+        done_file.write(summary['path'] + '\n')
+        done_file.flush()
+      if not progress is None:
+        progress(count + 1, len(pending), summary)
+
+    try:
+      if processes == 1 or len(pending) < 2:
+        for path in pending:
+          record(scan_map(path))
+          count += 1
+      else:
+        # Chunks are recorded as they complete, a slow map only holds
+        # back the rest of its own chunk
+        size = max(chunk_size, 1)
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+          futures = [executor.submit(scan_maps, chunk) for chunk in chunks]
+          for future in concurrent.futures.as_completed(futures):
+            for summary in future.result():
+              record(summary)
+              count += 1
+    finally:
+      if not done_file is None:
+        done_file.close()
+
+  return count
+
+def _print_progress(index, total, summary):
+  status = 'failed' if summary.get('error') else '%.2fs' % summary['seconds']
+  print('[%d/%d] %s (%s)' % (index, total, summary['path'], status), file=sys.stderr)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='war3structs', description='Warcraft III file format tools')
+  commands = parser.add_subparsers(dest='command')
+
+  scan_parser = commands.add_parser('scan', help='summarize map archives')
+  scan_parser.add_argument('paths', nargs='+', help='map archives or directories of them')
+  scan_parser.add_argument('-o', '--output', required=True, help='output file')
+  scan_parser.add_argument('-f', '--format', choices=('jsonl', 'csv'), default=None,
+    help='output format (default: from the output extension, jsonl otherwise)')
+  scan_parser.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: CPU count)')
+  scan_parser.add_argument('-c', '--chunk-size', type=int, default=16, help='maps sent to a worker at a time')
+  scan_parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: output + .done)')
+  scan_parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and scan everything')
+  scan_parser.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+
+  args = parser.parse_args(argv)
+
+  if args.command != 'scan':
+    parser.print_help()
+    return 1
+
+  format = args.format
+  if format is None:
+    format = 'csv' if args.output.lower().endswith('.csv') else 'jsonl'
+
+  checkpoint = args.checkpoint or args.output + '.done'
+  if args.restart and os.path.exists(checkpoint):
+    os.remove(checkpoint)
+
+  try:
+    scan(args.paths, args.output, format=format, processes=args.processes, chunk_size=args.chunk_size,
+      checkpoint=checkpoint, progress=None if args.quiet else _print_progress)
+  except KeyboardInterrupt:
+    print('Interrupted, run again to resume', file=sys.stderr)
+    return 130
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,311 @@
+import sqlite3
+import hashlib
+
+from .objects import ObjectsFile, ObjectsWithVariationsFile
+from .plaintext.slk import SlkParser
+from .plaintext.txt import TxtParser
+
+"""
+  Effective object data
+
+  The value of an object's field is spread over the game's SLK tables,
+  its txt profile files and the object files of a map. The game data
+  database merges the first two into a base layer, persisted in SQLite
+  so it only has to be built once per game version, and overlays the
+  modifications of a map's object files on top of it.
+
+  Fields are addressed by name (as in the SLK columns and txt keys, case
+  insensitive) or by the modification id the object files use, which is
+  mapped to a name with the meta data tables.
+"""
+
+# Default sources, relative to the root of the game data
+meta_tables = [
+  'Units\\UnitMetaData.slk',
+  'Units\\AbilityMetaData.slk',
+  'Units\\AbilityBuffMetaData.slk',
+  'Units\\UpgradeMetaData.slk',
+  'Units\\DestructableMetaData.slk',
+  'Doodads\\DoodadMetaData.slk'
+]
+
+data_tables = [
+  'Units\\UnitData.slk',
+  'Units\\UnitBalance.slk',
+  'Units\\UnitUI.slk',
+  'Units\\UnitWeapons.slk',
+  'Units\\UnitAbilities.slk',
+  'Units\\ItemData.slk',
+  'Units\\AbilityData.slk',
+  'Units\\AbilityBuffData.slk',
+  'Units\\UpgradeData.slk',
+  'Units\\DestructableData.slk',
+  'Doodads\\Doodads.slk'
+]
+
+profile_files = [
+  'Units\\%s%s%s.txt' % (race, kind, suffix)
+  for race in ('Campaign', 'Human', 'Neutral', 'NightElf', 'Orc', 'Undead')
+  for kind in ('Unit', 'Ability', 'Upgrade')
+  for suffix in ('Func', 'Strings')
+] + [
+  'Units\\CommonAbilityFunc.txt',
+  'Units\\CommonAbilityStrings.txt',
+  'Units\\ItemAbilityFunc.txt',
+  'Units\\ItemAbilityStrings.txt',
+  'Units\\ItemFunc.txt',
+  'Units\\ItemStrings.txt'
+]
+
+# Object file extensions and whether they have variations
+object_files = {
+  'w3u': False,
+  'w3t': False,
+  'w3b': False,
+  'w3h': False,
+  'w3d': True,
+  'w3a': True,
+  'w3q': True
+}
+
+def _id(value):
+  return value.decode('latin-1') if isinstance(value, bytes) else value
+
+def _read(source, path):
+  try:
+    return source.read(path)
+  except Exception:
+    return None
+
+class GameData():
+  def __init__(self, cachefile=None):
+    """Open (or create) a game data database.
+
+    Without a cache file the base layer only lives in memory.
+    """
+    self.db = sqlite3.connect(cachefile if cachefile is not None else ':memory:')
+    self.db.executescript("""
+      CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT);
+      CREATE TABLE IF NOT EXISTS base (
+        object_id TEXT, field TEXT, value,
+        PRIMARY KEY (object_id, field)) WITHOUT ROWID;
+      CREATE TABLE IF NOT EXISTS meta (
+        modification_id TEXT PRIMARY KEY, field TEXT, list_index INTEGER,
+        repeat INTEGER, data INTEGER) WITHOUT ROWID;
+    """)
+
+    self.base = {}
+    self.meta = None
+    self.overlays = {}
+    self.parents = {}
+
+  def close(self):
+    """Close the database."""
+
+    self.db.close()
+    self.db = None
+
+  def loaded_key(self):
+    """Get the key of the base layer in the database, if any."""
+
+    row = self.db.execute("SELECT value FROM info WHERE name = 'key'").fetchone()
+    return row[0] if row is not None else None
+
+  def load(self, source, key=None, prefix='', meta=meta_tables, tables=data_tables, profiles=profile_files):
+    """Build the base layer from a CascStore, MPQ or MPQReader.
+
+    The base layer is only rebuilt when the key differs from the one it
+    was built with, in which case the sources aren't even read. Without
+    a key, the contents of the sources are hashed, which still saves
+    parsing them.
+    """
+    # With a key, nothing has to be read when it's the one loaded
+    if not key is None and self.loaded_key() == key:
+      return False
+
+    paths = [prefix + path for path in list(meta) + list(tables) + list(profiles)]
+    contents = dict((path, _read(source, path)) for path in paths)
+
+    if key is None:
+      hasher = hashlib.sha1()
+      for path in paths:
+        hasher.update(path.encode('utf-8'))
+        hasher.update(contents[path] or b'')
+      key = hasher.hexdigest()
+
+    if self.loaded_key() == key:
+      return False
+
+    self.base = {}
+    self.meta = None
+
+    with self.db:
+      self.db.execute('DELETE FROM base')
+      self.db.execute('DELETE FROM meta')
+
+      for path in meta:
+        data = contents[prefix + path]
+        if data is None:
+          continue
+
+        table = SlkParser.parse(data.decode('utf-8', 'replace'))
+        for id in table:
+          self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?)', (
+            id,
+            str(table.get(id, 'field', '')),
+            table.get(id, 'index', -1),
+            table.get(id, 'repeat', 0),
+            table.get(id, 'data', 0)
+          ))
+
+      values = {}
+
+      for path in tables:
+        data = contents[prefix + path]
+        if data is None:
+          continue
+
+        table = SlkParser.parse(data.decode('utf-8', 'replace'))
+        for name in table.names[1:]:
+          field = str(name).lower()
+          for id, value in zip(table.ids, table.columns[name]):
+            if id is not None and value is not None:
+              values[(str(id), field)] = value
+
+      for path in profiles:
+        data = contents[prefix + path]
+        if data is None:
+          continue
+
+        sections = TxtParser.parse_data(data)
+        for id in sections:
+          for field, value in sections[id].items():
+            values[(id, field.lower())] = value
+
+      self.db.executemany('INSERT INTO base VALUES (?, ?, ?)',
+        ((id, field, value) for (id, field), value in values.items()))
+      self.db.execute("INSERT OR REPLACE INTO info VALUES ('key', ?)", (key,))
+
+    return True
+
+  def _meta(self):
+    if self.meta is None:
+      self.meta = dict((row[0], row[1:]) for row in self.db.execute('SELECT * FROM meta'))
+
+    return self.meta
+
+  def _base(self, object_id):
+    values = self.base.get(object_id)
+
+    if values is None:
+      values = dict(self.db.execute('SELECT field, value FROM base WHERE object_id = ?', (object_id,)))
+      self.base[object_id] = values
+
+    return values
+
+  def _field(self, field, variation=0):
+    """Get the field name and list index of a field or modification id"""
+
+    meta = self._meta().get(field)
+    if meta is None:
+      return field.lower(), -1
+
+    name, list_index, repeat, data = meta
+    if data:
+      name += chr(ord('A') + data - 1)
+    if repeat and variation:
+      name += str(variation)
+
+    return name.lower(), list_index if list_index is not None else -1
+
+  def overlay(self, objects):
+    """Overlay the modifications of a parsed objects file."""
+
+    tables = (objects.original_objects_table, objects.custom_objects_table)
+
+    for table in tables:
+      for obj in table.objects:
+        original_id = _id(obj.original_object_id)
+        new_id = _id(obj.new_object_id)
+
+        if new_id == '\0\0\0\0':
+          object_id = original_id
+        else:
+          object_id = new_id
+          self.parents[new_id] = original_id
+
+        values = self.overlays.setdefault(object_id, {})
+        for modification in obj.modifications:
+          field, list_index = self._field(_id(modification.modification_id), modification.get('variation', 0))
+
+          if list_index >= 0:
+            current = self.get(object_id, field)
+            items = str(current).split(',') if current is not None else []
+            items.extend([''] * (list_index + 1 - len(items)))
+            items[list_index] = str(modification.value)
+            values[field] = ','.join(items)
+          else:
+            values[field] = modification.value
+
+  def overlay_map(self, mpq):
+    """Overlay all object files of a map archive."""
+
+    for extension, variations in object_files.items():
+      data = _read(mpq, 'war3map.' + extension)
+      if data is None:
+        continue
+
+      struct = ObjectsWithVariationsFile if variations else ObjectsFile
+      self.overlay(struct.parse(data))
+
+  def clear_overlays(self):
+    """Remove every overlaid modification."""
+
+    self.overlays = {}
+    self.parents = {}
+
+  def get(self, object_id, field, default=None, variation=0):
+    """Get the effective value of an object's field.
+
+    The variation (level) only applies to modification ids, field names
+    include it already.
+    """
+
+    if len(field) == 4 and field in self._meta():
+      field, _ = self._field(field, variation)
+    else:
+      field = field.lower()
+
+    # Custom objects inherit from the object they were created from
+    seen = set()
+    while object_id is not None and not object_id in seen:
+      seen.add(object_id)
+
+      values = self.overlays.get(object_id)
+      if values is not None and field in values:
+        return values[field]
+
+      values = self._base(object_id)
+      if field in values:
+        return values[field]
+
+      object_id = self.parents.get(object_id)
+
+    return default
+
+  def fields(self, object_id):
+    """Get all effective fields of an object as a dict."""
+
+    chain = []
+    seen = set()
+    while object_id is not None and not object_id in seen:
+      seen.add(object_id)
+      chain.append(object_id)
+      object_id = self.parents.get(object_id)
+
+    result = {}
+    for object_id in reversed(chain):
+      result.update(self._base(object_id))
+      result.update(self.overlays.get(object_id, {}))
+
+    return result
@@ -0,0 +1,220 @@
+import time
+import copy
+
+from construct import Construct, Subconstruct, Renamed, LazyBound, Container, stream_tell
+from construct.lib import bytes2bits, bits2bytes
+
+"""
+  Instrumentation
+
+  Profiles where parsing and building time goes, per named field. The
+  structs of war3structs are left as they are: instrument() returns an
+  instrumented copy of a struct, in which every named field is wrapped
+  in a probe that records its calls, cumulative time and the bytes it
+  consumed (or produced) into a Profile. Using the original struct costs
+  nothing more than it did.
+
+  Fields are named by their path from the instrumented struct, e.g.
+  "triggers.blocks.parameters" in a TriggersFile. Recursive structures
+  (LazyBound) are instrumented once, their fields keep the path they
+  were first reached by. The time and bytes of a field that recurses
+  into itself are only counted by its outermost call, its calls are all
+  counted. Fields that failed to parse, e.g. the alternatives a Select
+  rejected, are counted as errors, their time is still counted.
+
+  Example:
+
+    profile = Profile()
+    TriggersFile_ = instrument(TriggersFile, profile)
+    TriggersFile_.parse(data)
+    print(profile.report())
+"""
+
+class FieldStats():
+  def __init__(self, name):
+    self.name = name
+    self.calls = 0
+    self.errors = 0
+    self.seconds = 0.0
+    self.bytes = 0
+
+  def __repr__(self):
+    return 'FieldStats(%r, calls=%d, errors=%d, seconds=%f, bytes=%d)' % (
+      self.name, self.calls, self.errors, self.seconds, self.bytes)
+
+class Profile():
+  def __init__(self, callback=None):
+    """Collect the stats of instrumented structs.
+
+    With a callback, it is called with (operation, name, seconds, bytes,
+    failed) after every call of a field, operation being "parse" or
+    "build", e.g. to forward them to a metrics sink.
+    """
+    self.callback = callback
+    self.fields = {'parse': {}, 'build': {}}
+    self._active = {'parse': {}, 'build': {}}
+
+  def clear(self):
+    """Forget the stats collected so far."""
+
+    self.fields = {'parse': {}, 'build': {}}
+    self._active = {'parse': {}, 'build': {}}
+
+  def _enter(self, operation, name):
+    active = self._active[operation]
+    depth = active.get(name, 0)
+    active[name] = depth + 1
+    return depth == 0
+
+  def _leave(self, operation, name, outermost, seconds, size, failed):
+    self._active[operation][name] -= 1
+
+    stats = self.fields[operation].get(name)
+    if stats is None:
+      stats = self.fields[operation][name] = FieldStats(name)
+
+    stats.calls += 1
+    if failed:
+      stats.errors += 1
+    if outermost:
+      stats.seconds += seconds
+      stats.bytes += size
+
+    if not self.callback is None:
+      self.callback(operation, name, seconds, size, failed)
+
+  def stats(self, operation='parse'):
+    """Get the stats of every field, by cumulative time"""
+
+    return sorted(self.fields[operation].values(), key=lambda stats: stats.seconds, reverse=True)
+
+  def report(self, operation='parse', limit=None):
+    """Get a table of the stats of the fields, by cumulative time"""
+
+    lines = ['%-48s %10s %8s %12s %14s %12s' % ('field', 'calls', 'errors', 'seconds', 'bytes', 'us/call')]
+    for stats in self.stats(operation)[:limit]:
+      lines.append('%-48s %10d %8d %12.6f %14d %12.2f' % (stats.name, stats.calls, stats.errors,
+        stats.seconds, stats.bytes, stats.seconds * 1e6 / stats.calls if stats.calls else 0))
+
+    return '\n'.join(lines)
+
+class _Probe(Subconstruct):
+  """A named field whose calls are recorded into a Profile"""
+
+  def __init__(self, subcon, profile, key, bits=False):
+    super().__init__(subcon)
+    self.name = subcon.name
+    self.profile = profile
+    self.key = key
+    self.bits = bits
+
+  def _size(self, start, stream, path):
+    size = stream_tell(stream, path) - start
+    # Fields in a Bitwise count bits, possibly fewer than a byte
+    return size / 8 if self.bits else size
+
+  def _parse(self, stream, context, path):
+    profile = self.profile
+    outermost = profile._enter('parse', self.key)
+    start = stream_tell(stream, path)
+    clock = time.perf_counter()
+
+    try:
+      obj = self.subcon._parsereport(stream, context, path)
+    except Exception:
+      profile._leave('parse', self.key, outermost, time.perf_counter() - clock, 0, True)
+      raise
+
+    profile._leave('parse', self.key, outermost, time.perf_counter() - clock, self._size(start, stream, path), False)
+    return obj
+
+  def _build(self, obj, stream, context, path):
+    profile = self.profile
+    outermost = profile._enter('build', self.key)
+    start = stream_tell(stream, path)
+    clock = time.perf_counter()
+
+    try:
+      built = self.subcon._build(obj, stream, context, path)
+    except Exception:
+      profile._leave('build', self.key, outermost, time.perf_counter() - clock, 0, True)
+      raise
+
+    profile._leave('build', self.key, outermost, time.perf_counter() - clock, self._size(start, stream, path), False)
+    return built
+
+class _Instrumenter():
+  def __init__(self, profile):
+    self.profile = profile
+
+    # Targets of LazyBounds by the id of the original
+    self.lazy = {}
+
+  def _bits(self, node, bits):
+    # Bitwise and Bytewise are Transformed or Restreamed, by their function
+    function = getattr(node, 'decodefunc', getattr(node, 'decoder', None))
+    if function is bytes2bits:
+      return True
+    if function is bits2bytes:
+      return False
+    return bits
+
+  def _lazy(self, subconfunc, path, bits):
+    resolved = []
+
+    def instrumented():
+      if not resolved:
+        target = subconfunc()
+        if not id(target) in self.lazy:
+          self.lazy[id(target)] = self.copy(target, path, bits)
+        resolved.append(self.lazy[id(target)])
+
+      return resolved[0]
+
+    return instrumented
+
+  def copy(self, node, path, bits=False):
+    if not isinstance(node, Construct):
+      return node
+
+    if isinstance(node, Renamed) and node.name:
+      path = path + '.' + node.name if path else node.name
+
+    clone = copy.copy(node)
+    inner_bits = self._bits(node, bits)
+
+    for attr in ('subcon', 'thensubcon', 'elsesubcon', 'default'):
+      value = getattr(node, attr, None)
+      if isinstance(value, Construct):
+        setattr(clone, attr, self.copy(value, path, inner_bits))
+
+    if isinstance(getattr(node, 'subcons', None), list):
+      clone.subcons = [self.copy(subcon, path, inner_bits) for subcon in node.subcons]
+      if hasattr(node, '_subcons'):
+        clone._subcons = Container((subcon.name, subcon) for subcon in clone.subcons if subcon.name)
+
+    if isinstance(getattr(node, 'cases', None), dict):
+      clone.cases = dict((key, self.copy(case, path, inner_bits)) for key, case in node.cases.items())
+
+    if isinstance(node, LazyBound):
+      clone.subconfunc = self._lazy(node.subconfunc, path, inner_bits)
+
+    if isinstance(node, Renamed) and node.name:
+      return _Probe(clone, self.profile, path, bits)
+
+    return clone
+
+def instrument(struct, profile, name=None):
+  """Get an instrumented copy of a struct, recording into a profile
+
+  With a name, the struct as a whole is recorded under it too and its
+  fields are prefixed with it.
+  """
+
+  instrumenter = _Instrumenter(profile)
+  instrumented = instrumenter.copy(struct, name or '')
+
+  if name:
+    return _Probe(instrumented, profile, name)
+
+  return instrumented
@@ -1,2 +1,4 @@
 from .jass import JassParser
+from .jass_optimizer import JassOptimizer
 from .txt import TxtParser
+from .slk import SlkParser
@@ -1,8 +1,27 @@
 import re
 import io
-
-from lark import Lark
-from .jass_mapping import JassScriptTransformer
+import os
+import sys
+import zlib
+import pickle
+import hashlib
+import threading
+import concurrent.futures
+
+import lark
+from lark import Lark, Token
+from .jass_mapping import (
+  JassScript,
+  JassScriptTransformer,
+  compact_script,
+  shift_tokens,
+  shift_symbol,
+  Type,
+  Function,
+  Variable,
+  GlobalVariable,
+  FunctionDefinition
+)
 
 """
   Formats: j
@@ -182,86 +201,742 @@ grammar = """
   %ignore WHITESPACE
 """
 
+# Changes to the grammar, Lark or the serialized form invalidate caches
+grammar_version = hashlib.sha1(('1|%s|%s' % (lark.__version__, grammar)).encode('utf-8')).hexdigest()
+
+def _dump_token(token):
+  if isinstance(token, Token):
+    return (token.type, token.value, token.start_pos, token.line, token.column,
+      token.end_line, token.end_column, token.end_pos)
+
+  return token
+
+def _load_token(data):
+  if isinstance(data, tuple):
+    return Token(data[0], data[1], data[2], data[3], data[4], data[5], data[6], data[7])
+
+  return data
+
+def _dump_tokens(tokens):
+  return None if tokens is None else [_dump_token(token) for token in tokens]
+
+def _load_tokens(data):
+  return None if data is None else [_load_token(token) for token in data]
+
+def _dump_takes(takes):
+  return [(_dump_token(type_), _dump_token(id)) for type_, id in takes]
+
+def _load_takes(data):
+  return [(_load_token(type_), _load_token(id)) for type_, id in data]
+
+def dump_script(script):
+  """Get a compact, picklable form of a script"""
+
+  return (
+    [(_dump_token(t.id), _dump_token(t.extends), t.line, t.column) for t in script.types],
+    [(_dump_token(n.id), _dump_takes(n.takes), _dump_token(n.returns), n.is_constant, n.line, n.column)
+      for n in script.natives],
+    [(_dump_token(g.id), _dump_token(g.type), g.is_array, _dump_tokens(g.equals), g.is_constant, g.line, g.column)
+      for g in script.globals],
+    [(_dump_token(f.id), _dump_takes(f.takes), _dump_token(f.returns), f.is_constant,
+      None if f.locals is None else [(_dump_token(l.id), _dump_token(l.type), l.is_array, _dump_tokens(l.equals), l.line, l.column)
+        for l in f.locals],
+      None if f.statements is None else [_dump_tokens(statement) for statement in f.statements],
+      f.line, f.column)
+      for f in script.functions]
+  )
+
+def load_script(data):
+  """Get a script back from its compact form"""
+
+  types, natives, globals, functions = data
+
+  return JassScript(
+    [Type(_load_token(id), _load_token(extends), line=line, column=column)
+      for id, extends, line, column in types],
+    [Function(_load_token(id), _load_takes(takes), _load_token(returns), is_constant, is_native=True, line=line, column=column)
+      for id, takes, returns, is_constant, line, column in natives],
+    [GlobalVariable(_load_token(id), _load_token(type_), is_array, _load_tokens(equals), is_constant, line=line, column=column)
+      for id, type_, is_array, equals, is_constant, line, column in globals],
+    [FunctionDefinition(_load_token(id), _load_takes(takes), _load_token(returns), is_constant,
+      locals=None if locals is None else [Variable(_load_token(l_id), _load_token(l_type), l_is_array, _load_tokens(l_equals), line=l_line, column=l_column)
+        for l_id, l_type, l_is_array, l_equals, l_line, l_column in locals],
+      statements=None if statements is None else [_load_tokens(statement) for statement in statements],
+      line=line, column=column)
+      for id, takes, returns, is_constant, locals, statements, line, column in functions]
+  )
+
+class JassParseCache():
+  """On-disk cache of parsed scripts
+
+  Scripts are keyed by the hash of their text and the grammar version,
+  so a hit never needs Lark. When the cache grows past its size limit
+  the least recently used entries are removed.
+  """
+  def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+    if directory is None:
+      directory = os.path.join(os.path.expanduser('~'), '.cache', 'war3structs', 'jass')
+
+    self.directory = directory
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, text):
+    key = hashlib.sha1(grammar_version.encode('utf-8') + text.encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, key + '.jass')
+
+  def get(self, text):
+    """Get the cached script of a text, None if it isn't cached."""
+
+    path = self._path(text)
+
+    try:
+      with open(path, 'rb') as file:
+        script = load_script(pickle.loads(zlib.decompress(file.read())))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError, ValueError):
+      return None
+
+    # Keep track of use for pruning
+    os.utime(path)
+    return script
+
+  def put(self, text, script):
+    """Cache the script of a text."""
+
+    path = self._path(text)
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+
+    with open(temp_path, 'wb') as file:
+      file.write(zlib.compress(pickle.dumps(dump_script(script), pickle.HIGHEST_PROTOCOL)))
+    os.replace(temp_path, path)
+
+    self.prune()
+
+  def parse(self, text):
+    """Get the AST of JASS code, through the cache"""
+
+    script = self.get(text)
+
+    if script is None:
+      self.misses += 1
+      script = JassParser.parse(text)
+      self.put(text, script)
+    else:
+      self.hits += 1
+
+    return script
+
+  def prune(self):
+    """Remove the least recently used entries past the size limit."""
+
+    entries = []
+    for name in os.listdir(self.directory):
+      if name.endswith('.jass'):
+        stat = os.stat(os.path.join(self.directory, name))
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, name in sorted(entries):
+      if size <= self.max_size:
+        break
+
+      os.remove(os.path.join(self.directory, name))
+      size -= entry_size
+
+  def clear(self):
+    """Remove every entry."""
+
+    for name in os.listdir(self.directory):
+      if name.endswith('.jass'):
+        os.remove(os.path.join(self.directory, name))
+
+#
+# Declaration scanner
+#
+# Reads the symbols of a script without the parser: declarations are
+# tokenized with a single regex, producing the same tokens the parser
+# would, and function bodies are skipped over to their endfunction.
+#
+
+_scan_regex = re.compile(r"""
+  (?P<STRING_LITERAL>"(?:\\"|\\\\|[^"])*")
+  |(?P<INT_LITERAL>'[^']*')
+  |(?P<REAL_CONST>[0-9]+\.[0-9]*|\.[0-9]+)
+  |(?P<INT_CONST_HEX>\$[0-9a-fA-F]+|0[xX][0-9a-fA-F]+)
+  |(?P<INT_CONST_OCT>0[0-7]+)
+  |(?P<INT_CONST_DEC>0|[1-9][0-9]*)
+  |(?P<WORD>[a-zA-Z][a-zA-Z0-9_]*)
+  |(?P<COMMENT>//[^\n]*)
+  |(?P<OPERATOR>==|!=|<=|>=|[-+*/<>=()\[\],])
+  |(?P<NEWLINE>\r?\n)
+  |(?P<WHITESPACE>[ \t\f\r]+)
+""", re.VERBOSE)
+
+_scan_words = {
+  'code': 'CODE', 'handle': 'HANDLE', 'integer': 'INTEGER', 'real': 'REAL',
+  'boolean': 'BOOLEAN', 'string': 'STRING', 'array': 'ARRAY',
+  'globals': 'GLOBALS', 'endglobals': 'ENDGLOBALS', 'constant': 'CONSTANT',
+  'native': 'NATIVE', 'extends': 'EXTENDS', 'type': 'KTYPE',
+  'function': 'FUNCTION', 'endfunction': 'ENDFUNCTION', 'takes': 'TAKES',
+  'returns': 'RETURNS', 'nothing': 'NOTHING', 'local': 'LOCAL',
+  'return': 'RETURN', 'set': 'SET', 'call': 'CALL', 'loop': 'LOOP',
+  'endloop': 'ENDLOOP', 'exitwhen': 'EXITWHEN', 'if': 'IF', 'then': 'THEN',
+  'else': 'ELSE', 'elseif': 'ELSEIF', 'endif': 'ENDIF', 'debug': 'DEBUG',
+  'or': 'OR', 'and': 'AND', 'not': 'NOT',
+  'true': 'BOOL_CONST', 'false': 'BOOL_CONST', 'null': 'NULL_CONST'
+}
+
+# Names that can't be identifiers
+keywords = frozenset(_scan_words)
+
+_scan_operators = {
+  '+': 'PLUS', '-': 'MINUS', '*': 'TIMES', '/': 'DIVIDE',
+  '==': 'EQ', '!=': 'NE', '<': 'LT', '>': 'GT', '<=': 'LE', '>=': 'GE',
+  '=': 'EQUALS', '(': 'LPARENS', ')': 'RPARENS', '[': 'LBRACKET',
+  ']': 'RBRACKET', ',': 'COMMA'
+}
+
+# Strings are matched too, so a // inside one isn't taken for a comment
+_comment_regex = re.compile(r'"(?:\\"|\\\\|[^"])*"|(//[^\n]*)')
+
+_endfunction_regex = re.compile(r'^[ \t]*endfunction\b[^\n]*', re.MULTILINE)
+
+class _JassScanner():
+  def __init__(self, text):
+    self.text = text
+    self.pos = 0
+    self.line = 1
+    self.line_start = 0
+
+  def next_line(self):
+    """Get the tokens up to the next newline, without comments"""
+
+    text = self.text
+    tokens = []
+
+    while self.pos < len(text):
+      match = _scan_regex.match(text, self.pos)
+      if match is None:
+        raise SyntaxError('Unexpected character %r at line %d column %d' % (
+          text[self.pos], self.line, self.pos - self.line_start + 1))
+
+      kind = match.lastgroup
+      start = match.start()
+      end = match.end()
+      self.pos = end
+
+      if kind == 'NEWLINE':
+        self.line += 1
+        self.line_start = end
+        if tokens:
+          return tokens
+        continue
+
+      if kind == 'WHITESPACE' or kind == 'COMMENT':
+        continue
+
+      value = match.group()
+      if kind == 'WORD':
+        kind = _scan_words.get(value, 'ID')
+      elif kind == 'OPERATOR':
+        kind = _scan_operators[value]
+
+      # Strings can span lines
+      newlines = value.count('\n')
+      end_line = self.line + newlines
+      line_start = self.line_start if newlines == 0 else start + value.rfind('\n') + 1
+
+      tokens.append(Token(kind, value, start, self.line, start - self.line_start + 1,
+        end_line, end - line_start + 1, end))
+
+      self.line = end_line
+      self.line_start = line_start
+
+    return tokens
+
+  def skip_body(self):
+    """Skip to the end of the current function's endfunction line"""
+
+    match = _endfunction_regex.search(self.text, self.pos)
+    if match is None:
+      raise SyntaxError('Missing endfunction for function at line %d' % self.line)
+
+    self.line += self.text.count('\n', self.pos, match.end())
+    self.line_start = self.text.rfind('\n', 0, match.end()) + 1
+    self.pos = match.end()
+
+def _as_type(token):
+  return Token('TYPE', token.value, token.start_pos, token.line, token.column,
+    token.end_line, token.end_column, token.end_pos)
+
+def _scan_func_declr(tokens):
+  # [CONSTANT] (NATIVE|FUNCTION) ID TAKES (NOTHING | TYPE ID (COMMA TYPE ID)*) RETURNS (NOTHING | TYPE)
+  ofs = 1 if tokens[0].type == 'CONSTANT' else 0
+  id = tokens[1 + ofs]
+
+  takes = []
+  index = 3 + ofs
+  if tokens[index].type == 'NOTHING':
+    index += 1
+  else:
+    while True:
+      takes.append((_as_type(tokens[index]), tokens[index + 1]))
+      index += 2
+      if tokens[index].type != 'COMMA':
+        break
+      index += 1
+
+  returns = tokens[index + 1]
+  returns = None if returns.type == 'NOTHING' else _as_type(returns)
+
+  return id, takes, returns, bool(ofs)
+
+def _scan_global(tokens):
+  ofs = 1 if tokens[0].type == 'CONSTANT' else 0
+  type_ = _as_type(tokens[ofs])
+
+  if tokens[1 + ofs].type == 'ARRAY':
+    return GlobalVariable(tokens[2 + ofs], type_, is_array=True, equals=None, is_constant=bool(ofs),
+      line=tokens[0].line, column=tokens[0].column)
+
+  equals = tokens[3 + ofs:] if len(tokens) > 2 + ofs else None
+  return GlobalVariable(tokens[1 + ofs], type_, is_array=False, equals=equals, is_constant=bool(ofs),
+    line=tokens[0].line, column=tokens[0].column)
+
+def shift_script(script, lines, chars):
+  """Move every position in a script by a number of lines and characters
+
+  Columns are left alone, so this is only right for text that was cut at
+  the start of a line.
+  """
+
+  for symbols in (script.types, script.natives, script.globals, script.functions):
+    for symbol in symbols:
+      shift_symbol(symbol, lines, chars)
+
+  shift_tokens(script.comments, lines, chars)
+
+def _function_at(functions, line):
+  """Get the index of the last function starting on or before a line, or -1"""
+
+  low = 0
+  high = len(functions)
+  while low < high:
+    middle = (low + high) // 2
+    if functions[middle].line <= line:
+      low = middle + 1
+    else:
+      high = middle
+
+  return low - 1
+
+def _line_start(text, function):
+  return text.rfind('\n', 0, function.id.start_pos) + 1
+
+def _offset(text, functions, line, column):
+  """Get the offset of a line and column, counting from the closest function"""
+
+  index = _function_at(functions, line)
+  if index == -1:
+    current, position = 1, 0
+  else:
+    current, position = functions[index].line, _line_start(text, functions[index])
+
+  while current < line:
+    position = text.index('\n', position) + 1
+    current += 1
+
+  return position + column - 1
+
+def _parse_chunk(chunk):
+  # Runs in a worker process, scripts are sent back in their compact form
+  # Lark's errors can't be pickled, the caller reparses to raise them
+  text, lines, chars = chunk
+  try:
+    script = JassParser.parse(text)
+  except lark.exceptions.LarkError:
+    return None
+  shift_script(script, lines, chars)
+
+  return dump_script(script)
+
 class JassParser():
-  _build_space_before = [
+  _build_space_before = frozenset([
     'TAKES', 'RETURNS', 'EXTENDS',
     'THEN',
-    'AND', 'OR'
-  ]
+    'AND', 'OR',
+    'COMMENT'
+  ])
 
-  _build_space_after = [
+  _build_space_after = frozenset([
     'CONSTANT', 'NATIVE', 'KTYPE', 'TYPE', 'ARRAY', 'EXTENDS',
     'FUNCTION', 'TAKES', 'RETURNS',
     'SET', 'CALL', 'LOCAL', 'EXITWHEN', 'DEBUG',
     'IF', 'ELSEIF', 'ELSE', 'RETURN',
     'AND', 'OR', 'NOT'
-  ]
+  ])
 
-  _lark = None
+  # How many characters are built before they're written to the stream
+  build_chunk_size = 1 << 16
 
-  def _get_lark():
-    if JassParser._lark is None:
-      JassParser._lark = Lark(grammar, parser="lalr", transformer=JassScriptTransformer())
+  _lark = {}
 
-    return JassParser._lark
+  # Comments are collected by the transformer, one parse at a time
+  _comments_lock = threading.Lock()
 
-  def lex(text):
-    """Get tokens from text"""
+  # Where the analyzed grammar is stored, None to always analyze it
+  grammar_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'war3structs')
 
-    return list(JassParser._get_lark().lex(text))
+  def grammar_cache_path(directory=None):
+    """Get the path of the analyzed grammar for this grammar version"""
 
-  def parse(text):
-    """Get the AST of JASS code"""
+    if directory is None:
+      directory = JassParser.grammar_cache_dir
 
-    return JassParser._get_lark().parse(text)
+    # The name changes with the grammar, so a stale file is never loaded
+    name = 'jass-grammar-%s-py%d%d.lark' % ((grammar_version[:16],) + sys.version_info[:2])
+    return os.path.join(directory, name)
 
-  def parse_comments(text):
-    """Get comments present in the text by their line numbers"""
+  def compile_grammar(directory=None):
+    """Analyze the grammar and store the parser tables, e.g. at build time"""
 
-    lineno = 1
-    comments = {}
+    path = JassParser.grammar_cache_path(directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-    for line in text.splitlines():
-      comment_index = line.find('//')
-      quote_index = line.find('"')
+    if os.path.exists(path):
+      os.remove(path)
+    Lark(grammar, parser="lalr", transformer=JassScriptTransformer(), cache=path)
 
-      if quote_index < comment_index:
-        # Remove the quote in case the // is inside it
-        line = re.sub(r'"(\\"|\\\\|[^"])*"', '', line)
-        comment_index = line.find('//')
+    return path
 
-      if comment_index != -1:
-        comments[lineno] = line[comment_index:]
+  def _get_lark(compact=False, comments=False):
+    key = (compact, comments)
 
-      lineno += 1
+    if not key in JassParser._lark:
+      cache = None
+      if JassParser.grammar_cache_dir is not None:
+        cache = JassParser.grammar_cache_path()
+        try:
+          os.makedirs(os.path.dirname(cache), exist_ok=True)
+        except OSError:
+          cache = None
 
-    return comments
+      transformer = JassScriptTransformer(compact=compact, keep_comments=comments)
+      callbacks = {'COMMENT': transformer.comment} if comments else {}
+      try:
+        JassParser._lark[key] = Lark(grammar, parser="lalr", transformer=transformer, cache=cache or False,
+          lexer_callbacks=callbacks)
+      except OSError:
+        # Couldn't write the tables, analyze without caching them
+        JassParser._lark[key] = Lark(grammar, parser="lalr", transformer=transformer, lexer_callbacks=callbacks)
 
-  def build(ast):
-    """Build a JASS script from an AST"""
+    return JassParser._lark[key]
 
-    stream = io.StringIO('')
-
-    with stream:
-      gen = ast.get_conga_line()
-      cur = next(gen, None)
+  def lex(text):
+    """Get tokens from text"""
 
-      while cur is not None:
-        nxt = next(gen, None)
+    return list(JassParser._get_lark().lex(text))
 
-        if cur.type == 'NEWLINE':
-          val = '\n'
-        else:
-          if cur.type in JassParser._build_space_before:
-            val = ' '
+  def parse(text, cache=None, compact=False, comments=False):
+    """Get the AST of JASS code
+
+    With a JassParseCache, previously parsed texts are loaded from it.
+    With compact, statements and initializers are stored in TokenArrays,
+    which takes a fraction of the memory of lists of tokens.
+    With comments, the comments are kept, attached to the symbols and
+    statements they're on or before, so build reproduces them. The cache
+    doesn't store comments and isn't used then.
+    """
+
+    if comments:
+      lark_ = JassParser._get_lark(compact, comments=True)
+      with JassParser._comments_lock:
+        lark_.options.transformer.reset()
+        return lark_.parse(text)
+
+    if cache is not None:
+      script = cache.parse(text)
+      return compact_script(script) if compact else script
+
+    return JassParser._get_lark(compact).parse(text)
+
+  def split(text, chunk_size=262144):
+    """Split JASS code at top-level boundaries for parse_parallel
+
+    The declarations before the first function are one chunk, functions
+    are grouped into chunks of about chunk_size characters. Chunks are
+    (text, lines, chars) with the number of lines and characters before
+    them.
+    """
+
+    # Functions start at the beginning of their line
+    starts = [text.rfind('\n', 0, function.id.start_pos) + 1
+      for function in JassParser.scan(text).functions]
+
+    boundaries = [0]
+    for index, start in enumerate(starts):
+      if index == 0 or start - boundaries[-1] >= chunk_size:
+        boundaries.append(start)
+    boundaries.append(len(text))
+
+    chunks = []
+    lines = 0
+    for start, end in zip(boundaries, boundaries[1:]):
+      if start == end:
+        continue
+
+      chunks.append((text[start:end], lines, start))
+      lines += text.count('\n', start, end)
+
+    return chunks
+
+  def parse_parallel(text, processes=None, chunk_size=262144, compact=False):
+    """Get the AST of JASS code, parsing chunks of it in a process pool
+
+    The result is the same as parse's. Scripts that fit in a single
+    chunk, and scripts with syntax errors (to raise the same error), are
+    parsed serially.
+    """
+
+    try:
+      chunks = JassParser.split(text, chunk_size)
+    except SyntaxError:
+      return JassParser.parse(text, compact=compact)
+
+    if len(chunks) < 2:
+      return JassParser.parse(text, compact=compact)
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+      parts = list(executor.map(_parse_chunk, chunks))
+
+    if None in parts:
+      return JassParser.parse(text, compact=compact)
+    parts = [load_script(data) for data in parts]
+
+    script = JassScript(
+      [symbol for part in parts for symbol in part.types],
+      [symbol for part in parts for symbol in part.natives],
+      [symbol for part in parts for symbol in part.globals],
+      [symbol for part in parts for symbol in part.functions])
+
+    return compact_script(script) if compact else script
+
+  def reparse(script, text, start, end, replacement, compact=False, comments=False):
+    """Update a script for an edit of the text it was parsed from
+
+    start and end are the (line, column) of the replaced range in text,
+    starting at 1 like the tokens' positions. Only the declarations or
+    functions the edit touches are parsed again, the following symbols
+    are moved. The script is updated in place and returned.
+
+    Moving the following functions only updates their headers, their
+    bodies are moved when they're next accessed. An edit costs parsing
+    its region plus a few updates per following function, not per token
+    of the rest of the script.
+    """
+
+    functions = script.functions
+    start_offset = _offset(text, functions, *start)
+    end_offset = _offset(text, functions, *end)
+    new_text = text[:start_offset] + replacement + text[end_offset:]
+
+    # The edit is in the declarations (-1) or functions first to last,
+    # each function runs up to the next one
+    first = _function_at(functions, start[0])
+    last = _function_at(functions, end[0])
+
+    region_start = 0 if first == -1 else _line_start(text, functions[first])
+    region_line = 1 if first == -1 else functions[first].line
+    region_end = _line_start(text, functions[last + 1]) if last + 1 < len(functions) else len(text)
+
+    chars = len(replacement) - (end_offset - start_offset)
+    lines = replacement.count('\n') - text.count('\n', start_offset, end_offset)
+
+    try:
+      parsed = JassParser.parse(new_text[region_start:region_end + chars], compact=compact, comments=comments)
+    except lark.exceptions.LarkError:
+      parsed = None
+
+    # Declarations can only be added to the declarations, anything else
+    # is up to the full parse (which raises syntax errors)
+    if parsed is None or (first != -1 and (parsed.types or parsed.natives or parsed.globals)):
+      new = JassParser.parse(new_text, compact=compact, comments=comments)
+      script.types, script.natives, script.globals, script.functions = new.types, new.natives, new.globals, new.functions
+      script.comments = new.comments
+      script.reindex()
+      return script
+
+    shift_script(parsed, region_line - 1, region_start)
+
+    following = functions[last + 1:]
+    for function in following:
+      shift_symbol(function, lines, chars)
+
+    # Comments go to the next symbol: the ones before the region to the
+    # first parsed function, the ones at the end of it to the next one
+    pending = []
+    if first != -1:
+      pending = [comment for comment in functions[first].comments if comment.line < functions[first].line]
+      if len(parsed.functions) > 0:
+        parsed.functions[0].comments[:0] = pending
+        pending = []
+    pending.extend(parsed.comments)
+
+    if first == -1:
+      script.types = parsed.types
+      script.natives = parsed.natives
+      script.globals = parsed.globals
+
+    script.functions = functions[:max(first, 0)] + parsed.functions + following
+
+    if len(following) == 0:
+      script.comments = pending
+    else:
+      # Its leading comments are in the region, parsed again
+      head = following[0]
+      head.comments = pending + [comment for comment in head.comments if comment.line >= head.line]
+      shift_tokens(script.comments, lines, chars)
+
+    script.reindex()
+    return script
+
+  def scan(text):
+    """Get the symbols of JASS code without parsing function bodies
+
+    Functions are returned without locals and statements (both are None),
+    JassParser.parse_body can fill them in later.
+    """
+
+    scanner = _JassScanner(text)
+    types = []
+    natives = []
+    globals = []
+    functions = []
+    in_globals = False
+
+    while True:
+      tokens = scanner.next_line()
+      if not tokens:
+        break
+
+      first = tokens[0]
+      kind = first.type
+      if kind == 'CONSTANT' and len(tokens) > 1 and tokens[1].type in ('NATIVE', 'FUNCTION'):
+        kind = tokens[1].type
+
+      try:
+        if in_globals:
+          if kind == 'ENDGLOBALS':
+            in_globals = False
           else:
-            val = ''
-          val += cur.value
-          if (cur.type in JassParser._build_space_after and
-            not nxt is None and not nxt.type == 'NEWLINE'):
-            val += ' '
+            globals.append(_scan_global(tokens))
+        elif kind == 'GLOBALS':
+          in_globals = True
+        elif kind == 'KTYPE':
+          extends = tokens[3]
+          types.append(Type(tokens[1], extends, line=first.line, column=first.column))
+        elif kind == 'NATIVE':
+          id, takes, returns, is_constant = _scan_func_declr(tokens)
+          natives.append(Function(id, takes, returns, is_constant, is_native=True,
+            line=first.line, column=first.column))
+        elif kind == 'FUNCTION':
+          id, takes, returns, is_constant = _scan_func_declr(tokens)
+          functions.append(FunctionDefinition(id, takes, returns, is_constant, locals=None, statements=None,
+            line=first.line, column=first.column))
+          scanner.skip_body()
+        else:
+          raise SyntaxError('Unexpected %s at line %d column %d' % (first.type, first.line, first.column))
+      except IndexError:
+        raise SyntaxError('Incomplete declaration at line %d' % first.line)
+
+    return JassScript(types, natives, globals, functions)
+
+  def parse_body(text, function):
+    """Parse the locals and statements of a scanned function"""
+
+    start = text.rfind('\n', 0, function.id.start_pos) + 1
+    match = _endfunction_regex.search(text, function.id.start_pos)
+    if match is None:
+      raise SyntaxError('Missing endfunction for function at line %d' % function.line)
+
+    parsed = JassParser.parse(text[start:match.end()] + '\n').functions[0]
+    shift_script(JassScript([], [], [], [parsed]), function.line - 1, start)
+
+    function.locals = parsed.locals
+    function.statements = parsed.statements
 
-        stream.write(val)
-        cur = nxt
+    return function
+
+  def parse_comments(text):
+    """Get comments present in the text by their line numbers"""
+
+    comments = {}
+    lineno = 1
+    position = 0
+
+    for match in _comment_regex.finditer(text):
+      comment = match.group(1)
+      if comment is None:
+        continue
+
+      lineno += text.count('\n', position, match.start())
+      position = match.start()
+      comments[lineno] = comment
+
+    return comments
 
-      return stream.getvalue()
+  def build(ast, stream=None, encoding='utf-8'):
+    """Build a JASS script from an AST
+
+    If a stream is given the script is written to it in chunks as it is
+    built, otherwise it is returned. Binary streams get it encoded.
+    """
+
+    if stream is None:
+      with io.StringIO('') as stream:
+        JassParser.build(ast, stream)
+        return stream.getvalue()
+
+    binary = isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', '')
+    space_before = JassParser._build_space_before
+    space_after = JassParser._build_space_after
+    chunk_size = JassParser.build_chunk_size
+
+    chunk = []
+    size = 0
+    line = []
+    space = False
+
+    for token in ast.get_conga_line():
+      type_ = token.type
+
+      # Lines are joined as they end, there's no space at the end
+      if type_ == 'NEWLINE':
+        line.append('\n')
+        fragment = ''.join(line)
+        chunk.append(fragment)
+        size += len(fragment)
+        line = []
+        space = False
+
+        if size >= chunk_size:
+          data = ''.join(chunk)
+          stream.write(data.encode(encoding) if binary else data)
+          chunk = []
+          size = 0
+        continue
+
+      if space:
+        line.append(' ')
+      if type_ in space_before and line:
+        line.append(' ')
+      line.append(token.value)
+      space = type_ in space_after
+
+    chunk.append(''.join(line))
+    data = ''.join(chunk)
+    if data:
+      stream.write(data.encode(encoding) if binary else data)
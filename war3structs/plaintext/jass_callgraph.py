@@ -0,0 +1,242 @@
+from array import array
+
+"""
+  JASS call graph
+
+  A graph of which symbols reference which, built once from a
+  JassScript. Nodes are the natives, globals and functions of the
+  script, plus the names it uses without declaring them (e.g. natives of
+  common.j), which are external. Functions reference what the ID tokens
+  of their statements and local initializers name, except for their
+  parameters and locals, which shadow globals. Globals reference what
+  their initializers name.
+
+  Nodes are numbered, edges are stored per node in arrays of node
+  numbers, in both directions.
+"""
+
+def _name(id):
+  return getattr(id, 'value', id)
+
+def _references(symbol):
+  """Get the names a function or global refers to"""
+
+  names = set()
+
+  equals = getattr(symbol, 'equals', None)
+  if not equals is None:
+    names.update(token.value for token in equals if token.type == 'ID')
+
+  statements = getattr(symbol, 'statements', None)
+  if not statements is None:
+    shadowed = set(_name(takes[1]) for takes in symbol.takes)
+    shadowed.update(_name(local.id) for local in symbol.locals)
+
+    for local in symbol.locals:
+      if not local.equals is None:
+        names.update(token.value for token in local.equals if token.type == 'ID')
+
+    for statement in statements:
+      names.update(token.value for token in statement if token.type == 'ID')
+
+    names -= shadowed
+
+  return names
+
+class JassCallGraph():
+  def __init__(self, script):
+    """Build the graph of a script."""
+
+    self.names = []
+    self.kinds = []
+    self.nodes = {}
+    self.edges = []
+    self.reverse = []
+
+    # Declarations first, so references resolve to them
+    for kind, symbols in (('native', script.natives), ('global', script.globals), ('function', script.functions)):
+      for symbol in symbols:
+        self._node(_name(symbol.id), kind)
+
+    for symbol in script.globals + script.functions:
+      self._set_edges(self.nodes[_name(symbol.id)], _references(symbol))
+
+  def _node(self, name, kind='external'):
+    node = self.nodes.get(name)
+
+    if node is None:
+      node = len(self.names)
+      self.nodes[name] = node
+      self.names.append(name)
+      self.kinds.append(kind)
+      self.edges.append(array('I'))
+      self.reverse.append(array('I'))
+
+    return node
+
+  def _set_edges(self, node, names):
+    for target in self.edges[node]:
+      self.reverse[target].remove(node)
+
+    targets = sorted(set(self._node(name) for name in names))
+    self.edges[node] = array('I', targets)
+
+    for target in targets:
+      self.reverse[target].append(node)
+
+  def _closure(self, nodes, adjacency):
+    seen = bytearray(len(self.names))
+    pending = list(nodes)
+    for node in pending:
+      seen[node] = 1
+
+    while pending:
+      node = pending.pop()
+      for target in adjacency[node]:
+        if not seen[target]:
+          seen[target] = 1
+          pending.append(target)
+
+    return seen
+
+  def _nodes(self, names):
+    if isinstance(names, str):
+      names = [names]
+
+    return [self.nodes[name] for name in names if name in self.nodes]
+
+  def __contains__(self, name):
+    return name in self.nodes
+
+  def kind(self, name):
+    """Get whether a name is a native, global, function or external"""
+
+    return self.kinds[self.nodes[name]]
+
+  def callees(self, name):
+    """Get the names a function or global refers to directly"""
+
+    return [self.names[node] for node in self.edges[self.nodes[name]]]
+
+  def callers(self, name):
+    """Get the functions and globals that refer to a name directly"""
+
+    return [self.names[node] for node in self.reverse[self.nodes[name]]]
+
+  def reachable(self, roots):
+    """Get every name transitively referenced from the roots, roots included"""
+
+    seen = self._closure(self._nodes(roots), self.edges)
+    return set(self.names[node] for node in range(len(seen)) if seen[node])
+
+  def dependents(self, name):
+    """Get every function and global that transitively refers to a name
+
+    The name itself is included when it's recursive.
+    """
+
+    # Starting from the callers, the name is only seen again through a cycle
+    seen = self._closure(self.reverse[self.nodes[name]], self.reverse)
+    return set(self.names[node] for node in range(len(seen)) if seen[node])
+
+  def used_natives(self, roots=None, external=False):
+    """Get the natives referred to by the script, or reachable from roots
+
+    With external, names that aren't declared in the script are included.
+    """
+
+    if roots is None:
+      used = [node for node in range(len(self.names)) if len(self.reverse[node]) > 0]
+    else:
+      seen = self._closure(self._nodes(roots), self.edges)
+      used = [node for node in range(len(seen)) if seen[node]]
+
+    kinds = ('native', 'external') if external else ('native',)
+    return set(self.names[node] for node in used if self.kinds[node] in kinds)
+
+  def components(self):
+    """Get the strongly connected components, in reverse topological order"""
+
+    # Tarjan's algorithm, with an explicit stack instead of recursion
+    count = len(self.names)
+    index = [-1] * count
+    lowlink = [0] * count
+    on_stack = bytearray(count)
+    stack = []
+    components = []
+    next_index = 0
+
+    for root in range(count):
+      if index[root] != -1:
+        continue
+
+      work = [(root, 0)]
+      while work:
+        node, position = work.pop()
+
+        if position == 0:
+          index[node] = lowlink[node] = next_index
+          next_index += 1
+          stack.append(node)
+          on_stack[node] = 1
+
+        edges = self.edges[node]
+        recursed = False
+        while position < len(edges):
+          target = edges[position]
+          position += 1
+
+          if index[target] == -1:
+            work.append((node, position))
+            work.append((target, 0))
+            recursed = True
+            break
+          elif on_stack[target]:
+            lowlink[node] = min(lowlink[node], index[target])
+
+        if recursed:
+          continue
+
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack[member] = 0
+            component.append(self.names[member])
+            if member == node:
+              break
+          components.append(component)
+
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+    return components
+
+  def recursive(self):
+    """Get the groups of functions that can call themselves"""
+
+    groups = []
+    for component in self.components():
+      if len(component) > 1:
+        groups.append(component)
+      else:
+        node = self.nodes[component[0]]
+        if node in self.edges[node]:
+          groups.append(component)
+
+    return groups
+
+  def update(self, function):
+    """Update the references of a function, e.g. after replacing its statements"""
+
+    node = self._node(_name(function.id), 'function')
+    self.kinds[node] = 'function'
+    self._set_edges(node, _references(function))
+
+  def remove(self, name):
+    """Remove the references of a symbol, leaving it as an external name"""
+
+    node = self.nodes[name]
+    self._set_edges(node, ())
+    self.kinds[node] = 'external'
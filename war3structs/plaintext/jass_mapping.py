@@ -1,3 +1,8 @@
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from collections.abc import MutableSequence
+
 from lark import Transformer, Token
 
 #
@@ -18,6 +23,7 @@ class Symbol():
     self.line = line
     self.column = column
     self.id = id
+    self.comments = []
 
 
 class Function(Symbol):
@@ -52,11 +58,74 @@ class GlobalVariable(Variable):
 class FunctionDefinition(Function):
   def __init__(self, id, takes, returns, is_constant, locals, statements, line=None, column=None):
     super().__init__(id, takes, returns, is_constant, is_native=False, line=line, column=column)
+
+    # Lines and characters the body still has to be moved by, see shift
+    self._shift = None
+
     self.locals = locals
     self.statements = statements
 
+    # Comments by the index of the statement they're on or before, the
+    # ones after the last statement are at len(statements)
+    self.statement_comments = {}
+
+  def shift(self, lines, chars):
+    """Move the positions of the body by a number of lines and characters
+
+    The body is only moved when it's next accessed, so moving functions
+    around costs the same whatever the size of their bodies.
+    """
+    if self._shift is None:
+      self._shift = (lines, chars)
+    else:
+      self._shift = (self._shift[0] + lines, self._shift[1] + chars)
+
+  def _settle(self):
+    if self._shift is None:
+      return
+
+    lines, chars = self._shift
+    self._shift = None
+
+    for local in self._locals or []:
+      shift_symbol(local, lines, chars)
+    for statement in self._statements or []:
+      shift_tokens(statement, lines, chars)
+    for comments in self._statement_comments.values():
+      shift_tokens(comments, lines, chars)
+
+  @property
+  def locals(self):
+    self._settle()
+    return self._locals
+
+  @locals.setter
+  def locals(self, locals):
+    self._settle()
+    self._locals = locals
+
+  @property
+  def statements(self):
+    self._settle()
+    return self._statements
+
+  @statements.setter
+  def statements(self, statements):
+    self._settle()
+    self._statements = statements
+
+  @property
+  def statement_comments(self):
+    self._settle()
+    return self._statement_comments
+
+  @statement_comments.setter
+  def statement_comments(self, statement_comments):
+    self._settle()
+    self._statement_comments = statement_comments
+
   def rename_local(self, old_id, new_id):
-    for local in self.locals:
+    for local in self.locals or []:
       if local.id == old_id:
         local.id = new_id
       elif not local.equals is None:
@@ -64,11 +133,67 @@ class FunctionDefinition(Function):
           if token.value == old_id and token.type == 'ID':
             token.value = new_id
 
-    for statement in self.statements:
+    for statement in self.statements or []:
       for token in statement:
         if token.value == old_id and token.type == 'ID':
           token.value = new_id
 
+  def rename_locals(self, mapping):
+    """Rename many locals at once, mapping is a dict of old to new ids"""
+
+    for local in self.locals or []:
+      local.id = mapping.get(getattr(local.id, 'value', local.id), local.id)
+
+      if not local.equals is None:
+        for token in local.equals:
+          if token.type == 'ID' and token.value in mapping:
+            token.value = mapping[token.value]
+
+    for statement in self.statements or []:
+      for token in statement:
+        if token.type == 'ID' and token.value in mapping:
+          token.value = mapping[token.value]
+
+
+
+def shift_tokens(tokens, lines, chars):
+  """Move the positions of tokens by a number of lines and characters"""
+
+  if tokens is None:
+    return
+
+  for token in tokens:
+    # Tokens made after parsing may have no position, the lexer doesn't
+    # give ignored ones (comments) an end
+    if isinstance(token, Token) and not token.line is None:
+      token.line += lines
+      token.start_pos += chars
+      if not token.end_line is None:
+        token.end_line += lines
+        token.end_pos += chars
+
+def shift_symbol(symbol, lines, chars):
+  """Move the positions of a symbol by a number of lines and characters
+
+  Function bodies are moved lazily, see FunctionDefinition.shift.
+  """
+  symbol.line += lines
+  shift_tokens([symbol.id], lines, chars)
+  shift_tokens(symbol.comments, lines, chars)
+
+  if isinstance(symbol, Type):
+    shift_tokens([symbol.extends], lines, chars)
+  elif isinstance(symbol, Variable):
+    shift_tokens([symbol.type], lines, chars)
+    shift_tokens(symbol.equals, lines, chars)
+  elif isinstance(symbol, Function):
+    for takes in symbol.takes:
+      shift_tokens(takes, lines, chars)
+    shift_tokens([symbol.returns], lines, chars)
+
+    if isinstance(symbol, FunctionDefinition):
+      symbol.shift(lines, chars)
+
 
 class Node():
   """Node class
@@ -86,16 +211,441 @@ class Node():
         self.tokens.append(child)
 
 
+def _name(id):
+  return getattr(id, 'value', id)
+
+
+#
+# Statements and initializers can also be stored compactly, as arrays of
+# token types, values and positions. Values are interned in a table that
+# is shared by the whole script. Tokens are only created when accessed,
+# as views that read from and write to the arrays. The views are Tokens
+# and can be used like any other, but refer to a position in the array:
+# inserting or deleting before them shifts what they point to.
+#
+
+class TokenTable():
+  """Interned token values"""
+
+  def __init__(self):
+    self.values = []
+    self.ids = {}
+
+  def intern(self, value):
+    index = self.ids.get(value)
+    if index is None:
+      index = self.ids[value] = len(self.values)
+      self.values.append(value)
+
+    return index
+
+
+# Token types are stored as their index in this list
+_token_types = []
+_token_type_ids = {}
+
+def _token_type(type_):
+  index = _token_type_ids.get(type_)
+  if index is None:
+    index = _token_type_ids[type_] = len(_token_types)
+    _token_types.append(type_)
+
+  return index
+
+_token_positions = ('start_pos', 'line', 'column', 'end_line', 'end_column', 'end_pos')
+
+
+def _position_property(index):
+  def get(self):
+    value = self._array.positions[self._index * 6 + index]
+    return None if value < 0 else value
+
+  def set(self, value):
+    self._array.positions[self._index * 6 + index] = -1 if value is None else value
+
+  return property(get, set)
+
+
+class _TokenView(Token):
+  __slots__ = ('_array', '_index')
+
+  def __new__(cls, tokens, index):
+    # Token.__new__ would set the attributes below on the instance
+    view = str.__new__(cls, tokens.table.values[tokens.values[index]])
+    view._array = tokens
+    view._index = index
+    return view
+
+  @property
+  def type(self):
+    return _token_types[self._array.types[self._index]]
+
+  @type.setter
+  def type(self, type_):
+    self._array.types[self._index] = _token_type(type_)
+
+  @property
+  def value(self):
+    return self._array.table.values[self._array.values[self._index]]
+
+  @value.setter
+  def value(self, value):
+    self._array.values[self._index] = self._array.table.intern(value)
+
+  start_pos = _position_property(0)
+  line = _position_property(1)
+  column = _position_property(2)
+  end_line = _position_property(3)
+  end_column = _position_property(4)
+  end_pos = _position_property(5)
+
+
+class TokenArray(MutableSequence):
+  """TokenArray class
+
+  A list of tokens stored in arrays, see above. The six positions of a
+  token are stored one after the other, missing ones as -1.
+  """
+  __slots__ = ('table', 'types', 'values', 'positions')
+
+  def __init__(self, tokens=(), table=None):
+    self.table = table if not table is None else TokenTable()
+    self.types = array('B')
+    self.values = array('I')
+    self.positions = array('i')
+
+    for token in tokens:
+      self.append(token)
+
+  def token(self, index):
+    """Get a plain Token copy of a token"""
+
+    view = self[index]
+    return Token(view.type, view.value, view.start_pos, view.line, view.column,
+      view.end_line, view.end_column, view.end_pos)
+
+  def _row(self, token):
+    positions = [getattr(token, name, None) for name in _token_positions]
+    return (_token_type(token.type), self.table.intern(token.value),
+      array('i', [-1 if position is None else position for position in positions]))
+
+  def insert(self, index, token):
+    type_, value, positions = self._row(token)
+    index = min(max(index + len(self.types) if index < 0 else index, 0), len(self.types))
+
+    self.types.insert(index, type_)
+    self.values.insert(index, value)
+    self.positions[index * 6:index * 6] = positions
+
+  def append(self, token):
+    type_, value, positions = self._row(token)
+
+    self.types.append(type_)
+    self.values.append(value)
+    self.positions.extend(positions)
+
+  def _index(self, index):
+    if index < 0:
+      index += len(self.types)
+    if index < 0 or index >= len(self.types):
+      raise IndexError('token index out of range')
+
+    return index
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [_TokenView(self, i) for i in range(*index.indices(len(self.types)))]
+
+    return _TokenView(self, self._index(index))
+
+  def __setitem__(self, index, token):
+    if isinstance(index, slice):
+      # Copy everything first, the new tokens may be views of this array
+      tokens = [self.token(i) for i in range(len(self.types))]
+      tokens[index] = [Token(t.type, t.value, t.start_pos, t.line, t.column,
+        t.end_line, t.end_column, t.end_pos) for t in token]
+
+      del self[:]
+      for t in tokens:
+        self.append(t)
+      return
+
+    index = self._index(index)
+    type_, value, positions = self._row(token)
+
+    self.types[index] = type_
+    self.values[index] = value
+    self.positions[index * 6:index * 6 + 6] = positions
+
+  def __delitem__(self, index):
+    if isinstance(index, slice):
+      for i in sorted(range(*index.indices(len(self.types))), reverse=True):
+        del self[i]
+      return
+
+    index = self._index(index)
+    del self.types[index]
+    del self.values[index]
+    del self.positions[index * 6:index * 6 + 6]
+
+  def __len__(self):
+    return len(self.types)
+
+  def __iter__(self):
+    for index in range(len(self.types)):
+      yield _TokenView(self, index)
+
+  def __repr__(self):
+    return 'TokenArray(%r)' % list(self)
+
+
+def compact_script(script, table=None):
+  """Store the statements and initializers of a script in token arrays"""
+
+  if table is None:
+    table = TokenTable()
+
+  def compact(tokens):
+    return tokens if tokens is None or isinstance(tokens, TokenArray) else TokenArray(tokens, table)
+
+  for global_ in script.globals:
+    global_.equals = compact(global_.equals)
+
+  for function in script.functions:
+    for local in function.locals or []:
+      local.equals = compact(local.equals)
+
+    if not function.statements is None:
+      function.statements = [compact(statement) for statement in function.statements]
+
+  # The references are tokens, which were replaced
+  script.reindex()
+
+  return script
+
+
+#
+# Comments are attached to the symbol or statement on their line, or
+# else the next one. The ones after the last symbol are the script's.
+#
+
+def attach_comments(script, comments, function_ends=None):
+  """Attach comment tokens to the symbols and statements of a script
+
+  function_ends maps the id of a FunctionDefinition to the line of its
+  endfunction, so the comments before it stay in the function.
+  """
+
+  anchors = []
+  for symbol in chain(script.types, script.natives, script.globals):
+    anchors.append((symbol.line, symbol.line, symbol, None))
+
+  for function in script.functions:
+    anchors.append((function.line, function.line, function, None))
+
+    for local in function.locals or []:
+      anchors.append((local.line, local.line, local, None))
+
+    if function.statements is None:
+      continue
+
+    for index, statement in enumerate(function.statements):
+      if len(statement) > 0:
+        last = statement[-1]
+        anchors.append((statement[0].line, last.end_line or last.line, function, index))
+
+    end = (function_ends or {}).get(id(function))
+    if not end is None:
+      anchors.append((end, end, function, len(function.statements)))
+
+  anchors = sorted((anchor for anchor in anchors if not anchor[0] is None), key=lambda anchor: anchor[0])
+  ends = [anchor[1] for anchor in anchors]
+
+  for comment in comments:
+    index = bisect_left(ends, comment.line)
+    if index == len(anchors):
+      script.comments.append(comment)
+      continue
+
+    _, _, target, statement = anchors[index]
+    if statement is None:
+      target.comments.append(comment)
+    else:
+      target.statement_comments.setdefault(statement, []).append(comment)
+
+def _leading_comments(comments, line):
+  for comment in comments:
+    if not line is None and not comment.line is None and comment.line < line:
+      yield comment
+      yield Token('NEWLINE', '\n')
+
+def _trailing_comments(comments, line):
+  for comment in comments:
+    if line is None or comment.line is None or comment.line >= line:
+      yield comment
+
+def _commented_statement(statement, comments):
+  first = statement[0].line if len(statement) > 0 else None
+  yield from _leading_comments(comments, first)
+
+  # Comments inside a block go at the end of their line, or on their own
+  # line before the next line with tokens
+  pending = list(_trailing_comments(comments, first))
+  line = None
+  for token in statement:
+    if token.type == 'NEWLINE':
+      while pending and not line is None and not pending[0].line is None and pending[0].line <= line:
+        yield pending.pop(0)
+    elif not token.line is None:
+      while pending and not pending[0].line is None and pending[0].line < token.line and not line is None:
+        yield pending.pop(0)
+        yield Token('NEWLINE', '\n')
+      line = token.line
+    yield token
+
+  yield from pending
+
+
+def _reference_key(reference):
+  # Views are created on access, identify them by their position
+  if isinstance(reference, _TokenView):
+    return (id(reference._array), reference._index)
+
+  return id(reference)
+
+
 class JassScript():
+  # Lookups go through the kinds in this order, the first symbol with a
+  # name in a kind is the one found
+  kinds = ('types', 'natives', 'globals', 'functions')
+
   def __init__(self, types, natives, globals, functions):
     self.types = types
     self.natives = natives
     self.globals = globals
     self.functions = functions
+    self.reindex()
+
+    # Comments that aren't attached to any symbol
+    self.comments = []
+
+  def reindex(self):
+    """Rebuild the indexes, needed after editing symbols or tokens directly"""
+
+    self._index_names()
+
+    # The references are only collected when first renaming
+    self.references = None
+
+  def _index_names(self):
+    self.index = {}
+    for attr in self.kinds:
+      names = {}
+      for symbol in getattr(self, attr):
+        names.setdefault(_name(symbol.id), symbol)
+      self.index[attr] = names
+
+  def _index_name(self, attr, name):
+    # Find the first symbol with the name again, after it changed
+    names = self.index[attr]
+    names.pop(name, None)
+
+    for symbol in getattr(self, attr):
+      if _name(symbol.id) == name:
+        names[name] = symbol
+        return
+
+  def _rename_in_index(self, attr, old_name, new_name):
+    names = self.index[attr]
+    if not old_name in names:
+      return
+
+    if new_name in names:
+      self._index_name(attr, old_name)
+      self._index_name(attr, new_name)
+    else:
+      names[new_name] = names.pop(old_name)
+
+  def _symbol_references(self, symbol):
+    # The symbol itself and the ID tokens in its initializers and
+    # statements. Locals and parameters are left to the function.
+    t = type(symbol)
+    if t == Type:
+      return
+
+    yield symbol
+
+    if t == GlobalVariable:
+      groups = [symbol.equals]
+    elif t == FunctionDefinition:
+      groups = [local.equals for local in symbol.locals or []] + list(symbol.statements or [])
+    else:
+      return
+
+    for tokens in groups:
+      if tokens is None:
+        continue
+
+      for token in tokens:
+        if isinstance(token, Token) and token.type == 'ID':
+          yield token
+
+  def _index_references(self, symbol):
+    if self.references is None:
+      return
+
+    for reference in self._symbol_references(symbol):
+      name = _name(reference.id if isinstance(reference, Symbol) else reference.value)
+      self.references.setdefault(name, {})[_reference_key(reference)] = reference
+
+  def _unindex_references(self, symbol):
+    if self.references is None:
+      return
+
+    for reference in self._symbol_references(symbol):
+      name = _name(reference.id if isinstance(reference, Symbol) else reference.value)
+      self.references.get(name, {}).pop(_reference_key(reference), None)
+
+  def _get_references(self):
+    # Maps names to the symbols declaring them and the tokens using them,
+    # by object id so they can be removed again
+    if self.references is None:
+      self.references = {}
+
+      for symbol in chain(self.natives, self.globals, self.functions):
+        self._index_references(symbol)
+
+    return self.references
+
+  def _rename_references(self, mapping):
+    references = self._get_references()
+    mapping = dict((_name(old_id), new_id) for old_id, new_id in mapping.items())
+
+    # Take them all out first, so a rename to a name that is renamed
+    # itself (a to b, b to c) isn't applied twice
+    moved = [(old_id, new_id, references.pop(old_id)) for old_id, new_id in mapping.items()
+      if old_id in references]
+
+    for old_id, new_id, renamed in moved:
+      for key, reference in list(renamed.items()):
+        if isinstance(reference, Symbol):
+          if _name(reference.id) == old_id:
+            reference.id = new_id
+            continue
+        elif reference.value == old_id:
+          reference.value = new_id
+          continue
+
+        # Renamed directly (e.g. by rename_local), it isn't a reference anymore
+        del renamed[key]
+
+    for old_id, new_id, renamed in moved:
+      references.setdefault(_name(new_id), {}).update(renamed)
 
   def _rename_type(self, symbol, new_id):
     old_id = str(symbol.id)
     symbol.id = new_id
+    self._rename_in_index('types', _name(old_id), _name(new_id))
 
     for type_ in self.types:
       if type_.extends == old_id:
@@ -121,7 +671,7 @@ class JassScript():
       if function.returns == old_id:
         function.returns = new_id
 
-      for local in function.locals:
+      for local in function.locals or []:
         if local.type == old_id:
           local.type = new_id
 
@@ -132,33 +682,44 @@ class JassScript():
       self._rename_type(symbol, new_id)
       return
 
-    for native in self.natives:
-      if native.id == old_id:
-        native.id = new_id
+    self._rename_references({old_id: new_id})
 
-    for global_ in self.globals:
-      if global_.id == old_id:
-        global_.id = new_id
+    for attr in ('natives', 'globals', 'functions'):
+      self._rename_in_index(attr, _name(old_id), _name(new_id))
 
-      if not global_.equals is None:
-        for token in global_.equals:
-          if token.value == old_id and token.type == 'ID':
-            token.value = new_id
+  def rename_many(self, mapping):
+    """Rename many symbols at once, mapping is a dict of old to new ids
 
-    for function in self.functions:
-      if function.id == old_id:
-        function.id = new_id
+    This is a single pass over the declarations, the references are
+    found through the reference index.
+    """
 
-      for local in function.locals:
-        if not local.equals is None:
-          for token in local.equals:
-            if token.value == old_id and token.type == 'ID':
-              token.value = new_id
+    types = dict((_name(old_id), new_id) for old_id, new_id in mapping.items()
+      if _name(old_id) in self.index['types'])
+    names = dict((old_id, new_id) for old_id, new_id in mapping.items()
+      if not _name(old_id) in types)
 
-      for statement in function.statements:
-        for token in statement:
-          if token.value == old_id and token.type == 'ID':
-            token.value = new_id
+    if len(types) > 0:
+      def renamed(type_):
+        return types.get(_name(type_), type_) if not type_ is None else None
+
+      for type_ in self.types:
+        type_.id = renamed(type_.id)
+        type_.extends = renamed(type_.extends)
+
+      for function in chain(self.natives, self.functions):
+        function.takes[:] = [(renamed(takes[0]), takes[1]) for takes in function.takes]
+        function.returns = renamed(function.returns)
+
+      for global_ in self.globals:
+        global_.type = renamed(global_.type)
+
+      for function in self.functions:
+        for local in function.locals or []:
+          local.type = renamed(local.type)
+
+    self._rename_references(names)
+    self._index_names()
 
   def _replace_in_list(self, attr, old, new):
     symbols = getattr(self, attr)
@@ -168,7 +729,26 @@ class JassScript():
           del symbols[index]
         else:
           symbols[index] = new
-        return
+        break
+    else:
+      return
+
+    self._unindex_references(old)
+    if not new is None:
+      self._index_references(new)
+
+    names = self.index[attr]
+    old_name = _name(old.id)
+
+    if not new is None and _name(new.id) == old_name:
+      if names.get(old_name) is old:
+        names[old_name] = new
+      return
+
+    if names.get(old_name) is old:
+      self._index_name(attr, old_name)
+    if not new is None:
+      self._index_name(attr, _name(new.id))
 
   def replace(self, old, new):
     t = type(old)
@@ -191,24 +771,40 @@ class JassScript():
     t = type(symbol)
 
     if t == Type:
-      self.types.append(symbol)
+      attr = 'types'
     elif t == Function:
-      self.natives.append(symbol)
+      attr = 'natives'
     elif t == GlobalVariable:
-      self.globals.append(symbol)
+      attr = 'globals'
     elif t == FunctionDefinition:
-      self.functions.append(symbol)
+      attr = 'functions'
     else:
       raise TypeError()
 
+    getattr(self, attr).append(symbol)
+    self.index[attr].setdefault(_name(symbol.id), symbol)
+    self._index_references(symbol)
+
   def __iter__(self):
-    for n in self.types + self.natives + self.globals + self.functions:
+    for n in chain(self.types, self.natives, self.globals, self.functions):
       yield n.id
 
+  def __contains__(self, key):
+    key = _name(key)
+
+    for attr in self.kinds:
+      if key in self.index[attr]:
+        return True
+
+    return False
+
   def __getitem__(self, key):
-    for n in self.types + self.natives + self.globals + self.functions:
-      if n.id == key:
-        return n
+    key = _name(key)
+
+    for attr in self.kinds:
+      symbol = self.index[attr].get(key)
+      if not symbol is None:
+        return symbol
 
     raise IndexError()
 
@@ -227,93 +823,160 @@ class JassScript():
 
     # I freely admit this is stupid
 
+    # Scanned functions have no bodies, building them would drop code
+    for function in self.functions:
+      if function.statements is None:
+        raise ValueError('function %s has no body, parse it with JassParser.parse_body before building' % _name(function.id))
+
     for type_ in self.types:
+      if type_.comments:
+        yield from _leading_comments(type_.comments, type_.line)
       yield Token('KTYPE', 'type')
-      yield Token('ID', type_.id)
+      yield Token('ID', _name(type_.id))
       yield Token('EXTENDS', 'extends')
-      yield Token('ID', type_.extends)
+      yield Token('ID', _name(type_.extends))
+      if type_.comments:
+        yield from _trailing_comments(type_.comments, type_.line)
       yield Token('NEWLINE', '\n')
 
     for native in self.natives:
+      if native.comments:
+        yield from _leading_comments(native.comments, native.line)
       if native.is_constant:
         yield Token('CONSTANT', 'constant')
       yield Token('NATIVE', 'native')
-      yield Token('ID', native.id)
+      yield Token('ID', _name(native.id))
       yield Token('TAKES', 'takes')
       if len(native.takes) > 0:
-        for takes in native.takes:
-          yield Token('TYPE', takes[0])
-          yield Token('ID', takes[1])
+        for index, takes in enumerate(native.takes):
+          if index > 0:
+            yield Token('COMMA', ',')
+          yield Token('TYPE', _name(takes[0]))
+          yield Token('ID', _name(takes[1]))
       else:
         yield Token('NOTHING', 'nothing')
       yield Token('RETURNS', 'returns')
       if native.returns is None:
         yield Token('NOTHING', 'nothing')
       else:
-        yield Token('TYPE', native.returns)
+        yield Token('TYPE', _name(native.returns))
+      if native.comments:
+        yield from _trailing_comments(native.comments, native.line)
       yield Token('NEWLINE', '\n')
 
     yield Token('GLOBALS', 'globals')
     yield Token('NEWLINE', '\n')
     for global_ in self.globals:
+      if global_.comments:
+        yield from _leading_comments(global_.comments, global_.line)
       if global_.is_constant:
         yield Token('CONSTANT', 'constant')
-      yield Token('TYPE', global_.type)
+      yield Token('TYPE', _name(global_.type))
       if global_.is_array:
         yield Token('ARRAY', 'array')
-      yield Token('ID', global_.id)
+      yield Token('ID', _name(global_.id))
       if not global_.equals is None:
         yield Token('EQUALS', '=')
         for token in global_.equals:
           yield token
+      if global_.comments:
+        yield from _trailing_comments(global_.comments, global_.line)
       yield Token('NEWLINE', '\n')
     yield Token('ENDGLOBALS', 'endglobals')
     yield Token('NEWLINE', '\n')
 
     for function in self.functions:
+      if function.comments:
+        yield from _leading_comments(function.comments, function.line)
       if function.is_constant:
         yield Token('CONSTANT', 'constant')
       yield Token('FUNCTION', 'function')
-      yield Token('ID', function.id)
+      yield Token('ID', _name(function.id))
       yield Token('TAKES', 'takes')
       if len(function.takes) > 0:
-        for takes in function.takes:
-          yield Token('TYPE', takes[0])
-          yield Token('ID', takes[1])
+        for index, takes in enumerate(function.takes):
+          if index > 0:
+            yield Token('COMMA', ',')
+          yield Token('TYPE', _name(takes[0]))
+          yield Token('ID', _name(takes[1]))
       else:
         yield Token('NOTHING', 'nothing')
       yield Token('RETURNS', 'returns')
       if function.returns is None:
         yield Token('NOTHING', 'nothing')
       else:
-        yield Token('TYPE', function.returns)
+        yield Token('TYPE', _name(function.returns))
+      if function.comments:
+        yield from _trailing_comments(function.comments, function.line)
       yield Token('NEWLINE', '\n')
       for local in function.locals:
+        if local.comments:
+          yield from _leading_comments(local.comments, local.line)
         yield Token('LOCAL', 'local')
-        yield Token('TYPE', local.type)
+        yield Token('TYPE', _name(local.type))
         if local.is_array:
           yield Token('ARRAY', 'array')
-        yield Token('ID', local.id)
+        yield Token('ID', _name(local.id))
         if not local.equals is None:
           yield Token('EQUALS', '=')
           for token in local.equals:
             yield token
+        if local.comments:
+          yield from _trailing_comments(local.comments, local.line)
         yield Token('NEWLINE', '\n')
-      for statement in function.statements:
-        for token in statement:
-          yield token
+      comments = function.statement_comments
+      for index, statement in enumerate(function.statements):
+        if index in comments:
+          yield from _commented_statement(statement, comments[index])
+        else:
+          for token in statement:
+            yield token
+        yield Token('NEWLINE', '\n')
+      for comment in comments.get(len(function.statements), []):
+        yield comment
         yield Token('NEWLINE', '\n')
       yield Token('ENDFUNCTION', 'endfunction')
       yield Token('NEWLINE', '\n')
 
+    for comment in self.comments:
+      yield comment
+      yield Token('NEWLINE', '\n')
+
 
 class JassScriptTransformer(Transformer):
   """JassScriptTransformer class
 
   A transformer that returns an instance of JassScript when parsed
   with.
+
+  In compact mode, statements and initializers are TokenArrays instead
+  of lists of tokens. To keep comments, comment() has to be the lexer
+  callback of COMMENT tokens.
   """
 
+  def __init__(self, compact=False, keep_comments=False):
+    super().__init__()
+    self.compact = compact
+    self.table = None
+    self.keep_comments = keep_comments
+    self.reset()
+
+  def reset(self):
+    self.comments = []
+    self.function_ends = {}
+
+  def comment(self, token):
+    self.comments.append(token)
+    return token
+
+  def _tokens(self, tokens):
+    if not self.compact:
+      return tokens
+
+    if self.table is None:
+      self.table = TokenTable()
+    return TokenArray(tokens, self.table)
+
   def expr(self, children):
     return Node(children)
 
@@ -321,7 +984,7 @@ class JassScriptTransformer(Transformer):
     return Node(children)
 
   def statements(self, children):
-    return list(map(lambda n: n.tokens, children[::2]))
+    return list(map(lambda n: self._tokens(n.tokens), children[::2]))
 
   def local_var_declr(self, children):
     num = len(children)
@@ -332,7 +995,7 @@ class JassScriptTransformer(Transformer):
       return Variable(children[3], children[1], is_array=True, equals=None,
         line=children[0].line, column=children[0].column)
     else:
-      equals = children[4].tokens if isinstance(children[4], Node) else [children[4]]
+      equals = self._tokens(children[4].tokens if isinstance(children[4], Node) else [children[4]])
       return Variable(children[2], children[1], is_array=False, equals=equals,
         line=children[0].line, column=children[0].column)
 
@@ -346,9 +1009,14 @@ class JassScriptTransformer(Transformer):
     ofs = 0 if children[0].type != 'CONSTANT' else 1
     takes = [] if not isinstance(children[3+ofs], list) else children[3+ofs]
     returns = None if children[5+ofs].type == 'NOTHING' else children[5+ofs]
-    return FunctionDefinition(children[1+ofs], takes, returns, bool(ofs), locals=children[7+ofs], statements=children[8+ofs],
+    function = FunctionDefinition(children[1+ofs], takes, returns, bool(ofs), locals=children[7+ofs], statements=children[8+ofs],
       line=children[0].line, column=children[0].column)
 
+    if self.keep_comments:
+      self.function_ends[id(function)] = children[-1].line
+
+    return function
+
   def global_var_declr(self, children):
     ofs = 0 if children[0].type != 'CONSTANT' else 1
     num = len(children) - ofs
@@ -360,7 +1028,7 @@ class JassScriptTransformer(Transformer):
         line=children[0].line, column=children[0].column)
     else:
       equals_child = children[3+ofs]
-      equals = equals_child.tokens if isinstance(equals_child, Node) else [equals_child]
+      equals = self._tokens(equals_child.tokens if isinstance(equals_child, Node) else [equals_child])
       return GlobalVariable(children[1+ofs], children[0+ofs], is_array=False, equals=equals, is_constant=bool(ofs),
         line=children[0].line, column=children[0].column)
 
@@ -395,4 +1063,13 @@ class JassScriptTransformer(Transformer):
       elif t == list:
         globals.extend(symbol)
 
-    return JassScript(types, natives, globals, functions)
+    # Every parse gets its own table
+    self.table = None
+
+    script = JassScript(types, natives, globals, functions)
+
+    if self.keep_comments:
+      attach_comments(script, self.comments, self.function_ends)
+      self.reset()
+
+    return script
@@ -0,0 +1,523 @@
+from collections import Counter
+from itertools import count, product
+
+from lark import Token
+from lark.exceptions import LarkError
+
+from .jass import JassParser, keywords
+from .jass_callgraph import JassCallGraph
+
+"""
+  JASS script optimizer
+
+  Passes that make a script smaller while keeping what it does, working
+  on a JassScript in place:
+
+  - fold: fold integer constant expressions, only when they're delimited
+    so that operator precedence can't change their meaning (after = ( ,
+    [ return exitwhen if elseif and before ) , ] then or the end)
+  - inline: calls to functions that only forward their parameters to
+    another function call that function directly, unless its name is
+    longer than the wrapper's
+  - unreachable: remove functions that can't be reached from main or
+    config in the call graph. Functions named in string literals
+    (ExecuteFunc) are kept.
+  - shorten: give globals, functions, parameters and locals the shortest
+    free names, the most referenced first. main, config, natives, types
+    and names in string literals keep theirs. Not run by default, see
+    below.
+
+  Names are only known to be used dynamically when a string literal is
+  the whole name. Names built at runtime, e.g. ExecuteFunc("Trig_" + s)
+  or names read from game cache, aren't seen: unreachable may remove
+  those functions and shorten may rename them. Reserve them, or leave
+  those passes out for such scripts.
+
+  The script is loaded along with common.j and Blizzard.j, whose names
+  it must not redeclare. They're only known by the names the script
+  uses, so shortening requires the names of those scripts to be
+  reserved, e.g. with declared_names of their texts. Without them, a
+  big enough script would get a function named like a native it never
+  uses (e.g. Or) and the map would fail to load.
+"""
+
+class JassOptimizerError(Exception):
+  def __init__(self, name, error):
+    super().__init__('Script does not parse after the %s pass: %s' % (name, error))
+    self.name = name
+    self.error = error
+
+#
+# Helpers
+#
+
+def _name(id):
+  return getattr(id, 'value', id)
+
+def _token_lists(script):
+  """Every list of tokens of a script"""
+
+  for global_ in script.globals:
+    if not global_.equals is None:
+      yield global_.equals
+
+  for function in script.functions:
+    yield from _function_token_lists(function)
+
+def _function_token_lists(function):
+  for local in function.locals or []:
+    if not local.equals is None:
+      yield local.equals
+
+  yield from function.statements or []
+
+def _string_names(script):
+  """Contents of every string literal, names in them are used dynamically"""
+
+  names = set()
+  for tokens in _token_lists(script):
+    for token in tokens:
+      if token.type == 'STRING_LITERAL':
+        names.add(token.value[1:-1])
+
+  return names
+
+class _SizeStream():
+  def __init__(self):
+    self.size = 0
+
+  def write(self, data):
+    self.size += len(data.encode('utf-8'))
+
+def script_size(script):
+  """Get the size in bytes of a built script, without building it in memory"""
+
+  stream = _SizeStream()
+  JassParser.build(script, stream)
+  return stream.size
+
+#
+# Constant folding
+#
+
+_fold_operands = frozenset(['INT_CONST_DEC', 'INT_CONST_HEX', 'INT_CONST_OCT'])
+_fold_operators = frozenset(['PLUS', 'MINUS', 'TIMES', 'DIVIDE'])
+_fold_before = frozenset(['EQUALS', 'LPARENS', 'COMMA', 'LBRACKET', 'RETURN', 'EXITWHEN', 'IF', 'ELSEIF'])
+_fold_after = frozenset(['RPARENS', 'COMMA', 'RBRACKET', 'THEN'])
+
+def _int32(value):
+  return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+def _int_value(token):
+  value = token.value
+  if token.type == 'INT_CONST_HEX':
+    return int(value[1:] if value.startswith('$') else value[2:], 16)
+  if token.type == 'INT_CONST_OCT':
+    return int(value, 8)
+  return int(value)
+
+class _Evaluator():
+  """Integer arithmetic with JASS semantics: 32 bit and truncating division"""
+
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.index = 0
+
+  def peek(self):
+    return self.tokens[self.index].type if self.index < len(self.tokens) else None
+
+  def evaluate(self):
+    value = self.sum()
+    if self.index != len(self.tokens):
+      raise ValueError()
+    return value
+
+  def sum(self):
+    value = self.product()
+    while self.peek() in ('PLUS', 'MINUS'):
+      operator = self.peek()
+      self.index += 1
+      operand = self.product()
+      value = _int32(value + operand if operator == 'PLUS' else value - operand)
+    return value
+
+  def product(self):
+    value = self.unary()
+    while self.peek() in ('TIMES', 'DIVIDE'):
+      operator = self.peek()
+      self.index += 1
+      operand = self.unary()
+      if operator == 'TIMES':
+        value = _int32(value * operand)
+      else:
+        if operand == 0:
+          raise ValueError()
+        quotient = abs(value) // abs(operand)
+        value = _int32(quotient if (value < 0) == (operand < 0) else -quotient)
+    return value
+
+  def unary(self):
+    kind = self.peek()
+    if kind in ('PLUS', 'MINUS'):
+      self.index += 1
+      value = self.unary()
+      return _int32(-value) if kind == 'MINUS' else value
+
+    if kind == 'LPARENS':
+      self.index += 1
+      value = self.sum()
+      if self.peek() != 'RPARENS':
+        raise ValueError()
+      self.index += 1
+      return value
+
+    if kind in _fold_operands:
+      value = _int_value(self.tokens[self.index])
+      if value > 0x7fffffff:
+        raise ValueError()
+      self.index += 1
+      return value
+
+    raise ValueError()
+
+def _fold_run(tokens, start):
+  """Find the end of a foldable run of tokens starting at start"""
+
+  depth = 0
+  end = start
+  while end < len(tokens):
+    kind = tokens[end].type
+    if kind == 'LPARENS':
+      depth += 1
+    elif kind == 'RPARENS':
+      if depth == 0:
+        break
+      depth -= 1
+    elif not kind in _fold_operands and not kind in _fold_operators:
+      break
+    end += 1
+
+  if depth != 0 or end == start:
+    return None
+  if end < len(tokens) and not tokens[end].type in _fold_after:
+    return None
+
+  return end
+
+def _fold_tokens(tokens):
+  folded = False
+  start = 0
+
+  while start < len(tokens):
+    if start > 0 and not tokens[start - 1].type in _fold_before:
+      start += 1
+      continue
+
+    end = _fold_run(tokens, start)
+    if end is None or end - start < 2:
+      start += 1
+      continue
+
+    run = tokens[start:end]
+    try:
+      value = _Evaluator(run).evaluate()
+    except ValueError:
+      start += 1
+      continue
+
+    # -2147483648 can't be written as a literal
+    if value == -0x80000000:
+      start += 1
+      continue
+
+    first = run[0]
+    replacement = [Token.new_borrow_pos('INT_CONST_DEC', str(abs(value)), first)]
+    if value < 0:
+      replacement.insert(0, Token.new_borrow_pos('MINUS', '-', first))
+
+    if sum(len(t.value) for t in replacement) < sum(len(t.value) for t in run):
+      tokens[start:end] = replacement
+      folded = True
+      start += len(replacement)
+    else:
+      start += 1
+
+  return folded
+
+def fold_constants(script):
+  """Fold integer constant expressions"""
+
+  for tokens in _token_lists(script):
+    _fold_tokens(tokens)
+
+  script.reindex()
+  return script
+
+#
+# Inlining
+#
+
+def _forwarded_call(function):
+  """Get the name of the function a wrapper forwards to, if it is one"""
+
+  if function.locals or function.statements is None or len(function.statements) != 1:
+    return None
+
+  tokens = list(function.statements[0])
+  expected = 'CALL' if function.returns is None else 'RETURN'
+  if len(tokens) < 4 or tokens[0].type != expected or tokens[1].type != 'ID':
+    return None
+  if tokens[2].type != 'LPARENS' or tokens[-1].type != 'RPARENS':
+    return None
+
+  # The arguments must be the parameters, in order
+  args = tokens[3:-1]
+  params = [_name(takes[1]) for takes in function.takes]
+  if [t.value for t in args[::2]] != params or any(t.type != 'ID' for t in args[::2]):
+    return None
+  if any(t.type != 'COMMA' for t in args[1::2]):
+    return None
+
+  return tokens[1].value
+
+def _same_signature(wrapper, target):
+  if len(wrapper.takes) != len(target.takes):
+    return False
+
+  for (wrapper_type, _), (target_type, _) in zip(wrapper.takes, target.takes):
+    if _name(wrapper_type) != _name(target_type):
+      return False
+
+  if _name(wrapper.returns) != _name(target.returns):
+    return False
+
+  # Constant functions can only call constant functions
+  return target.is_constant or not wrapper.is_constant
+
+def inline_wrappers(script):
+  """Call the functions that wrappers forward to directly"""
+
+  dynamic = _string_names(script)
+  functions = script.index['functions']
+  natives = script.index['natives']
+
+  targets = {}
+  for function in script.functions:
+    name = _name(function.id)
+    target = _forwarded_call(function)
+    if target is None or target == name or name in dynamic:
+      continue
+
+    symbol = functions.get(target) or natives.get(target)
+    if not symbol is None and _same_signature(function, symbol):
+      targets[name] = target
+
+  # Follow chains of wrappers
+  def resolve(name):
+    seen = set()
+    while name in targets and not name in seen:
+      seen.add(name)
+      name = targets[name]
+    return name
+
+  # Calling a longer name would make the script bigger
+  targets = dict((name, resolve(name)) for name in targets)
+  targets = dict((name, target) for name, target in targets.items() if len(target) <= len(name))
+
+  for function in script.functions:
+    name = _name(function.id)
+    for tokens in _function_token_lists(function):
+      previous = None
+      for index, token in enumerate(tokens):
+        # Calls only, function references still need the wrapper
+        if (token.type == 'ID' and token.value in targets and targets[token.value] != name and
+          not (previous is not None and previous.type == 'FUNCTION') and
+          index + 1 < len(tokens) and tokens[index + 1].type == 'LPARENS'):
+          token.value = targets[token.value]
+        previous = token
+
+  script.reindex()
+  return script
+
+#
+# Unreachable functions
+#
+
+def remove_unreachable(script):
+  """Remove functions that can't be reached from main or config"""
+
+  functions = script.index['functions']
+  roots = [name for name in ('main', 'config') if name in functions]
+  if len(roots) == 0:
+    return script
+
+  roots.extend(name for name in _string_names(script) if name in functions)
+  roots.extend(_name(global_.id) for global_ in script.globals)
+
+  reachable = JassCallGraph(script).reachable(roots)
+
+  script.functions = [function for function in script.functions if _name(function.id) in reachable]
+  script.reindex()
+  return script
+
+#
+# Identifiers
+#
+
+_first_chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_chars = _first_chars + '0123456789'
+
+def _short_names(taken):
+  """Generate names from the shortest up, skipping taken ones"""
+
+  for length in count(1):
+    for first in _first_chars:
+      for rest in product(_chars, repeat=length - 1):
+        name = first + ''.join(rest)
+        if not name in taken:
+          yield name
+
+def declared_names(*scripts):
+  """Get the names declared by scripts (texts or JassScripts)
+
+  Meant for common.j and Blizzard.j, whose names are to be reserved
+  when shortening the identifiers of a map script.
+  """
+
+  names = set()
+  for script in scripts:
+    if isinstance(script, str):
+      script = JassParser.scan(script)
+
+    for symbol in script.types + script.natives + script.globals + script.functions:
+      names.add(_name(symbol.id))
+
+  return names
+
+def shorten_identifiers(script, reserved=None):
+  """Rename globals, functions, parameters and locals to short names
+
+  reserved are the names the new ones must not take, which has to
+  include those of common.j and Blizzard.j (see declared_names). An
+  empty collection can be passed when the script stands alone.
+  """
+
+  if reserved is None:
+    raise ValueError('Shortening identifiers requires the names of common.j and Blizzard.j to be reserved')
+
+  usage = Counter()
+  for tokens in _token_lists(script):
+    for token in tokens:
+      if token.type == 'ID':
+        usage[token.value] += 1
+
+  keep = set(['main', 'config']) | set(reserved) | _string_names(script)
+  keep.update(_name(symbol.id) for symbol in script.types)
+  keep.update(_name(symbol.id) for symbol in script.natives)
+
+  candidates = [_name(symbol.id) for symbol in script.globals + script.functions]
+  candidates = [name for name in dict.fromkeys(candidates) if not name in keep]
+  candidates.sort(key=lambda name: -usage[name])
+
+  # Names used in the script that aren't renamed, e.g. natives of common.j
+  taken = set(keywords) | keep | (set(usage) - set(candidates))
+  names = _short_names(taken)
+  mapping = dict((name, next(names)) for name in candidates)
+
+  # Locals go first: renaming the globals renames every token with their
+  # names, which must not be a local anymore by then
+  for function in script.functions:
+    if function.statements is None:
+      continue
+
+    local_names = [_name(takes[1]) for takes in function.takes] + [_name(local.id) for local in function.locals]
+    if len(local_names) == 0:
+      continue
+
+    local_usage = Counter()
+    for tokens in _function_token_lists(function):
+      for token in tokens:
+        if token.type == 'ID':
+          local_usage[token.value] += 1
+
+    # Locals shadow the globals the function uses, by their old or new name
+    used = set(name for name in local_usage if not name in local_names)
+    local_taken = set(keywords) | set(reserved) | set(mapping) | used | set(mapping.get(name, name) for name in used)
+
+    local_names = list(dict.fromkeys(local_names))
+    local_names.sort(key=lambda name: -local_usage[name])
+    names = _short_names(local_taken)
+    local_mapping = dict((name, next(names)) for name in local_names)
+
+    function.rename_locals(local_mapping)
+    function.takes[:] = [(type_, local_mapping.get(_name(id), id)) for type_, id in function.takes]
+
+  script.rename_many(mapping)
+  return script
+
+#
+# Pipeline
+#
+
+class JassOptimizer():
+  passes = ('fold', 'inline', 'unreachable')
+
+  def __init__(self, passes=None, reserved=None, verify=False, declarations=()):
+    """Create an optimizer running the given passes in order.
+
+    The default passes leave out shorten, which has to be asked for
+    along with the names it must not take: reserved names and the ones
+    declared by the declarations, scripts like common.j and Blizzard.j
+    (texts or JassScripts). Without either, it is refused.
+
+    With verify, the script is built and parsed again after every pass,
+    raising JassOptimizerError when it doesn't parse.
+    """
+    self.passes = tuple(passes) if not passes is None else JassOptimizer.passes
+    self.verify = verify
+
+    self.reserved = None
+    if not reserved is None or len(declarations) > 0:
+      self.reserved = set(reserved or ()) | declared_names(*declarations)
+
+    if 'shorten' in self.passes and self.reserved is None:
+      raise ValueError('The shorten pass requires reserved names or declarations (common.j, Blizzard.j)')
+
+  def run_pass(self, name, script):
+    """Run a single pass"""
+
+    if name == 'fold':
+      fold_constants(script)
+    elif name == 'inline':
+      inline_wrappers(script)
+    elif name == 'unreachable':
+      remove_unreachable(script)
+    elif name == 'shorten':
+      shorten_identifiers(script, self.reserved)
+    else:
+      raise ValueError('Unknown pass %r' % name)
+
+  def optimize(self, script):
+    """Optimize a script in place
+
+    Returns the report, a list of (pass, size before, size after) with
+    the sizes of the built script in bytes.
+    """
+
+    report = []
+    size = script_size(script)
+
+    for name in self.passes:
+      self.run_pass(name, script)
+
+      if self.verify:
+        try:
+          JassParser.parse(JassParser.build(script))
+        except (LarkError, SyntaxError) as error:
+          raise JassOptimizerError(name, error)
+
+      new_size = script_size(script)
+      report.append((name, size, new_size))
+      size = new_size
+
+    return report
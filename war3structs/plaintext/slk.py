@@ -0,0 +1,204 @@
+import io
+
+"""
+  Formats: slk
+
+  This is a plain text parser for the SYLK tables present in the
+  Warcraft III installation files (UnitData.slk, AbilityData.slk...).
+  Only the records the game uses are read: ID starts the file, B gives
+  its dimensions, C holds a cell and F is formatting, which can move the
+  current cell like C does. Anything else is ignored.
+
+  The first row holds the column names and the first column the id of
+  every row. Tables are stored by column, with a row index by id.
+"""
+
+def _parse_value(value):
+  if value.startswith('"'):
+    return value[1:-1] if value.endswith('"') else value[1:]
+
+  if value == 'TRUE':
+    return True
+  if value == 'FALSE':
+    return False
+
+  try:
+    return int(value)
+  except ValueError:
+    pass
+
+  try:
+    return float(value)
+  except ValueError:
+    return value
+
+def _build_value(value):
+  if isinstance(value, bool):
+    return 'TRUE' if value else 'FALSE'
+  if isinstance(value, (int, float)):
+    return repr(value)
+
+  return '"%s"' % str(value).replace(';', ';;')
+
+class SlkTable():
+  def __init__(self, names=None):
+    self.names = []
+    self.columns = {}
+    self.ids = []
+    self.index = {}
+
+    for name in names or []:
+      self.add_column(name)
+
+  def add_column(self, name):
+    """Add an empty column."""
+
+    if not name in self.columns:
+      self.names.append(name)
+      self.columns[name] = [None] * len(self.ids)
+
+  def add_row(self, id, values=None):
+    """Add a row, values is a dict of column names to values."""
+
+    if id in self.index:
+      raise KeyError('Duplicate row %r' % id)
+
+    self.index[id] = len(self.ids)
+    self.ids.append(id)
+
+    for name, column in self.columns.items():
+      column.append(None)
+
+    if len(self.names) > 0:
+      self.columns[self.names[0]][-1] = id
+
+    for name, value in (values or {}).items():
+      self.add_column(name)
+      self.columns[name][-1] = value
+
+  def get(self, id, name, default=None):
+    """Get the value of a cell."""
+
+    row = self.index.get(id)
+    column = self.columns.get(name)
+    if row is None or column is None or column[row] is None:
+      return default
+
+    return column[row]
+
+  def row(self, id):
+    """Get a row as a dict of column names to values."""
+
+    row = self.index[id]
+    return dict((name, self.columns[name][row]) for name in self.names
+      if self.columns[name][row] is not None)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __iter__(self):
+    return iter(self.ids)
+
+  def __contains__(self, id):
+    return id in self.index
+
+class SlkParser():
+  def parse(text):
+    """Get a table from text"""
+
+    table = SlkTable()
+    columns = {}
+    rows = {}
+    x = y = 1
+
+    for line in text.splitlines():
+      if not line.startswith('C;') and not line.startswith('F;'):
+        continue
+
+      # Semicolons in values are escaped by doubling them
+      if ';;' in line:
+        fields = [field.replace('\0', ';') for field in line.replace(';;', '\0').split(';')]
+      else:
+        fields = line.split(';')
+
+      value = None
+      for field in fields[1:]:
+        if not field:
+          continue
+
+        kind = field[0]
+        if kind == 'X':
+          x = int(field[1:])
+        elif kind == 'Y':
+          y = int(field[1:])
+        elif kind == 'K':
+          value = field[1:]
+
+      if fields[0] != 'C' or value is None:
+        continue
+
+      value = _parse_value(value)
+
+      # Row 1 names the columns
+      if y == 1:
+        columns[x] = [None] * len(table.ids)
+        table.names.append(value)
+        table.columns[value] = columns[x]
+        continue
+
+      column = columns.get(x)
+      if column is None:
+        continue
+
+      row = rows.get(y)
+      if row is None:
+        row = rows[y] = len(table.ids)
+        table.ids.append(None)
+
+      if len(column) <= row:
+        column.extend([None] * (row + 1 - len(column)))
+      column[row] = value
+
+      # The first column identifies the rows
+      if x == 1:
+        table.ids[row] = value
+        table.index.setdefault(value, row)
+
+    for column in columns.values():
+      column.extend([None] * (len(table.ids) - len(column)))
+
+    return table
+
+  def build(table, stream=None):
+    """Build compact SLK text from a table
+
+    If a stream is given the text is written to it as it is built,
+    otherwise it is returned.
+    """
+
+    if stream is None:
+      with io.StringIO('') as stream:
+        SlkParser.build(table, stream)
+        return stream.getvalue()
+
+    stream.write('ID;PWXL;N;E\n')
+    stream.write('B;X%d;Y%d;D0\n' % (len(table.names), len(table.ids) + 1))
+
+    # Only the first cell of a row needs its Y, the rest follow it
+    for x, name in enumerate(table.names, 1):
+      stream.write('C;X%d%s;K%s\n' % (x, ';Y1' if x == 1 else '', _build_value(name)))
+
+    columns = [table.columns[name] for name in table.names]
+    for y in range(len(table.ids)):
+      first = True
+      lines = []
+      for x, column in enumerate(columns, 1):
+        value = column[y]
+        if value is None:
+          continue
+
+        lines.append('C;X%d%s;K%s\n' % (x, ';Y%d' % (y + 2) if first else '', _build_value(value)))
+        first = False
+      stream.write(''.join(lines))
+
+    stream.write('E\n')
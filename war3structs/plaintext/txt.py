@@ -1,13 +1,132 @@
 import io
+import re
 import configparser
 
+from collections.abc import Mapping
+
 """
   Formats: txt
 
   This is a plain text parser for the INI-like format present in the
   Warcraft III installation files.
+
+  Besides the ConfigParser based parse, there's a dedicated parser that
+  only finds where sections start in one pass over the text and decodes
+  a section when it is first accessed. It reads from str, bytes or an
+  mmap and keeps values as their raw text, comma-separated lists
+  included, until they are asked for as a list.
 """
 
+# A BOM may come before the first header
+_section_regex = re.compile(r'^(?:\ufeff)?[ \t]*\[([^\]\r\n]*)\]', re.MULTILINE)
+_section_regex_bytes = re.compile(rb'^(?:\xef\xbb\xbf)?[ \t]*\[([^\]\r\n]*)\]', re.MULTILINE)
+
+def split_list(value):
+  """Split a comma-separated value, keeping commas inside quotes"""
+
+  items = []
+  start = 0
+  quoted = False
+
+  for index, char in enumerate(value):
+    if char == '"':
+      quoted = not quoted
+    elif char == ',' and not quoted:
+      items.append(value[start:index])
+      start = index + 1
+  items.append(value[start:])
+
+  return [item[1:-1] if len(item) >= 2 and item[0] == item[-1] == '"' else item for item in items]
+
+class TxtSection(dict):
+  """Section of a txt file, values are raw strings"""
+
+  def getlist(self, key, default=None):
+    """Get a value split into its comma-separated items"""
+
+    if not key in self:
+      return default
+
+    return split_list(self[key])
+
+class TxtData(Mapping):
+  """Sections of a txt file, decoded when first accessed"""
+
+  def __init__(self, data):
+    self.data = data
+    self.spans = {}
+    self.sections = {}
+
+    if isinstance(data, str):
+      regex = _section_regex
+    else:
+      regex = _section_regex_bytes
+
+    # Find every section header in a single pass. Sections that appear
+    # more than once are merged, like ConfigParser does without strict.
+    previous = None
+    for match in regex.finditer(data):
+      if previous is not None:
+        previous.append(match.start())
+
+      name = match.group(1)
+      if not isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+
+      previous = [match.end()]
+      self.spans.setdefault(name, []).append(previous)
+
+    if previous is not None:
+      previous.append(len(data))
+
+  def _decode(self, name):
+    section = TxtSection()
+
+    for start, end in self.spans[name]:
+      text = self.data[start:end]
+      if not isinstance(text, str):
+        # bytes, an mmap or a memoryview slice alike
+        text = str(text, 'utf-8', 'replace')
+
+      for line in text.splitlines():
+        line = line.strip()
+
+        # Options starting with _ are treated as comments, see parse
+        if not line or line.startswith('//') or line.startswith('_'):
+          continue
+
+        key, equals, value = line.partition('=')
+        if equals:
+          section[key.rstrip()] = value.lstrip()
+
+    return section
+
+  def __getitem__(self, name):
+    section = self.sections.get(name)
+
+    if section is None:
+      if not name in self.spans:
+        raise KeyError(name)
+
+      section = self._decode(name)
+      self.sections[name] = section
+
+    return section
+
+  def __iter__(self):
+    return iter(self.spans)
+
+  def __len__(self):
+    return len(self.spans)
+
+  def __contains__(self, name):
+    return name in self.spans
+
+  def to_dict(self):
+    """Decode every section into a plain dict"""
+
+    return dict((name, dict(self[name])) for name in self.spans)
+
 class TxtParser():
   def parse(text):
     """Get a config object from text"""
@@ -26,10 +145,31 @@ class TxtParser():
 
     return config
 
-  def build(config):
-    """Build txt from a config object"""
+  def parse_data(data):
+    """Get lazily decoded sections from text, bytes, an mmap or a memoryview"""
+
+    return TxtData(data)
+
+  def build(config, stream=None):
+    """Build txt from a config object or a mapping of sections
+
+    If a stream is given the text is written to it as it is built,
+    otherwise it is returned.
+    """
+
+    if stream is None:
+      with io.StringIO('') as stream:
+        TxtParser.build(config, stream)
+        return stream.getvalue()
 
-    stream = io.StringIO('')
-    config.write(stream)
+    for name in config:
+      if isinstance(config, configparser.RawConfigParser):
+        if name == config.default_section:
+          continue
+        items = config.items(name, raw=True)
+      else:
+        items = config[name].items()
 
-    return stream.read()
+      stream.write('[%s]\n' % name)
+      stream.write(''.join('%s=%s\n' % item for item in items))
+      stream.write('\n')
@@ -1,2 +1,11 @@
-from .stormmpq import MPQ
-from .cascstore import CascStore
+from .mpqreader import MPQReader
+
+try:
+  from .stormmpq import MPQ
+  from .cascstore import CascStore
+  from .cascmirror import CascMirror
+  from .mpqbuild import MPQBuildCache
+except OSError:
+  # StormLib and CascLib are only shipped as Windows binaries, the pure
+  # Python reader is still available without them
+  pass
@@ -0,0 +1,140 @@
+import threading
+
+from collections import OrderedDict
+
+"""
+  Contents cache of CascStore
+
+  Kept apart from the store so that it can be used without CascLib.
+"""
+
+def _store_key(path):
+  """Normalize a path the way the store compares them"""
+
+  if not isinstance(path, str):
+    path = path.filename
+
+  return path.replace('/', '\\').upper()
+
+class CascReadCache():
+  """Bounded LRU of file contents
+
+  The budget is in bytes rather than entries since game data files range
+  from a few bytes to megabytes. Pinned files are kept outside of the
+  LRU and are never evicted, nor counted against the budget. Safe to
+  share between threads.
+  """
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.entries = OrderedDict()
+    self.pinned = {}
+    self.lock = threading.RLock()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.evicted_bytes = 0
+
+  def get(self, path):
+    """Get cached contents, None if they aren't cached."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      data = self.pinned.get(key)
+      if data is None:
+        data = self.entries.get(key)
+        if data is not None:
+          self.entries.move_to_end(key)
+
+      if data is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+
+      return data
+
+  def peek(self, path):
+    """Get cached contents without counting a hit or miss, or touching the LRU."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      data = self.pinned.get(key)
+      if data is None:
+        data = self.entries.get(key)
+
+      return data
+
+  def put(self, path, data):
+    """Cache contents, evicting the least recently used files."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      if key in self.pinned:
+        self.pinned[key] = data
+        return
+
+      old = self.entries.pop(key, None)
+      if old is not None:
+        self.size -= len(old)
+
+      # Files larger than the whole budget would just flush the cache
+      if len(data) > self.max_bytes:
+        return
+
+      self.entries[key] = data
+      self.size += len(data)
+
+      while self.size > self.max_bytes:
+        _, evicted = self.entries.popitem(last=False)
+        self.size -= len(evicted)
+        self.evictions += 1
+        self.evicted_bytes += len(evicted)
+
+  def pin(self, path, data):
+    """Keep contents in the cache until unpinned."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      old = self.entries.pop(key, None)
+      if old is not None:
+        self.size -= len(old)
+
+      self.pinned[key] = data
+
+  def unpin(self, path):
+    """Move pinned contents back into the LRU."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      data = self.pinned.pop(key, None)
+      if data is not None:
+        self.put(path, data)
+
+  def clear(self):
+    """Remove everything but the pinned files."""
+
+    with self.lock:
+      self.entries.clear()
+      self.size = 0
+
+  def stats(self):
+    """Get the cache counters."""
+
+    with self.lock:
+      return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'evicted_bytes': self.evicted_bytes,
+        'size': self.size,
+        'max_bytes': self.max_bytes,
+        'entries': len(self.entries),
+        'pinned': len(self.pinned),
+        'pinned_bytes': sum(len(data) for data in self.pinned.values())
+      }
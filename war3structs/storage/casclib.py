@@ -17,6 +17,7 @@ from ctypes import (
   c_char_p,
   c_void_p,
   c_uint,
+  c_int,
   c_bool
 )
 
@@ -131,6 +132,9 @@ chandle.CascGetFileSize.argtypes = [c_void_p, POINTER(c_uint)]
 chandle.CascReadFile.restype = c_bool
 chandle.CascReadFile.argtypes = [c_void_p, c_void_p, c_uint, POINTER(c_uint)]
 
+chandle.CascSetFilePointer.restype = c_uint
+chandle.CascSetFilePointer.argtypes = [c_void_p, c_int, POINTER(c_int), c_uint]
+
 chandle.CascCloseFile.restype = c_bool
 chandle.CascCloseFile.argtypes = [c_void_p]
 
@@ -0,0 +1,237 @@
+import os
+import mmap
+import json
+import hashlib
+
+from contextlib import contextmanager
+
+from .cascstore import CascStore, CascStoreFile, _store_key
+
+"""
+  Persistent local mirror of CASC files
+
+  Opening a CASC storage and reading from it is expensive compared to
+  reading a plain file, and most jobs read the same few thousand data
+  files. The mirror stores the contents of every file read through it
+  in a content-addressed directory, with an index per game build that
+  maps store paths to contents. Later runs serve mirrored paths through
+  mmap and only open the storage when a path isn't mirrored yet.
+
+  The build is identified by the install's .build.info, so installing a
+  new build starts a new index instead of serving stale files.
+"""
+
+def _build_id(datapath):
+  """Identify the build of an install"""
+
+  for directory in (datapath, os.path.dirname(os.path.abspath(datapath))):
+    build_info = os.path.join(directory, '.build.info')
+    if os.path.exists(build_info):
+      with open(build_info, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+  # No build info, use the install's modification time instead
+  stat = os.stat(datapath)
+  identity = '%s|%s' % (os.path.abspath(datapath), stat.st_mtime)
+  return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+class CascMirror():
+  def __init__(self, mirrordir, datapath, listfile=None, **kwargs):
+    """Open a mirror of CASC storage.
+
+    The storage itself is only opened when a file has to be read from
+    it, using the listfile and the other arguments of CascStore.
+    """
+    self.mirrordir = mirrordir
+    self.datapath = datapath
+    self.listfile = listfile
+    self.store_args = kwargs
+    self.store = None
+    self.build = _build_id(datapath)
+    self.dirty = False
+
+    self.hits = 0
+    self.misses = 0
+
+    os.makedirs(os.path.join(mirrordir, 'objects'), exist_ok=True)
+    os.makedirs(os.path.join(mirrordir, 'builds'), exist_ok=True)
+
+    try:
+      with open(self._index_path(), 'r') as file:
+        self.index = json.load(file)
+    except (OSError, ValueError):
+      self.index = {}
+
+  def _index_path(self):
+    return os.path.join(self.mirrordir, 'builds', self.build + '.json')
+
+  def _object_path(self, digest):
+    return os.path.join(self.mirrordir, 'objects', digest[:2], digest)
+
+  def _get_store(self):
+    if self.store is None:
+      self.store = CascStore(self.datapath, self.listfile, **self.store_args)
+
+    return self.store
+
+  def _lookup(self, key):
+    # Check the object is still there, an index entry with a missing or
+    # truncated object is treated as not mirrored
+    entry = self.index.get(key)
+    if entry is None:
+      return None
+
+    object_path = self._object_path(entry[1])
+    try:
+      if os.path.getsize(object_path) != entry[2]:
+        return None
+    except OSError:
+      return None
+
+    return object_path
+
+  def _populate(self, path):
+    data = self._get_store().read(path)
+    digest = hashlib.sha1(data).hexdigest()
+    object_path = self._object_path(digest)
+
+    if not os.path.exists(object_path) or os.path.getsize(object_path) != len(data):
+      os.makedirs(os.path.dirname(object_path), exist_ok=True)
+      temp_path = '%s.%d.tmp' % (object_path, os.getpid())
+      with open(temp_path, 'wb') as file:
+        file.write(data)
+      os.replace(temp_path, object_path)
+
+    self.index[_store_key(path)] = [path, digest, len(data)]
+    self.dirty = True
+
+    return object_path, data
+
+  def close(self):
+    """Save the index and close the storage, if it was opened."""
+
+    self.save()
+
+    if self.store is not None:
+      self.store.close()
+      self.store = None
+
+  def save(self):
+    """Write the index of the current build."""
+
+    if not self.dirty:
+      return
+
+    temp_path = '%s.%d.tmp' % (self._index_path(), os.getpid())
+    with open(temp_path, 'w') as file:
+      json.dump(self.index, file)
+    os.replace(temp_path, self._index_path())
+
+    self.dirty = False
+
+  def has(self, path):
+    """Is the file mirrored?"""
+
+    return self._lookup(_store_key(path)) is not None
+
+  @contextmanager
+  def open(self, path):
+    """Map a file's contents read-only, mirroring it if needed.
+
+    Use in a with block, which gives a memoryview of the contents and
+    unmaps them when it exits, so the mirror can replace the file later.
+    Views and slices of it mustn't be kept past the block. Empty files
+    can't be mapped, they give an empty memoryview.
+    """
+
+    if isinstance(path, CascStoreFile):
+      path = path.filename
+
+    object_path = self._lookup(_store_key(path))
+    if object_path is None:
+      self.misses += 1
+      object_path, _ = self._populate(path)
+    else:
+      self.hits += 1
+
+    with open(object_path, 'rb') as file:
+      if os.fstat(file.fileno()).st_size == 0:
+        mapping = None
+      else:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapping is None:
+      yield memoryview(b'')
+      return
+
+    view = memoryview(mapping)
+    try:
+      yield view
+    finally:
+      view.release()
+      mapping.close()
+
+  def read(self, path):
+    """Return a file's contents, mirroring it if needed."""
+
+    if isinstance(path, CascStoreFile):
+      path = path.filename
+
+    object_path = self._lookup(_store_key(path))
+    if object_path is None:
+      self.misses += 1
+      _, data = self._populate(path)
+      return data
+
+    self.hits += 1
+    with open(object_path, 'rb') as file:
+      return file.read()
+
+  def extract(self, mpq_path, local_path=None):
+    """Extract a file from the mirror."""
+
+    if isinstance(mpq_path, CascStoreFile):
+      mpq_path = mpq_path.filename
+
+    if local_path is None:
+      local_path = os.path.join('.', mpq_path.replace('\\', '/').replace(':', '_'))
+
+    contents = self.read(mpq_path)
+
+    # Create the directories
+    try:
+      os.makedirs(os.path.dirname(local_path))
+    except FileExistsError:
+      pass
+
+    # Write to the file
+    with open(local_path, 'wb') as file:
+      file.write(contents)
+
+  def mirror(self, mask='*'):
+    """Mirror every file matching a mask, return how many were added."""
+
+    added = 0
+
+    for file in self._get_store().find(mask):
+      if self._lookup(_store_key(file.filename)) is None:
+        self._populate(file.filename)
+        added += 1
+
+    self.save()
+    return added
+
+  def prune(self):
+    """Remove the indexes of other builds and unreferenced objects."""
+
+    builds_dir = os.path.join(self.mirrordir, 'builds')
+    for name in os.listdir(builds_dir):
+      if name != self.build + '.json':
+        os.remove(os.path.join(builds_dir, name))
+
+    referenced = set(entry[1] for entry in self.index.values())
+    objects_dir = os.path.join(self.mirrordir, 'objects')
+    for prefix in os.listdir(objects_dir):
+      for name in os.listdir(os.path.join(objects_dir, prefix)):
+        if not name in referenced:
+          os.remove(os.path.join(objects_dir, prefix, name))
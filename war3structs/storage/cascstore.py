@@ -1,6 +1,10 @@
 import os
 import glob
 import sys
+import bisect
+import threading
+
+from collections import OrderedDict
 
 from ctypes import (
   byref,
@@ -9,10 +13,13 @@ from ctypes import (
   create_string_buffer
 )
 from .casclib import (
+  chandle,
   Casc,
   CascError,
   CascFile
 )
+from .masks import mask_regex
+from .casccache import CascReadCache, _store_key
 
 class CascStoreFile(CascFile):
   def __init__(self, store):
@@ -24,12 +31,169 @@ class CascStoreFile(CascFile):
   def extract(self, target=None):
     return self.store.extract(self.filename, target)
 
+class CascHandlePool():
+  """Idle file handles kept open for reuse
+
+  A handle is only ever used by one reader at a time, and is rewound
+  before it is handed out again.
+  """
+  def __init__(self, store, max_handles):
+    self.store = store
+    self.max_handles = max_handles
+    self.idle = OrderedDict()
+    self.count = 0
+    self.lock = threading.Lock()
+
+  def acquire(self, path):
+    """Get an open handle and the size of a file."""
+
+    key = _store_key(path)
+
+    with self.lock:
+      handles = self.idle.get(key)
+      if handles:
+        file_h, size = handles.pop()
+        if not handles:
+          del self.idle[key]
+        self.count -= 1
+      else:
+        file_h = None
+
+    if file_h is not None:
+      # Called directly, a position of 0 is a success that the wrapper
+      # would otherwise have to tell apart from an error
+      if chandle.CascSetFilePointer(file_h, 0, None, 0) == 0:
+        return file_h, size
+
+      Casc.TryCascCloseFile(file_h)
+
+    file_h = c_void_p()
+    Casc.CascOpenFile(self.store.store_h, path.encode('utf-8'), 0, 0, byref(file_h))
+
+    high = c_uint()
+    low = Casc.CascGetFileSize(file_h, byref(high))
+    size = high.value * pow(2, 32) + low
+
+    return file_h, size
+
+  def release(self, path, file_h, size):
+    """Return a handle to the pool, closing the oldest idle handle."""
+
+    key = _store_key(path)
+    closing = None
+
+    with self.lock:
+      self.idle.setdefault(key, []).append((file_h, size))
+      self.idle.move_to_end(key)
+      self.count += 1
+
+      if self.count > self.max_handles:
+        oldest = next(iter(self.idle))
+        closing, _ = self.idle[oldest].pop(0)
+        if not self.idle[oldest]:
+          del self.idle[oldest]
+        self.count -= 1
+
+    if closing is not None:
+      Casc.CascCloseFile(closing)
+
+  def close(self):
+    """Close all idle handles."""
+
+    with self.lock:
+      idle = self.idle
+      self.idle = OrderedDict()
+      self.count = 0
+
+    for handles in idle.values():
+      for file_h, _ in handles:
+        Casc.CascCloseFile(file_h)
+
+class CascListfile():
+  """Listfile indexed for mask matching
+
+  Names are kept in a sorted array of their normalized keys, so a mask
+  only has to be matched against the range sharing its literal prefix,
+  and grouped by directory for listing.
+  """
+  def __init__(self, path):
+    self.path = path
+
+    names = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+      for line in file:
+        name = line.strip()
+        if name:
+          names.setdefault(_store_key(name), name)
+
+    self.keys = sorted(names)
+    self.names = [names[key] for key in self.keys]
+
+    self.directories = {}
+    for index, key in enumerate(self.keys):
+      directory = key.rpartition('\\')[0]
+      self.directories.setdefault(directory, []).append(index)
+
+  def match(self, mask='*'):
+    """Generate the names matching a mask."""
+
+    key = _store_key(mask)
+
+    # Everything up to the first wildcard narrows down the range
+    prefix = key
+    for index, char in enumerate(key):
+      if char in '*?':
+        prefix = key[:index]
+        break
+
+    start = bisect.bisect_left(self.keys, prefix)
+    if prefix == key:
+      if start < len(self.keys) and self.keys[start] == key:
+        yield self.names[start]
+      return
+
+    regex = mask_regex(mask)
+    for index in range(start, len(self.keys)):
+      if not self.keys[index].startswith(prefix):
+        break
+      if regex.match(self.keys[index]):
+        yield self.names[index]
+
+  def listdir(self, directory=''):
+    """Get the names directly inside a directory."""
+
+    indices = self.directories.get(_store_key(directory).rstrip('\\'), [])
+    return [self.names[index] for index in indices]
+
+_listfiles = {}
+_listfiles_lock = threading.Lock()
+
+def load_listfile(path):
+  """Get a listfile's index, loading it only once per process."""
+
+  stat = os.stat(path)
+  identity = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+  with _listfiles_lock:
+    listfile = _listfiles.get(identity)
+    if listfile is None:
+      listfile = CascListfile(path)
+      _listfiles[identity] = listfile
+
+  return listfile
+
 class CascStore():
-  def __init__(self, datapath, listfile=None):
-    """Open CASC storage."""
+  def __init__(self, datapath, listfile=None, cache_size=0, handles=0):
+    """Open CASC storage.
+
+    With a cache size (in bytes), read contents are kept in an LRU. With
+    a handle count, that many idle file handles are kept open for reuse.
+    """
 
     self.listfile = listfile
     self.store_h = c_void_p()
+    self.cache = CascReadCache(cache_size) if cache_size > 0 else None
+    self.handles = CascHandlePool(self, handles) if handles > 0 else None
 
     if not os.path.exists(datapath):
       raise Exception('Tried to open "%s" but no such directory exists' % datapath)
@@ -39,11 +203,41 @@ class CascStore():
   def close(self):
     """Close the store."""
 
+    if self.handles is not None:
+      self.handles.close()
+
     Casc.CascCloseStorage(self.store_h)
     self.store_h = None
 
-  def find(self, mask='*'):
-    """List all files matching a mask."""
+  def find(self, mask='*', verify=True):
+    """List all files matching a mask.
+
+    Matching is done on the listfile, loaded once per process. Files are
+    only created for the names that are actually consumed, and with
+    verify they are checked to exist in the store first. Without it the
+    listfile is trusted, and file sizes aren't filled in.
+    """
+
+    if self.listfile is None:
+      raise Exception('Store was not initialized with a listfile, can\'t search')
+
+    for name in load_listfile(self.listfile).match(mask):
+      file = CascStoreFile(self)
+      file.szFileName = name.encode('utf-8')
+
+      if verify:
+        file_h = c_void_p()
+        if not Casc.TryCascOpenFile(self.store_h, file.szFileName, 0, 0, byref(file_h)):
+          continue
+
+        high = c_uint()
+        file.dwFileSize = Casc.CascGetFileSize(file_h, byref(high))
+        Casc.CascCloseFile(file_h)
+
+      yield file
+
+  def find_native(self, mask='*'):
+    """List all files matching a mask through CascLib's own search."""
 
     if self.listfile is None:
       raise Exception('Store was not initialized with a listfile, can\'t search')
@@ -79,6 +273,51 @@ class CascStore():
     if isinstance(path, CascStoreFile):
       path = path.filename
 
+    if self.cache is not None:
+      data = self.cache.get(path)
+      if data is None:
+        data = self._read(path)
+        self.cache.put(path, data)
+      return data
+
+    return self._read(path)
+
+  def pin(self, path):
+    """Keep a file's contents cached until unpinned."""
+
+    if self.cache is None:
+      raise Exception('Store was not initialized with a cache, can\'t pin')
+
+    if isinstance(path, CascStoreFile):
+      path = path.filename
+
+    # Not a read, so it doesn't count in the hit and miss stats
+    data = self.cache.peek(path)
+    if data is None:
+      data = self._read(path)
+    self.cache.pin(path, data)
+
+  def unpin(self, path):
+    """Let a pinned file be evicted again."""
+
+    if self.cache is not None:
+      self.cache.unpin(path)
+
+  def _read(self, path):
+    if self.handles is not None:
+      file_h, size = self.handles.acquire(path)
+
+      try:
+        data = create_string_buffer(size)
+        read = c_uint()
+        Casc.CascReadFile(file_h, byref(data), size, byref(read))
+      except:
+        Casc.TryCascCloseFile(file_h)
+        raise
+
+      self.handles.release(path, file_h, size)
+      return data.raw
+
     # Open the file
     file_h = c_void_p()
     Casc.CascOpenFile(self.store_h, path.encode('utf-8'), 0, 0, byref(file_h))
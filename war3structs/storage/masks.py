@@ -0,0 +1,18 @@
+import re
+
+"""
+  Storm search masks, shared by the archive and store backends.
+"""
+
+def mask_regex(mask):
+  """Compile a Storm search mask (* and ?) to a regex
+
+  Slashes in the mask are turned into backslashes, so the regex is meant
+  to be matched against names normalized the same way.
+  """
+
+  pattern = ''.join(
+    '.*' if char == '*' else '.' if char == '?' else re.escape(char)
+    for char in mask.replace('/', '\\'))
+
+  return re.compile(pattern + r'\Z', re.IGNORECASE | re.DOTALL)
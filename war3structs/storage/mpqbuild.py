@@ -0,0 +1,149 @@
+import os
+import json
+import shutil
+import hashlib
+
+from .stormlib import StormAddFileFlag
+from .stormmpq import MPQ, _archive_key
+
+"""
+  Incremental archive builds
+
+  Rebuilding an archive from scratch recompresses every file even when
+  only one of them changed. The build cache keeps the last archive built
+  for a target together with a manifest of what went into it, keyed by
+  the content hash and compression flags of every file. The next build
+  starts from that archive and only writes the files whose key changed,
+  so unchanged files keep their already compressed sectors.
+
+  StormLib only takes uncompressed data, so the compressed sectors can't
+  be cached per file and put together into a fresh archive. Replacing or
+  removing a file in the cached archive leaves its old sectors behind as
+  dead space instead. The manifest keeps a running total of it, and the
+  archive is compacted once it passes a fraction of the archive size
+  (garbage_ratio). Compacting rewrites the whole archive, so that build
+  is about as slow as a build from scratch, the others only pay for the
+  files that changed.
+"""
+
+class MPQBuildCache():
+  def __init__(self, cachedir, garbage_ratio=0.25):
+    """Use (or create) a cache directory.
+
+    The cached archive of a target is compacted when the space left by
+    replaced and removed files passes garbage_ratio of its size.
+    """
+
+    self.cachedir = cachedir
+    self.garbage_ratio = garbage_ratio
+    self.hits = 0
+    self.misses = 0
+    self.hit_bytes = 0
+    self.miss_bytes = 0
+
+    os.makedirs(cachedir, exist_ok=True)
+
+  def _entry_dir(self, target):
+    name = hashlib.sha1(os.path.abspath(target).encode('utf-8')).hexdigest()
+    return os.path.join(self.cachedir, name)
+
+  def _load_manifest(self, entry_dir):
+    try:
+      with open(os.path.join(entry_dir, 'manifest.json'), 'r') as file:
+        manifest = json.load(file)
+    except (OSError, ValueError):
+      return None
+
+    if not isinstance(manifest, dict) or not 'files' in manifest:
+      return None
+
+    return manifest
+
+  def build(self, target, files, compress=True, compact=None):
+    """Build an archive from a dict of archive paths to contents.
+
+    Contents are either bytes or the path of a local file. The target is
+    always overwritten. By default the archive is compacted once enough
+    of it is dead space, compact=True and compact=False force it on or
+    off for this build.
+    """
+    entry_dir = self._entry_dir(target)
+    archive_path = os.path.join(entry_dir, 'archive.mpq')
+    manifest = self._load_manifest(entry_dir)
+
+    if manifest is None or not os.path.exists(archive_path):
+      manifest = {'files': {}, 'garbage': 0}
+
+    cached_files = manifest['files']
+    garbage = manifest['garbage']
+
+    if os.path.exists(target):
+      os.remove(target)
+    if cached_files:
+      shutil.copyfile(archive_path, target)
+
+    flags = 0
+    if compress:
+      flags |= StormAddFileFlag.MPQ_FILE_COMPRESS
+
+    new_files = {}
+    mpq = MPQ(target, readonly=False)
+
+    try:
+      with mpq.batch() as batch:
+        for path, contents in files.items():
+          if isinstance(contents, str):
+            with open(contents, 'rb') as file:
+              contents = file.read()
+
+          key = _archive_key(path)
+          digest = hashlib.sha1(contents).hexdigest()
+
+          cached = cached_files.get(key)
+          if cached is not None and cached[1:3] == [digest, int(flags)]:
+            self.hits += 1
+            self.hit_bytes += len(contents)
+            new_files[key] = cached
+          else:
+            self.misses += 1
+            self.miss_bytes += len(contents)
+            batch.write(path, contents, compress, replace=True)
+            new_files[key] = [path, digest, int(flags), 0]
+            if cached is not None:
+              garbage += cached[3]
+
+        for key, cached in cached_files.items():
+          if not key in new_files:
+            batch.remove(cached[0])
+            garbage += cached[3]
+
+      # Remember the compressed sizes, the space they leave behind when
+      # they get replaced
+      live = 0
+      for file in mpq.find():
+        live += file.dwCompSize
+        entry = new_files.get(_archive_key(file.filename))
+        if entry is not None:
+          entry[3] = file.dwCompSize
+
+      if compact is None:
+        compact = garbage > (live + garbage) * self.garbage_ratio
+      if compact:
+        # Compacting only moves sectors, the sizes stay the same
+        mpq.compact()
+        garbage = 0
+    finally:
+      mpq.close()
+
+    # Store the result for the next build
+    os.makedirs(entry_dir, exist_ok=True)
+    shutil.copyfile(target, archive_path)
+
+    with open(os.path.join(entry_dir, 'manifest.json'), 'w') as file:
+      json.dump({'files': new_files, 'garbage': garbage}, file)
+
+  def clear(self):
+    """Remove everything from the cache."""
+
+    shutil.rmtree(self.cachedir, ignore_errors=True)
+    os.makedirs(self.cachedir, exist_ok=True)
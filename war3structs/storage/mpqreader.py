@@ -0,0 +1,506 @@
+# Pure Python MPQ reader
+#
+# Links
+#   MPQ format
+#   - http://www.zezula.net/en/mpq/mpqformat.html
+#   PKWARE Data Compression Library decompressor (blast.c)
+#   - https://github.com/madler/zlib/tree/master/contrib/blast
+#
+
+import os
+import re
+import mmap
+import zlib
+import bz2
+import struct
+
+from .masks import mask_regex
+
+"""
+  A read-only MPQ backend that does not need StormLib. The archive is
+  memory mapped, the hash and block tables are decrypted once when it is
+  opened and files are decompressed sector by sector when they are read.
+  Supported compressions are zlib, bzip2 and PKWARE implode, which covers
+  everything but audio files (huffman/ADPCM) in Warcraft III archives.
+"""
+
+MPQ_FILE_IMPLODE       = 0x00000100
+MPQ_FILE_COMPRESS      = 0x00000200
+MPQ_FILE_ENCRYPTED     = 0x00010000
+MPQ_FILE_FIX_KEY       = 0x00020000
+MPQ_FILE_SINGLE_UNIT   = 0x01000000
+MPQ_FILE_DELETE_MARKER = 0x02000000
+MPQ_FILE_SECTOR_CRC    = 0x04000000
+MPQ_FILE_EXISTS        = 0x80000000
+
+MPQ_COMPRESSION_ZLIB   = 0x02
+MPQ_COMPRESSION_PKWARE = 0x08
+MPQ_COMPRESSION_BZIP2  = 0x10
+MPQ_COMPRESSION_LZMA   = 0x12
+
+MPQ_HASH_TABLE_INDEX = 0
+MPQ_HASH_NAME_A      = 1
+MPQ_HASH_NAME_B      = 2
+MPQ_HASH_FILE_KEY    = 3
+
+HASH_ENTRY_EMPTY   = 0xFFFFFFFF
+HASH_ENTRY_DELETED = 0xFFFFFFFE
+
+def _build_crypt_table():
+  table = [0] * 0x500
+  seed = 0x00100001
+
+  for index1 in range(0x100):
+    index2 = index1
+    for _ in range(5):
+      seed = (seed * 125 + 3) % 0x2AAAAB
+      temp1 = (seed & 0xFFFF) << 0x10
+      seed = (seed * 125 + 3) % 0x2AAAAB
+      temp2 = seed & 0xFFFF
+      table[index2] = temp1 | temp2
+      index2 += 0x100
+
+  return table
+
+crypt_table = _build_crypt_table()
+
+def hash_string(string, hash_type):
+  """Hash an archive path the way Storm does"""
+
+  seed1 = 0x7FED7FED
+  seed2 = 0xEEEEEEEE
+  offset = hash_type << 8
+
+  # Storm only uppercases ASCII, so uppercase the bytes, not the string
+  for char in string.encode('utf-8').upper().replace(b'/', b'\\'):
+    seed1 = crypt_table[offset + char] ^ ((seed1 + seed2) & 0xFFFFFFFF)
+    seed2 = (char + seed1 + seed2 + (seed2 << 5) + 3) & 0xFFFFFFFF
+
+  return seed1
+
+def decrypt(data, key):
+  """Decrypt a block of data, trailing bytes are left as they are"""
+
+  count = len(data) // 4
+  values = struct.unpack_from('<%dI' % count, data)
+  result = [0] * count
+  seed = 0xEEEEEEEE
+
+  for index in range(count):
+    seed = (seed + crypt_table[0x400 + (key & 0xFF)]) & 0xFFFFFFFF
+    value = values[index] ^ ((key + seed) & 0xFFFFFFFF)
+    result[index] = value
+    key = ((((~key) << 0x15) + 0x11111111) & 0xFFFFFFFF) | (key >> 0x0B)
+    seed = (value + seed + (seed << 5) + 3) & 0xFFFFFFFF
+
+  return struct.pack('<%dI' % count, *result) + bytes(data[count * 4:])
+
+class MPQReaderError(Exception):
+  def __init__(self, message):
+    self.message = message
+
+  def __repr__(self):
+    return self.message
+
+  def __str__(self):
+    return self.message
+
+#
+# PKWARE DCL explode, a port of blast.c
+#
+
+_explode_lit_lengths = bytes([
+  11, 124, 8, 7, 28, 7, 188, 13, 76, 4, 10, 8, 12, 10, 12, 10, 8, 23, 8,
+  9, 7, 6, 7, 8, 7, 6, 55, 8, 23, 24, 12, 11, 7, 9, 11, 12, 6, 7, 22, 5,
+  7, 24, 6, 11, 9, 6, 7, 22, 7, 11, 38, 7, 9, 8, 25, 11, 8, 11, 9, 12,
+  8, 12, 5, 38, 5, 38, 5, 11, 7, 5, 6, 21, 6, 10, 53, 8, 7, 24, 10, 27,
+  44, 253, 253, 253, 252, 252, 252, 13, 12, 45, 12, 45, 12, 61, 12, 45,
+  44, 173
+])
+_explode_len_lengths = bytes([2, 35, 36, 53, 38, 23])
+_explode_dist_lengths = bytes([2, 20, 53, 230, 247, 151, 248])
+_explode_len_base = (3, 2, 4, 5, 6, 7, 8, 9, 10, 12, 16, 24, 40, 72, 136, 264)
+_explode_len_extra = (0, 0, 0, 0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8)
+
+def _explode_table(compact):
+  # Expand the run-length encoded code lengths and build a canonical
+  # decoding table of (count per length, symbols in code order)
+  lengths = []
+  for value in compact:
+    lengths.extend([value & 15] * ((value >> 4) + 1))
+
+  counts = [0] * 14
+  for length in lengths:
+    counts[length] += 1
+
+  offsets = [0] * 14
+  for length in range(1, 13):
+    offsets[length + 1] = offsets[length] + counts[length]
+
+  symbols = [0] * len(lengths)
+  for symbol, length in enumerate(lengths):
+    if length != 0:
+      symbols[offsets[length]] = symbol
+      offsets[length] += 1
+
+  return counts, symbols
+
+_explode_lit_table = _explode_table(_explode_lit_lengths)
+_explode_len_table = _explode_table(_explode_len_lengths)
+_explode_dist_table = _explode_table(_explode_dist_lengths)
+
+class _BitReader():
+  def __init__(self, data, pos):
+    self.data = data
+    self.pos = pos
+    self.buffer = 0
+    self.count = 0
+
+  def bits(self, need):
+    value = self.buffer
+    while self.count < need:
+      if self.pos >= len(self.data):
+        raise MPQReaderError('Imploded data ended unexpectedly')
+      value |= self.data[self.pos] << self.count
+      self.pos += 1
+      self.count += 8
+
+    self.buffer = value >> need
+    self.count -= need
+    return value & ((1 << need) - 1)
+
+  def decode(self, table):
+    counts, symbols = table
+    code = first = index = 0
+
+    for length in range(1, 14):
+      code |= self.bits(1) ^ 1
+      count = counts[length]
+      if code < first + count:
+        return symbols[index + (code - first)]
+      index += count
+      first = (first + count) << 1
+      code <<= 1
+
+    raise MPQReaderError('Invalid code in imploded data')
+
+def explode(data):
+  """Decompress PKWARE DCL imploded data"""
+
+  if len(data) < 2:
+    raise MPQReaderError('Imploded data is too short')
+
+  coded_literals = data[0]
+  dict_bits = data[1]
+  if coded_literals > 1 or not 4 <= dict_bits <= 6:
+    raise MPQReaderError('Invalid imploded data header')
+
+  reader = _BitReader(data, 2)
+  output = bytearray()
+
+  while True:
+    if reader.bits(1):
+      symbol = reader.decode(_explode_len_table)
+      length = _explode_len_base[symbol] + reader.bits(_explode_len_extra[symbol])
+      if length == 519:
+        break
+
+      shift = 2 if length == 2 else dict_bits
+      distance = (reader.decode(_explode_dist_table) << shift) + reader.bits(shift) + 1
+      if distance > len(output):
+        raise MPQReaderError('Invalid distance in imploded data')
+
+      start = len(output) - distance
+      for index in range(length):
+        output.append(output[start + index])
+    else:
+      if coded_literals:
+        output.append(reader.decode(_explode_lit_table))
+      else:
+        output.append(reader.bits(8))
+
+  return bytes(output)
+
+def _decompress(data, flags):
+  if flags & MPQ_FILE_IMPLODE:
+    return explode(data)
+
+  mask = data[0]
+  data = data[1:]
+
+  if mask == MPQ_COMPRESSION_LZMA or mask & ~(MPQ_COMPRESSION_BZIP2 | MPQ_COMPRESSION_PKWARE | MPQ_COMPRESSION_ZLIB):
+    raise MPQReaderError('Unsupported compression 0x%02x' % mask)
+
+  # Reverse order of how Storm compresses
+  if mask & MPQ_COMPRESSION_BZIP2:
+    data = bz2.decompress(data)
+  if mask & MPQ_COMPRESSION_PKWARE:
+    data = explode(data)
+  if mask & MPQ_COMPRESSION_ZLIB:
+    data = zlib.decompress(data)
+
+  return data
+
+class MPQReaderFile():
+  def __init__(self, mpq, filename, block):
+    self.mpq = mpq
+    self.filename = filename
+    self.dwBlockIndex = block
+    _, self.dwCompSize, self.dwFileSize, self.dwFileFlags = mpq.blocks[block]
+
+  @property
+  def basename(self):
+    return os.path.basename(self.filename)
+
+  @property
+  def dirname(self):
+    return os.path.dirname(self.filename)
+
+  def contents(self):
+    return self.mpq.read(self.filename)
+
+  def extract(self, target=None):
+    return self.mpq.extract(self.filename, target)
+
+  def __repr__(self):
+    return self.filename
+
+  def __str__(self):
+    return self.filename
+
+  def __hash__(self):
+    return hash(self.filename)
+
+  def __eq__(self, other):
+    return str(self) == str(other)
+
+  def __ne__(self, other):
+    return str(self) != str(other)
+
+class MPQReader():
+  def __init__(self, filename, listfile=None):
+    """Open an archive for reading."""
+
+    self.filename = filename
+    self.listfile = listfile
+
+    with open(filename, 'rb') as file:
+      self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    self._read_header()
+    self._read_tables()
+
+  def close(self):
+    """Close the archive."""
+
+    self.data.close()
+    self.data = None
+
+  def _read_header(self):
+    # The header is at a 512 byte boundary, which lets maps prepend
+    # their own header
+    offset = 0
+    size = len(self.data)
+
+    while offset + 32 <= size:
+      magic = self.data[offset:offset + 4]
+
+      if magic == b'MPQ\x1b':
+        # User data, points to the real header
+        header_offset, = struct.unpack_from('<I', self.data, offset + 8)
+        offset += header_offset
+        continue
+
+      if magic == b'MPQ\x1a':
+        break
+
+      offset += 512
+    else:
+      raise MPQReaderError('No archive header found in "%s"' % self.filename)
+
+    (_, format_version, sector_size_shift, hash_table_pos, block_table_pos,
+      hash_table_size, block_table_size) = struct.unpack_from('<IHHIIII', self.data, offset + 8)
+
+    self.offset = offset
+    self.sector_size = 512 << sector_size_shift
+    self.hash_table_pos = hash_table_pos
+    self.block_table_pos = block_table_pos
+    self.hash_table_size = hash_table_size
+    self.block_table_size = block_table_size
+
+    if format_version >= 1 and offset + 44 <= size:
+      hash_table_pos_hi, block_table_pos_hi = struct.unpack_from('<HH', self.data, offset + 40)
+      self.hash_table_pos |= hash_table_pos_hi << 32
+      self.block_table_pos |= block_table_pos_hi << 32
+
+  def _read_table(self, pos, count, key):
+    # Protected archives lie about table sizes, so only read what exists
+    start = self.offset + pos
+    count = min(count, max(len(self.data) - start, 0) // 16)
+    data = decrypt(self.data[start:start + count * 16], hash_string(key, MPQ_HASH_FILE_KEY))
+
+    return [struct.unpack_from('<4I', data, index * 16) for index in range(count)]
+
+  def _read_tables(self):
+    self.hashes = []
+    for name1, name2, locale_platform, block in self._read_table(self.hash_table_pos, self.hash_table_size, '(hash table)'):
+      self.hashes.append((name1, name2, locale_platform & 0xFFFF, block))
+
+    self.blocks = self._read_table(self.block_table_pos, self.block_table_size, '(block table)')
+    self._names = None
+
+  def _find_block(self, path):
+    if not self.hashes:
+      return None
+
+    count = len(self.hashes)
+    mask = count - 1 if count & (count - 1) == 0 else None
+    index = hash_string(path, MPQ_HASH_TABLE_INDEX)
+    index = index & mask if mask is not None else index % count
+    name1 = hash_string(path, MPQ_HASH_NAME_A)
+    name2 = hash_string(path, MPQ_HASH_NAME_B)
+
+    found = None
+    for _ in range(count):
+      entry_name1, entry_name2, locale, block = self.hashes[index]
+      if block == HASH_ENTRY_EMPTY:
+        break
+
+      if (entry_name1 == name1 and entry_name2 == name2 and
+        block != HASH_ENTRY_DELETED and block < len(self.blocks)):
+        if locale == 0:
+          return block
+        if found is None:
+          found = block
+
+      index = (index + 1) % count
+
+    return found
+
+  def _file_block(self, path):
+    if isinstance(path, MPQReaderFile):
+      path = path.filename
+
+    block = self._find_block(path)
+    if block is None:
+      return None
+
+    flags = self.blocks[block][3]
+    if not flags & MPQ_FILE_EXISTS or flags & MPQ_FILE_DELETE_MARKER:
+      return None
+
+    return block
+
+  def _names_from_listfile(self):
+    if self._names is None:
+      names = []
+
+      if self._file_block('(listfile)') is not None:
+        text = self.read('(listfile)').decode('utf-8', 'replace')
+        names.extend(re.split(r'[;\r\n]+', text))
+
+      if self.listfile is not None:
+        with open(self.listfile, 'r', encoding='utf-8', errors='replace') as file:
+          names.extend(file.read().splitlines())
+
+      self._names = [name for name in names if name]
+
+    return self._names
+
+  def find(self, mask='*'):
+    """List all files matching a mask."""
+
+    regex = mask_regex(mask)
+    found = set([])
+
+    for name in self._names_from_listfile():
+      key = name.upper().replace('/', '\\')
+      if key in found or not regex.match(key):
+        continue
+
+      block = self._file_block(name)
+      if block is not None:
+        found.add(key)
+        yield MPQReaderFile(self, name, block)
+
+  def has(self, path):
+    """Does the archive have the file?"""
+
+    return self._file_block(path) is not None
+
+  def read(self, path):
+    """Return a file's contents."""
+
+    if isinstance(path, MPQReaderFile):
+      path = path.filename
+
+    block = self._file_block(path)
+    if block is None:
+      raise MPQReaderError('ERROR_FILE_NOT_FOUND "%s"' % path)
+
+    block_offset, compressed_size, size, flags = self.blocks[block]
+    start = self.offset + block_offset
+
+    key = None
+    if flags & MPQ_FILE_ENCRYPTED:
+      key = hash_string(path.replace('/', '\\').split('\\')[-1], MPQ_HASH_FILE_KEY)
+      if flags & MPQ_FILE_FIX_KEY:
+        key = ((key + block_offset) ^ size) & 0xFFFFFFFF
+
+    is_compressed = flags & (MPQ_FILE_COMPRESS | MPQ_FILE_IMPLODE)
+
+    if flags & MPQ_FILE_SINGLE_UNIT:
+      data = self.data[start:start + compressed_size]
+      if key is not None:
+        data = decrypt(data, key)
+      if is_compressed and compressed_size < size:
+        data = _decompress(data, flags)
+      return data[:size]
+
+    sectors_count = (size + self.sector_size - 1) // self.sector_size
+
+    if is_compressed:
+      # Sector offset table, one more entry than there are sectors
+      count = sectors_count + 1
+      table = self.data[start:start + count * 4]
+      if key is not None:
+        table = decrypt(table, (key - 1) & 0xFFFFFFFF)
+      offsets = struct.unpack('<%dI' % count, table)
+    else:
+      offsets = [min(index * self.sector_size, compressed_size) for index in range(sectors_count + 1)]
+
+    result = []
+    for index in range(sectors_count):
+      sector = self.data[start + offsets[index]:start + offsets[index + 1]]
+      expected = min(self.sector_size, size - index * self.sector_size)
+
+      if key is not None:
+        sector = decrypt(sector, (key + index) & 0xFFFFFFFF)
+      if is_compressed and len(sector) < expected:
+        sector = _decompress(sector, flags)
+
+      result.append(sector)
+
+    return b''.join(result)[:size]
+
+  def extract(self, mpq_path, local_path=None):
+    """Extract a file from the archive."""
+
+    # Handle arguments
+    if isinstance(mpq_path, MPQReaderFile):
+      mpq_path = mpq_path.filename
+
+    if local_path is None:
+      local_path = mpq_path.replace('\\', '/')
+
+    contents = self.read(mpq_path)
+
+    # Create the directories
+    try:
+      os.makedirs(os.path.dirname(local_path))
+    except (FileExistsError, FileNotFoundError):
+      pass
+
+    # Write to the file
+    with open(local_path, 'wb') as file:
+      file.write(contents)
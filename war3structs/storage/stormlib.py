@@ -129,6 +129,7 @@ class StormAddFileFlag(IntFlag):
   MPQ_FILE_COMPRESS        = 0x00000200
   MPQ_FILE_ENCRYPTED       = 0x00010000
   MPQ_FILE_FIX_KEY         = 0x00020000
+  MPQ_FILE_PATCH_FILE      = 0x00100000
   MPQ_FILE_DELETE_MARKER   = 0x02000000
   MPQ_FILE_SECTOR_CRC      = 0x04000000
   MPQ_FILE_SINGLE_UNIT     = 0x01000000
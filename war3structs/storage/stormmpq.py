@@ -9,8 +9,11 @@
 
 import os
 import glob
+import json
 import sys
 
+from contextlib import contextmanager
+
 from ctypes import (
   byref,
   c_void_p,
@@ -26,9 +29,18 @@ from .stormlib import (
   StormCreateArchiveFlag,
   StormAddFileFlag,
   StormCompressFileFlag,
-  StormFile
+  StormFile,
+  StormErrors
 )
 
+def _archive_key(path):
+  """Normalize a path the way the archive compares them"""
+
+  if isinstance(path, StormFile):
+    path = path.filename
+
+  return path.replace('/', '\\').upper()
+
 class MPQFile(StormFile):
   def __init__(self, mpq):
     self.mpq = mpq
@@ -49,6 +61,9 @@ class MPQ():
   def __init__(self, filename, readonly=True):
     """Open or create an archive."""
 
+    self.filename = filename
+    self.patches = []
+    self.patch_index = None
     self.mpq_h = c_void_p()
 
     if os.path.exists(filename):
@@ -63,9 +78,19 @@ class MPQ():
   def close(self):
     """Close the archive."""
 
+    if self.patch_index is not None:
+      self.patch_index.close()
+      self.patch_index = None
+
     Storm.SFileCloseArchive(self.mpq_h)
     self.mpq_h = None
 
+  def _drop_patch_index(self):
+    # The archive or chain changed, so any resolved index is out of date
+    if self.patch_index is not None:
+      self.patch_index.close()
+      self.patch_index = None
+
   def compact(self):
     """Compact the archive.
 
@@ -123,6 +148,12 @@ class MPQ():
     if isinstance(path, StormFile):
       path = path.filename
 
+    # Resolved patch chain
+    if self.patch_index is not None:
+      entry = self.patch_index.lookup(path)
+      if entry is not None:
+        return not entry[1]
+
     return Storm.TrySFileHasFile(self.mpq_h, path.encode('utf-8'))
 
   def read(self, path):
@@ -132,6 +163,12 @@ class MPQ():
     if isinstance(path, StormFile):
       path = path.filename
 
+    # Resolved patch chain, read from the archive supplying the path
+    if self.patch_index is not None:
+      archive = self.patch_index.resolve(path)
+      if archive is not None:
+        return archive.read(self.patch_index.lookup(path)[2])
+
     # Open the file
     file_h = c_void_p()
     Storm.SFileOpenFileEx(self.mpq_h, path.encode('utf-8'), 0, byref(file_h))
@@ -163,6 +200,8 @@ class MPQ():
     if replace:
       flags |= StormAddFileFlag.MPQ_FILE_REPLACEEXISTING
 
+    self._drop_patch_index()
+
     Storm.SFileCreateFile(self.mpq_h, path.encode('utf-8'), 0, size, 0, flags, byref(file_h))
     Storm.SFileWriteFile(file_h, byref(data), size, 0)
     Storm.SFileFinishFile(file_h)
@@ -173,6 +212,7 @@ class MPQ():
     if isinstance(path, StormFile):
       path = path.filename
 
+    self._drop_patch_index()
     Storm.SFileRenameFile(self.mpq_h, path.encode('utf-8'), newpath.encode('utf-8'))
 
   def remove(self, path):
@@ -181,6 +221,7 @@ class MPQ():
     if isinstance(path, StormFile):
       path = path.filename
 
+    self._drop_patch_index()
     Storm.SFileRemoveFile(self.mpq_h, path.encode('utf-8'), 0)
 
   def extract(self, mpq_path, local_path=None):
@@ -216,8 +257,21 @@ class MPQ():
     if replace:
       flags |= StormAddFileFlag.MPQ_FILE_REPLACEEXISTING
 
+    self._drop_patch_index()
     Storm.SFileAddFileEx(self.mpq_h, local_path.encode('utf-8'), mpq_path.encode('utf-8'), flags, 0, 0)
 
+  @contextmanager
+  def batch(self, compact=False):
+    """Collect writes, renames and removes and commit them in one pass.
+
+    The archive is only touched when the block exits without an error,
+    so a failed build leaves the archive as it was. The commit itself is
+    not atomic though, see MPQBatch.
+    """
+    batch = MPQBatch(self)
+    yield batch
+    batch.commit(compact)
+
   def patch(self, path, prefix=''):
     """Add MPQ as patches"""
 
@@ -227,3 +281,270 @@ class MPQ():
     # Add the patches
     for path in path_list:
       Storm.SFileOpenPatchArchive(self.mpq_h, path.encode('utf-8'), prefix.encode('utf-8'), 0)
+      self.patches.append((path, prefix))
+
+    self._drop_patch_index()
+
+  def index_patches(self, cachefile=None):
+    """Resolve the patch chain once so reads skip patch resolution.
+
+    If a cache file is given, the index is loaded from it when it still
+    matches the chain, and written to it otherwise.
+    """
+    chain = [(self.filename, '')] + self.patches
+
+    if self.patch_index is not None:
+      self.patch_index.close()
+
+    index = None
+    if cachefile is not None and os.path.exists(cachefile):
+      index = MPQPatchIndex.load(cachefile, chain)
+
+    if index is None:
+      index = MPQPatchIndex(chain)
+      index.build()
+      if cachefile is not None:
+        index.save(cachefile)
+
+    self.patch_index = index
+
+class MPQBatch():
+  """Pending changes to an archive, see MPQ.batch
+
+  Operations are coalesced per archive path before anything is written:
+  writing a path twice only writes the last payload, and removing a
+  path that was written in the same batch drops the write. Writing a
+  path that was removed in the same batch replaces the file. Paths are
+  compared the way the archive compares them, case-insensitive and with
+  either slash.
+
+  Committing is not atomic: when an operation fails partway through,
+  the ones before it stay applied.
+  """
+  def __init__(self, mpq):
+    self.mpq = mpq
+    self.operations = {}
+    self.renames = []
+
+    # Paths removed in the batch, even if written again since
+    self.removed = set()
+
+  def _replace(self, key, replace):
+    # A write takes the place of a pending remove, which it has to do
+    # itself then
+    return replace or key in self.removed
+
+  def write(self, path, data, compress=True, replace=False):
+    """Queue data to be written to a new file."""
+
+    if isinstance(path, StormFile):
+      path = path.filename
+
+    key = _archive_key(path)
+    self.operations[key] = ('write', path, data, compress, self._replace(key, replace))
+
+  def add(self, local_path, mpq_path=None, compress=True, replace=False):
+    """Queue a local file to be added to the archive."""
+
+    if mpq_path is None:
+      mpq_path = os.path.basename(local_path)
+    elif isinstance(mpq_path, StormFile):
+      mpq_path = mpq_path.filename
+
+    key = _archive_key(mpq_path)
+    self.operations[key] = ('add', mpq_path, local_path, compress, self._replace(key, replace))
+
+  def remove(self, path):
+    """Queue a file to be removed from the archive."""
+
+    if isinstance(path, StormFile):
+      path = path.filename
+
+    key = _archive_key(path)
+    self.operations[key] = ('remove', path)
+    self.removed.add(key)
+
+  def rename(self, path, newpath):
+    """Queue a file to be renamed.
+
+    Renames apply to files already in the archive and run before any
+    queued write, so a write to the old path creates a new file.
+    """
+    if isinstance(path, StormFile):
+      path = path.filename
+
+    self.renames.append((path, newpath))
+
+  def _grow(self):
+    # Count the files that will exist after the commit and resize the
+    # hashtable once instead of letting every insert run into a full
+    # table.
+    existing = set(_archive_key(file.filename) for file in self.mpq.find())
+
+    for path, newpath in self.renames:
+      key = _archive_key(path)
+      if key in existing:
+        existing.discard(key)
+        existing.add(_archive_key(newpath))
+
+    for key, operation in self.operations.items():
+      if operation[0] == 'remove':
+        existing.discard(key)
+      else:
+        existing.add(key)
+
+    needed = len(existing)
+    if needed > self.mpq.getsize():
+      size = 4
+      while size < needed:
+        size *= 2
+      self.mpq.setsize(size)
+
+  def commit(self, compact=False):
+    """Apply all queued changes to the archive.
+
+    Not atomic, an error leaves the operations before it applied.
+    """
+
+    if self.operations or self.renames:
+      self._grow()
+
+    for path, newpath in self.renames:
+      self.mpq.rename(path, newpath)
+
+    for operation in self.operations.values():
+      if operation[0] == 'remove':
+        if self.mpq.has(operation[1]):
+          self.mpq.remove(operation[1])
+
+    for operation in self.operations.values():
+      if operation[0] == 'write':
+        self.mpq.write(*operation[1:])
+      elif operation[0] == 'add':
+        _, mpq_path, local_path, compress, replace = operation
+        self.mpq.add(local_path, mpq_path, compress, replace)
+
+    self.operations = {}
+    self.renames = []
+    self.removed = set()
+
+    if compact:
+      self.mpq.compact()
+
+class MPQPatchIndex():
+  """Resolved overlay of a base archive and its patches
+
+  Records, per path, which archive of the chain supplies the final
+  contents and whether the path was deleted by a patch. Incremental
+  patch files need their base file to be applied, so those paths are
+  left to StormLib's own resolution, or count as deleted when there's
+  no base file.
+
+  Changing the base archive through its MPQ drops the index, since
+  indexed reads don't see the changes.
+  """
+  def __init__(self, chain):
+    self.chain = chain
+    self.entries = {}
+    self.archives = {}
+
+  def _signature(self):
+    signature = []
+    for path, prefix in self.chain:
+      stat = os.stat(path)
+      signature.append([os.path.abspath(path), prefix, stat.st_size, stat.st_mtime])
+
+    return signature
+
+  def build(self):
+    """Index every archive in the chain, later archives win."""
+
+    self.entries = {}
+
+    for index, (path, prefix) in enumerate(self.chain):
+      mpq = MPQ(path)
+      strip = prefix.upper() + '\\' if prefix else ''
+
+      try:
+        for file in mpq.find():
+          name = file.filename
+          key = _archive_key(name)
+
+          if strip:
+            if not key.startswith(strip):
+              continue
+            key = key[len(strip):]
+
+          if file.dwFileFlags & StormAddFileFlag.MPQ_FILE_PATCH_FILE:
+            # An incremental patch without a base file is no file at all
+            base = self.entries.get(key)
+            self.entries[key] = (None, base is None or base[1], name)
+          else:
+            deleted = bool(file.dwFileFlags & StormAddFileFlag.MPQ_FILE_DELETE_MARKER)
+            self.entries[key] = (index, deleted, name)
+      finally:
+        mpq.close()
+
+  def save(self, path):
+    """Write the index to a file."""
+
+    with open(path, 'w') as file:
+      json.dump({
+        'signature': self._signature(),
+        'entries': self.entries
+      }, file)
+
+  @staticmethod
+  def load(path, chain):
+    """Read an index from a file, None if it doesn't match the chain."""
+
+    index = MPQPatchIndex(chain)
+
+    try:
+      with open(path, 'r') as file:
+        data = json.load(file)
+    except (OSError, ValueError):
+      return None
+
+    try:
+      if data['signature'] != index._signature():
+        return None
+    except OSError:
+      return None
+
+    index.entries = dict((key, tuple(entry)) for key, entry in data['entries'].items())
+    return index
+
+  def lookup(self, path):
+    """Get (archive index, deleted, archive path) of a path, if indexed."""
+
+    return self.entries.get(_archive_key(path))
+
+  def resolve(self, path):
+    """Get the unpatched archive supplying a path.
+
+    None is returned when StormLib has to resolve the path itself. A
+    deleted path raises like a read through StormLib would.
+    """
+    entry = self.lookup(path)
+    if entry is None or entry[0] is None:
+      return None
+
+    if entry[1]:
+      error = StormErrors[10005]
+      raise StormError('%s\nPath: %s' % (error, path), error, 10005)
+
+    archive = self.archives.get(entry[0])
+    if archive is None:
+      archive = MPQ(self.chain[entry[0]][0])
+      self.archives[entry[0]] = archive
+
+    return archive
+
+  def close(self):
+    """Close the archives opened for reading."""
+
+    for archive in self.archives.values():
+      archive.close()
+
+    self.archives = {}